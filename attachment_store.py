@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from hashlib import blake2b
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENT_DB_FILE = 'attachments.db'
+MANIFEST_FILE = 'manifest.json'
+BLOB_DIR = '.blobs'
+PART_DIR = '.parts'
+# 分类目录的生成方式：hardlink 在分类目录下创建指向内容文件的硬链接，manifest 只导出清单
+LAYOUTS = ('hardlink', 'manifest')
+
+
+class AttachmentStore:
+    """
+    按内容寻址的附件存储：每个文件以其 SHA-256 摘要保存一份（.blobs/ab/abcdef...），
+    并维护 URL → 摘要 → 友好文件名 的索引。
+
+    不同URL下载到的相同文件只占一份空间；不同文件使用同一个链接标题时自动加摘要前缀区分，不再互相覆盖。
+    原来的 <分类>/<标题>.<后缀> 目录结构以硬链接生成，文件系统不支持硬链接时退化为只在清单中记录。
+    """
+
+    def __init__(self, root: str, layout: str = 'hardlink'):
+        """
+        :param root: 下载目录
+        :param layout: 分类目录的生成方式，见 LAYOUTS
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f'❌ 不支持的附件目录布局: {layout}')
+        self.root = root
+        self.layout = layout
+        self.blob_dir = os.path.join(root, BLOB_DIR)
+        self.part_dir = os.path.join(root, PART_DIR)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.part_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, ATTACHMENT_DB_FILE), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL, '
+                          'name TEXT NOT NULL)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS names (name TEXT PRIMARY KEY, digest TEXT NOT NULL, '
+                          'linked INTEGER NOT NULL)')
+        self.conn.commit()
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+
+    def part_path(self, url: str) -> str:
+        """URL 对应的下载临时文件，路径只由URL决定，中断后可以续传"""
+        return os.path.join(self.part_dir, blake2b(url.encode('utf-8'), digest_size=16).hexdigest() + '.part')
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def get(self, url: str) -> Optional[str]:
+        """URL 已下载时返回其摘要"""
+        with self._lock:
+            row = self.conn.execute('SELECT digest FROM urls WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, url: str, part_path: str, digest: str, size: int, file_name: str, file_ext: str,
+            file_category: str) -> str:
+        """
+        把下载完成的临时文件放入存储，返回分类目录下的相对文件名。
+        相同摘要的内容已经存在时直接删除临时文件
+        """
+        blob_path = self.blob_path(digest)
+        with self._lock:
+            if self.conn.execute('SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone():
+                os.remove(part_path)
+                self.deduplicated += 1
+                self.bytes_saved += size
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(part_path, blob_path)
+                self.conn.execute('INSERT INTO blobs VALUES (?, ?)', (digest, size))
+                self.stored += 1
+            name = self._assign_name(os.path.join(file_category, f'{file_name}.{file_ext}'), digest)
+            self.conn.execute('INSERT OR REPLACE INTO urls VALUES (?, ?, ?)', (url, digest, name))
+            self.conn.commit()
+        return name
+
+    def _assign_name(self, name: str, digest: str) -> str:
+        """为内容分配友好文件名，名字已被其他内容占用时加摘要前缀"""
+        row = self.conn.execute('SELECT digest FROM names WHERE name = ?', (name,)).fetchone()
+        if row is not None and row[0] != digest:
+            stem, ext = os.path.splitext(name)
+            name = f'{stem}-{digest[:8]}{ext}'
+            row = self.conn.execute('SELECT digest FROM names WHERE name = ?', (name,)).fetchone()
+        if row is not None:
+            return name
+        linked = self.layout == 'hardlink' and self._link(self.blob_path(digest), os.path.join(self.root, name))
+        self.conn.execute('INSERT INTO names VALUES (?, ?, ?)', (name, digest, int(linked)))
+        return name
+
+    @staticmethod
+    def _link(blob_path: str, link_path: str) -> bool:
+        os.makedirs(os.path.dirname(link_path), exist_ok=True)
+        tmp_path = link_path + '.tmp'
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            os.link(blob_path, tmp_path)
+            # 旧版本下载的同名文件直接替换
+            os.replace(tmp_path, link_path)
+            return True
+        except OSError as e:
+            logger.warning(f'⚠️ 无法创建硬链接，仅记录到清单: {link_path} - {e}')
+            return False
+
+    def export_manifest(self) -> str:
+        """导出清单：每个URL对应的摘要、大小、友好文件名和内容文件路径"""
+        with self._lock:
+            rows = self.conn.execute('SELECT urls.url, urls.digest, blobs.size, urls.name, names.linked FROM urls '
+                                     'JOIN blobs ON blobs.digest = urls.digest '
+                                     'LEFT JOIN names ON names.name = urls.name ORDER BY urls.name').fetchall()
+        manifest = [{
+            'url': url,
+            'digest': digest,
+            'size': size,
+            'name': name,
+            'linked': bool(linked),
+            'blob': os.path.relpath(self.blob_path(digest), self.root),
+        } for url, digest, size, name, linked in rows]
+        path = os.path.join(self.root, MANIFEST_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+        return path
+
+    def stats(self) -> Dict[str, int]:
+        """本次运行新增的内容文件数、因内容相同而省去的文件数和字节数"""
+        return {'stored': self.stored, 'deduplicated': self.deduplicated, 'bytes_saved': self.bytes_saved}
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
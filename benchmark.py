@@ -0,0 +1,254 @@
+"""
+抓取性能基准：在本机的合成站点（synthetic_site）上运行 md_crawl 和 get_domains.crawl_domain，
+报告吞吐（页/秒）、页面抓取耗时的 p50/p99、峰值内存和每页CPU时间，并与保存的基线比较，不访问外网。
+
+用法:
+    python benchmark.py                  运行全部场景并与基线比较，有指标退化时退出码为 1
+    python benchmark.py save             运行全部场景并保存为新的基线
+    python benchmark.py md_crawl,domain  只运行指定的场景，可与 save 同时使用
+
+站点在独立进程中运行，每个场景的爬取也在单独 fork 的子进程中进行，峰值内存和CPU时间只统计爬虫本身
+（包括 Markdown 转换进程），不包括站点。基线与机器有关，换机器后需要重新保存。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+from typing import Any, Dict, List
+
+from crawler import Config, md_crawl
+from get_domains import crawl_domain
+from metrics import crawl_metrics
+from synthetic_site import SiteProcess, SyntheticResolver
+
+BASELINE_FILE = 'benchmark_baseline.json'
+# 每个场景运行的次数，取吞吐居中的一次，减少偶然波动
+REPEATS = 3
+# 指标比基线差超过该比例时视为退化
+TOLERANCE = 0.15
+# 指标及其方向：True 表示越大越好
+COMPARED_METRICS = {
+    'pages_per_second': True,
+    'fetch_p50_ms': False,
+    'fetch_p99_ms': False,
+    'peak_rss_mb': False,
+    'cpu_ms_per_page': False,
+}
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    # 单主机，带表格、附件和少量出错页面，覆盖抓取、解析、转换和附件下载的完整流程
+    'md_crawl': {
+        'target': 'md_crawl',
+        'site': {'hosts': 1, 'pages_per_host': 400, 'paragraphs': 8, 'tables': 2, 'attachments_per_page': 1,
+                 'attachment_count': 20, 'latency': 0.005, 'error_rate': 0.02},
+        'config': {'concurrency': 32, 'host_concurrency': 16},
+    },
+    # 大页面：正文和表格占主要开销
+    'md_crawl_large_pages': {
+        'target': 'md_crawl',
+        'site': {'hosts': 1, 'pages_per_host': 150, 'paragraphs': 80, 'tables': 12, 'latency': 0.005},
+        'config': {'concurrency': 32, 'host_concurrency': 16},
+    },
+    # 多主机：按主机调度和跨主机链接
+    'md_crawl_multi_host': {
+        'target': 'md_crawl',
+        'site': {'hosts': 4, 'pages_per_host': 150, 'latency': 0.01},
+        'config': {'concurrency': 64, 'host_concurrency': 8, 'is_domain_match': False},
+    },
+    # 子域名发现：bench.test 下的多个子域名
+    'domain': {
+        'target': 'crawl_domain',
+        'site': {'hosts': 40, 'pages_per_host': 20, 'cross_host_links': 4, 'latency': 0.005, 'error_rate': 0.02,
+                 'domain': 'bench.test'},
+        'config': {'max_level': 3, 'domain_parts_count': 2},
+    },
+}
+
+
+def _run_md_crawl(base_urls: List[str], options: Dict[str, Any], work_dir: str) -> int:
+    """运行 md_crawl，返回生成的 Markdown 文件数"""
+    config = Config(base_url=base_urls[0]).get_config()
+    config.update({
+        'base_dir': work_dir,
+        'base_md_dir': os.path.join(work_dir, 'markdown'),
+        'output_json': os.path.join(work_dir, 'record_json_file.json'),
+        'file_download_dir': os.path.join(work_dir, 'download'),
+        'is_base_path_match': False,
+        'max_depth': 10 ** 6,
+        'sleep_time': 0,
+        'respect_robots': False,
+        'metrics_snapshot': False,
+        'is_debug': False,
+    })
+    config.update(options)
+    md_crawl(config)
+    markdown_dir = config['base_md_dir']
+    return len(os.listdir(markdown_dir)) if os.path.isdir(markdown_dir) else 0
+
+
+def _run_crawl_domain(base_urls: List[str], options: Dict[str, Any], work_dir: str, domain: str) -> int:
+    """运行 crawl_domain，返回发现的子域名数"""
+
+    async def run():
+        # 解析器需要在事件循环中创建
+        return await crawl_domain(base_urls[0], dir_name=work_dir, resolver=SyntheticResolver(domain), **options)
+
+    return len(asyncio.run(run()))
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _measure(scenario: Dict[str, Any], base_urls: List[str], conn) -> None:
+    """在子进程中运行一个场景，把测量结果发回父进程"""
+    # 场景中故意注入了出错页面，不输出抓取日志
+    logging.disable(logging.ERROR)
+    work_dir = tempfile.mkdtemp(prefix='benchmark-')
+    try:
+        crawl_metrics.reset()
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        if scenario['target'] == 'crawl_domain':
+            output = _run_crawl_domain(base_urls, scenario['config'], work_dir, scenario['site']['domain'])
+        else:
+            output = _run_md_crawl(base_urls, scenario['config'], work_dir)
+        elapsed = time.perf_counter() - start
+        cpu = _cpu_seconds() - cpu_start
+        snapshot = crawl_metrics.snapshot()
+        pages = snapshot['counters'].get('pages', 0)
+        fetch = snapshot['stages'].get('fetch', {})
+        # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                       resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * rss_unit
+        conn.send({
+            'pages': pages,
+            'output': output,
+            'elapsed': round(elapsed, 3),
+            'pages_per_second': round(pages / elapsed, 2) if elapsed else 0.0,
+            'fetch_p50_ms': round(fetch.get('p50', 0.0) * 1000, 3),
+            'fetch_p99_ms': round(fetch.get('p99', 0.0) * 1000, 3),
+            'peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+            'cpu_seconds': round(cpu, 3),
+            'cpu_ms_per_page': round(cpu * 1000 / pages, 3) if pages else 0.0,
+            'statuses': snapshot['statuses'],
+        })
+    except Exception:
+        conn.send({'error': traceback.format_exc()})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        conn.close()
+
+
+def run_scenario(name: str, repeats: int = REPEATS) -> Dict[str, Any]:
+    """启动场景的合成站点，运行 repeats 次，返回吞吐居中的一次结果"""
+    scenario = SCENARIOS[name]
+    context = multiprocessing.get_context('fork') \
+        if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+    runs = []
+    with SiteProcess(**scenario['site']) as base_urls:
+        for _ in range(repeats):
+            conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(target=_measure, args=(scenario, base_urls, child_conn))
+            process.start()
+            child_conn.close()
+            try:
+                result = conn.recv()
+            except EOFError:
+                result = {'error': 'benchmark process exited without a result'}
+            process.join()
+            if 'error' in result:
+                raise RuntimeError(f'❌ 基准场景 {name} 失败:\n{result["error"]}')
+            runs.append(result)
+    runs.sort(key=lambda run: run['pages_per_second'])
+    return runs[len(runs) // 2]
+
+
+def environment() -> Dict[str, Any]:
+    """记录在基线中的运行环境，便于判断结果是否可比"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]]) -> None:
+    """保存基线，未运行的场景保留原有基线"""
+    baseline = load_baseline(path)
+    baseline['environment'] = environment()
+    baseline.setdefault('scenarios', {}).update(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any],
+            tolerance: float = TOLERANCE) -> List[str]:
+    """与基线逐项比较，返回退化的指标描述"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            print(f'{name}: 没有基线')
+            continue
+        print(f'{name}:')
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = reference.get(metric), result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = '  ⚠️ 退化' if worse > tolerance else ''
+            print(f'  {metric:<18}{old:>12}{new:>12}{change:>+10.1%}{flag}')
+            if flag:
+                regressions.append(f'{name}.{metric}: {old} -> {new} ({change:+.1%})')
+    return regressions
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    save = 'save' in args
+    names = [name for arg in args if arg != 'save' for name in arg.split(',')] or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f'❌ 未知的场景: {unknown}，可选: {list(SCENARIOS)}')
+
+    results = {}
+    for name in names:
+        results[name] = run_scenario(name)
+        result = results[name]
+        print(f'{name:<22}页面 {result["pages"]:>5}  输出 {result["output"]:>5}  {result["pages_per_second"]:>8.1f} 页/秒  '
+              f'p50 {result["fetch_p50_ms"]:>7.2f}ms  p99 {result["fetch_p99_ms"]:>7.2f}ms  '
+              f'峰值内存 {result["peak_rss_mb"]:>6.1f}MB  CPU {result["cpu_ms_per_page"]:>6.2f}ms/页')
+
+    baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE)
+    if save:
+        save_baseline(baseline_path, results)
+        print(f'💾 基线已保存: {baseline_path}')
+        sys.exit(0)
+    baseline = load_baseline(baseline_path)
+    if baseline.get('environment', {}).get('cpu_count') not in (None, os.cpu_count()):
+        print(f'⚠️ 基线的CPU数为 {baseline["environment"]["cpu_count"]}，与本机不同，结果可能不可比')
+    regressions = compare(results, baseline)
+    if regressions:
+        print('❌ 性能退化:\n' + '\n'.join(regressions))
+        sys.exit(1)
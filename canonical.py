@@ -0,0 +1,207 @@
+import re
+import string
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# 确定不影响页面内容的跟踪参数和会话参数，匹配时忽略大小写，utm_ 开头的参数总是去掉；
+# sid、timestamp、_t 等参数在有的站点上决定页面内容，需要时通过 host_denylist_params 按主机开启
+DEFAULT_DENYLIST_PARAMS = {
+    'utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'gclid', 'fbclid', 'jsessionid',
+}
+DEFAULT_INDEX_FILES = {
+    'index.html', 'index.htm', 'index.shtml', 'index.php', 'index.jsp', 'index.asp', 'index.aspx',
+    'default.htm', 'default.html', 'default.asp', 'default.aspx',
+}
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+PERCENT_RE = re.compile(r'%([0-9A-Fa-f]{2})')
+# Java 等容器把会话ID放在路径参数里，如 /list.jsp;jsessionid=ABC
+SESSION_PATH_PARAM_RE = re.compile(r';jsessionid=[^/?#]*', re.IGNORECASE)
+
+
+def _normalize_percent(component: str) -> str:
+    """百分号编码统一为大写十六进制，编码过的非保留字符直接解码"""
+    def repl(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else '%' + match.group(1).upper()
+    return PERCENT_RE.sub(repl, component)
+
+
+def _remove_dot_segments(path: str) -> str:
+    """按 RFC 3986 5.2.4 去掉路径中的 . 和 .. 段"""
+    if '.' not in path:
+        return path
+    output = []
+    for segment in path.split('/'):
+        if segment == '..':
+            if len(output) > 1:
+                output.pop()
+        elif segment != '.':
+            output.append(segment)
+    if path.endswith(('/.', '/..')):
+        output.append('')
+    return '/'.join(output)
+
+
+class UrlCanonicalizer:
+    """
+    URL规范化：同一页面的不同写法归一成一个URL，作为链接提取、抓取边界和 UrlManager 的去重键；
+    规范形式只用于判重，实际请求的仍是页面中的原始URL。
+
+    规则基于 RFC 3986：协议和主机名小写、去掉默认端口、统一百分号编码、去掉点段、去掉片段；
+    另外去掉跟踪/会话参数（可按主机配置）、对查询参数排序、去掉 index.html 等默认文档名和末尾斜杠。
+    非 ASCII 字符保持原样，以免改变按路径生成的文件名。重定向后的最终URL通过 add_alias 记录为别名。
+    """
+
+    def __init__(self, denylist_params: Optional[Iterable[str]] = None,
+                 host_denylist_params: Optional[Dict[str, Iterable[str]]] = None,
+                 strip_index_files: bool = True, strip_trailing_slash: bool = True, sort_query: bool = True):
+        """
+        :param denylist_params: 所有主机都去掉的查询参数，默认 DEFAULT_DENYLIST_PARAMS
+        :param host_denylist_params: 按主机追加要去掉的查询参数，如 {'www.nepu.edu.cn': ['wbtreeid']}
+        :param strip_index_files: 是否去掉 index.html 等默认文档名
+        :param strip_trailing_slash: 是否去掉非根路径的末尾斜杠
+        :param sort_query: 是否按参数名对查询参数排序
+        """
+        params = DEFAULT_DENYLIST_PARAMS if denylist_params is None else denylist_params
+        self.denylist_params = {param.lower() for param in params}
+        self.host_denylist_params = {host.lower(): {param.lower() for param in host_params}
+                                     for host, host_params in (host_denylist_params or {}).items()}
+        self.strip_index_files = strip_index_files
+        self.strip_trailing_slash = strip_trailing_slash
+        self.sort_query = sort_query
+        self.aliases: Dict[str, str] = {}
+        # 以下统计由去重处调用 observe 更新，按不同的URL计数，同一个链接出现多少次都只算一次
+        self.rule_counts = Counter()
+        self.total = 0
+        self.collapsed = 0
+        # 见过的非规范写法，以及规范写法本身尚未出现过的规范形式；规范写法的URL不单独保存
+        self._spellings = set()
+        self._unspelled = set()
+        self._lock = threading.Lock()
+
+    def canonicalize(self, url: str) -> str:
+        """返回URL的规范形式，非 http/https 或无法解析的URL原样返回"""
+        try:
+            canonical, rules = self._canonicalize(url)
+        except ValueError:
+            return url
+        return self.aliases.get(canonical, canonical)
+
+    def observe(self, url: str, canonical: str, present: bool) -> None:
+        """
+        在去重处调用，统计被归并的重复写法：present 表示 canonical 在调用前已经存在。
+        只有第一次出现的写法、且它的规范形式已经存在时才计为 collapsed
+        """
+        with self._lock:
+            if url != canonical:
+                if url in self._spellings:
+                    return
+                self._spellings.add(url)
+                if not present:
+                    self._unspelled.add(canonical)
+            elif canonical in self._unspelled:
+                self._unspelled.discard(canonical)
+            elif present:
+                return
+            self.total += 1
+            if not present:
+                return
+            self.collapsed += 1
+        if url == canonical:
+            return
+        try:
+            _, rules = self._canonicalize(url)
+        except ValueError:
+            return
+        with self._lock:
+            self.rule_counts.update(rules or ['alias'])
+
+    def _canonicalize(self, url: str):
+        rules = []
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        if scheme not in DEFAULT_PORTS:
+            return url, rules
+        if parts.scheme != scheme or (parts.hostname and parts.hostname not in parts.netloc):
+            rules.append('case')
+
+        host = (parts.hostname or '').rstrip('.')
+        if ':' in host:
+            host = f'[{host}]'
+        port = parts.port
+        if port == DEFAULT_PORTS[scheme] or (port is None and parts.netloc.endswith(':')):
+            rules.append('default_port')
+            port = None
+        netloc = host if port is None else f'{host}:{port}'
+        if parts.username is not None:
+            userinfo = parts.netloc.rsplit('@', 1)[0]
+            netloc = f'{userinfo}@{netloc}'
+
+        path = _normalize_percent(parts.path)
+        if path != parts.path:
+            rules.append('percent_encoding')
+        stripped = SESSION_PATH_PARAM_RE.sub('', path)
+        if stripped != path:
+            rules.append('session_id')
+            path = stripped
+        normalized = _remove_dot_segments(path)
+        if normalized != path:
+            rules.append('dot_segments')
+            path = normalized
+        if not path:
+            path = '/'
+        if self.strip_index_files:
+            head, _, last = path.rpartition('/')
+            if last.lower() in DEFAULT_INDEX_FILES:
+                rules.append('index_file')
+                path = head + '/'
+        if self.strip_trailing_slash and len(path) > 1 and path.endswith('/'):
+            rules.append('trailing_slash')
+            path = path.rstrip('/') or '/'
+
+        query = self._canonical_query(parts.query, host, rules)
+        if parts.fragment:
+            rules.append('fragment')
+        return urlunsplit((scheme, netloc, path, query, '')), rules
+
+    def _canonical_query(self, query: str, host: str, rules: list) -> str:
+        if not query:
+            return ''
+        denylist = self.denylist_params | self.host_denylist_params.get(host, set())
+        pairs = []
+        for pair in query.split('&'):
+            if not pair:
+                continue
+            key = pair.split('=', 1)[0]
+            if key.lower() in denylist or key.lower().startswith('utm_'):
+                rules.append('tracking_param')
+                continue
+            pairs.append(_normalize_percent(pair))
+        if self.sort_query:
+            sorted_pairs = sorted(pairs, key=lambda p: p.split('=', 1)[0])
+            if sorted_pairs != pairs:
+                rules.append('query_order')
+            pairs = sorted_pairs
+        return '&'.join(pairs)
+
+    def add_alias(self, url: str, final_url: str) -> str:
+        """记录重定向：请求的URL与最终URL是同一个页面，之后两者都规范化为最终URL，返回最终URL的规范形式"""
+        try:
+            source, _ = self._canonicalize(url)
+            target, _ = self._canonicalize(final_url)
+        except ValueError:
+            return url
+        if source != target:
+            with self._lock:
+                self.aliases[source] = target
+        return target
+
+    def stats(self) -> Dict[str, int]:
+        """规范化统计：去重处见过的不同URL数、其中被归并到已有页面的重复写法数、别名数及归并时各规则的命中次数"""
+        with self._lock:
+            stats = {'total': self.total, 'collapsed': self.collapsed, 'aliases': len(self.aliases)}
+            stats.update(self.rule_counts)
+            return stats
@@ -0,0 +1,157 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from custom_markdown_convert import html2md
+from metrics import crawl_metrics
+from writer import BatchWriter, write_markdown
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 8
+# 未攒满的批次最多等待的秒数，之后也会发给工作进程
+BATCH_DELAY = 0.5
+# 每个工作进程最多排队的批次数，超过后提交方阻塞，形成背压
+MAX_PENDING_BATCHES_PER_WORKER = 2
+
+# (Markdown 文件路径, HTML, 页面URL, html2md 选项)
+ConvertJob = Tuple[str, str, Optional[str], Dict[str, Any]]
+
+
+def convert_batch(jobs: List[ConvertJob]) -> List[Tuple[str, Optional[str], Optional[str], float]]:
+    """在工作进程中运行：把一批HTML转换为Markdown，返回 (文件路径, Markdown, 错误信息, 转换耗时)"""
+    results = []
+    for file_path, html, current_url, options in jobs:
+        start = time.perf_counter()
+        try:
+            results.append((file_path, html2md(html, current_url, **options), None, time.perf_counter() - start))
+        except Exception as e:
+            results.append((file_path, None, repr(e), time.perf_counter() - start))
+    return results
+
+
+class ConvertPool:
+    """
+    HTML→Markdown 转换进程池：markdownify 是纯 Python 的 CPU 密集型工作，放在解析线程里会被 GIL 限制在一个核上。
+
+    解析线程提交 HTML 后立即返回，任务按批发送给工作进程以摊薄进程间通信的开销，
+    转换结果（Markdown）回到本进程后写入文件，或交给 writer 在后台批量写入。排队的批次达到上限时提交方阻塞，抓取随之放慢。
+    """
+
+    def __init__(self, workers: int, batch_size: int = BATCH_SIZE, batch_delay: float = BATCH_DELAY,
+                 max_pending_batches: Optional[int] = None, writer: Optional[BatchWriter] = None):
+        """
+        :param workers: 工作进程数
+        :param batch_size: 每批的页面数
+        :param batch_delay: 未攒满的批次最多等待的秒数
+        :param max_pending_batches: 已提交未完成的批次上限，默认每个工作进程 MAX_PENDING_BATCHES_PER_WORKER 个
+        :param writer: 后台写入器，传入时结果交给 writer 写入，转换失败的页面也通知 writer 已完成
+        """
+        # 用 fork 启动，工作进程不会重新导入调用方的主模块。这里一次性创建所有进程，调用方应在启动写入线程、
+        # 解析线程池等后台线程之前创建进程池；日志的 QueueListener 由 log_setup 在 fork 后的子进程中重新启动
+        context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        self._executor.submit(int).result()
+        self.batch_size = batch_size
+        self.writer = writer
+        self.batch_delay = batch_delay
+        self._slots = threading.BoundedSemaphore(max_pending_batches or workers * MAX_PENDING_BATCHES_PER_WORKER)
+        self._lock = threading.Lock()
+        self._batch: List[ConvertJob] = []
+        self._batch_started = 0.0
+        self._pending = 0
+        self.submitted = 0
+        self.converted = 0
+        self.failed = 0
+        self.blocked_time = 0.0
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name='convert-pool-flusher', daemon=True)
+        self._flusher.start()
+
+    def submit(self, file_path: str, html: str, current_url: Optional[str], options: Dict[str, Any]) -> None:
+        """提交一个转换任务，结果写入 file_path；排队已满时阻塞"""
+        with self._lock:
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append((file_path, html, current_url, options))
+            self.submitted += 1
+            if len(self._batch) < self.batch_size:
+                return
+            batch, self._batch = self._batch, []
+        self._dispatch(batch)
+
+    def _dispatch(self, batch: List[ConvertJob]) -> None:
+        start = time.monotonic()
+        self._slots.acquire()
+        future = self._executor.submit(convert_batch, batch)
+        with self._lock:
+            self.blocked_time += time.monotonic() - start
+            self._pending += 1
+        future.add_done_callback(lambda done: self._on_done(done, batch))
+
+    def _on_done(self, future: concurrent.futures.Future, batch: List[ConvertJob]) -> None:
+        self._slots.release()
+        try:
+            results = future.result()
+        except Exception as e:
+            # 工作进程异常退出等情况，整批记为失败
+            results = [(file_path, None, repr(e), 0.0) for file_path, _, _, _ in batch]
+        converted = failed = 0
+        for (_, _, current_url, _), (file_path, markdown, error, seconds) in zip(batch, results):
+            crawl_metrics.observe('html2md', seconds)
+            if error is not None:
+                failed += 1
+                logger.error('❌ Markdown转换失败: %s: %s', file_path, error, extra={'event': 'convert_error'})
+                if self.writer is not None and current_url is not None:
+                    self.writer.mark_done(current_url, failed=True)
+                continue
+            if self.writer is not None:
+                self.writer.write_markdown(file_path, markdown, current_url)
+                converted += 1
+                continue
+            try:
+                write_markdown(file_path, markdown)
+                converted += 1
+            except OSError as e:
+                failed += 1
+                logger.error('❌ Markdown写入失败: %s: %s', file_path, e, extra={'event': 'convert_error'})
+        with self._lock:
+            self._pending -= 1
+            self.converted += converted
+            self.failed += failed
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.batch_delay / 2):
+            with self._lock:
+                if not self._batch or time.monotonic() - self._batch_started < self.batch_delay:
+                    continue
+                batch, self._batch = self._batch, []
+            self._dispatch(batch)
+
+    def flush(self) -> None:
+        """立即发送未攒满的批次"""
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self._dispatch(batch)
+
+    def stats(self) -> Dict[str, float]:
+        """已提交、已转换（交给 writer 时为已交给 writer）、失败的页面数，排队中的批次数和提交方因背压累计阻塞的秒数"""
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'converted': self.converted,
+                'failed': self.failed,
+                'pending_batches': self._pending,
+                'blocked_seconds': round(self.blocked_time, 3),
+            }
+
+    def close(self) -> None:
+        """发送剩余任务，等待全部转换和写入完成后关闭工作进程"""
+        self._closed.set()
+        self._flusher.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
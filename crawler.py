@@ -1,125 +1,395 @@
 import asyncio
 import concurrent.futures
+import functools
 import logging
 import os
-import queue
-from typing import List, Union, Dict, Any
+from typing import Callable, List, Union, Dict, Any, Optional, Tuple
+from urllib.parse import urldefrag
 
-from bs4 import BeautifulSoup
+import aiohttp
 
-from extract_links import extract_links
-from file_handlers import fetch_page, extract_content, extract_common_file_urls, record_page_info, download_files, \
-    save_content, extract_url_title_name
+from attachment_store import AttachmentStore
+from canonical import UrlCanonicalizer
+from convert_pool import ConvertPool
+from extract_links import LinkFilter, extract_links
+from file_handlers import extract_content, extract_common_file_urls, record_page_info, \
+    save_content, extract_url_title_name, async_fetch_page, create_async_session, decode_page, FetchResult
+from downloader import Downloader, DOWNLOAD_CONCURRENCY, MAX_FILE_SIZE, MAX_DOWNLOAD_TIME
+from fingerprint import FingerprintSet
+from frontier import Frontier
+from html_parser import DEFAULT_PARSER, parse_html
+from http_cache import HttpCache, CacheEntry, HTTP_CACHE_FILE, body_digest
+from liveness import LivenessChecker, LIVENESS_CACHE_FILE
+from log_setup import LOG_FILE, LOG_JSON_FILE, setup_logging
+from metrics import MetricsReporter, crawl_metrics, METRICS_FILE, METRICS_INTERVAL
+from near_dup import NearDupIndex, NEAR_DUP_FILE
+from packed_store import PackedStore, SHARD_SIZE
+from record_log import export_records
+from scheduler import HostScheduler, get_host
 from urlmanager import UrlManager
+from writer import BatchWriter, BATCH_SIZE as WRITER_BATCH_SIZE, FLUSH_INTERVAL as WRITER_FLUSH_INTERVAL
 
 logger = logging.getLogger(__name__)
 
-# 定义日志文件路径
-log_file_path = 'crawler_log.log'
-
-# 配置日志记录器
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file_path),
-        logging.StreamHandler()
-    ]
-)
-
-
-def process_page(url: str, base_url: str, base_md_dir: str, target_area_content_tags: Union[str, List[str]],
-                 md_with_links: bool, url_manager: UrlManager, target_area_links_tags=None,
-                 is_domain_match=None, is_base_path_match=None, output_json_file: str = None,
-                 file_download_dir: str = None, exclude_image_urls: bool = True, **kwargs) -> List[str]:
-    """处理页面，提取内容和链接"""
-    if url in url_manager.already_crawled:
-        logger.debug(f'🔁 已爬取: {url}')
-        return []
-    page_content = fetch_page(url)
-    if not page_content:
-        logger.info(f'❌ 没有发现内容: {url}')
-        with open("space_urls.txt", "a") as f:
-            f.write(url + '\n')
+DEFAULT_CONCURRENCY = 64
+DEFAULT_HOST_CONCURRENCY = 2
+# Markdown 转换进程数，0 表示在解析线程中直接转换
+DEFAULT_CONVERT_WORKERS = os.cpu_count() or 1
+# 没有抓取到内容的URL
+SPACE_URLS_FILE = 'space_urls.txt'
+
+
+def process_page(url: str, fetched: Optional[FetchResult], base_url: str, base_md_dir: str,
+                 target_area_content_tags: Union[str, List[str]], md_with_links: bool, url_manager: UrlManager,
+                 target_area_links_tags=None, is_domain_match=None, is_base_path_match=None,
+                 output_json_file: str = None, downloader: Optional[Downloader] = None,
+                 exclude_image_urls: bool = True, html_parser: str = DEFAULT_PARSER,
+                 host_content_rules: Optional[Dict[str, List[str]]] = None,
+                 convert_pool: Optional[ConvertPool] = None, link_filter: Optional[LinkFilter] = None,
+                 http_cache: Optional[HttpCache] = None, cache_entry: Optional[CacheEntry] = None,
+                 near_dup: Optional[NearDupIndex] = None, skip_duplicate_links: bool = False,
+                 writer: Optional[BatchWriter] = None, is_known: Optional[Callable[[str], bool]] = None,
+                 **kwargs) -> List[str]:
+    """
+    处理已抓取的页面，提取内容和链接。运行在解析线程池中，不占用事件循环。
+    重爬模式下内容哈希与缓存一致时跳过解析和写文件，直接返回缓存的子链接；
+    正文与已保存页面近似重复时不转换、不写文件，skip_duplicate_links 为 True 时也不再展开其链接；
+    传入 writer 时Markdown、页面记录和空页面列表交给后台写入线程，页面的输出全部写入后才标记为已爬取；
+    is_known 判断重定向的最终URL是否已经爬取或正在写入，默认只查 url_manager.already_crawled
+    """
+    mark_crawled = writer.mark_done if writer is not None else url_manager.mark_crawled
+    if not fetched:
+        logger.info('❌ 没有发现内容: %s', url, extra={'event': 'no_content', 'url': url})
+        if writer is not None:
+            writer.append_line(SPACE_URLS_FILE, url)
+        else:
+            with open(SPACE_URLS_FILE, "a") as f:
+                f.write(url + '\n')
         return []
-    soup = BeautifulSoup(page_content, 'html.parser')
-    for script in soup(['script', 'style']):
-        script.decompose()
-    content = extract_content(soup, target_area_content_tags)
+    if writer is not None:
+        writer.begin(url)
+    canonicalizer = url_manager.canonicalizer
+    if canonicalizer and fetched.final_url != url:
+        # 重定向后的最终URL记为别名，其他页面再链接到它时不会重复抓取；比较的是两者的规范形式
+        url_key = canonicalizer.canonicalize(url)
+        final_url = canonicalizer.add_alias(url, fetched.final_url)
+        if final_url != url_key:
+            if (is_known or url_manager.already_crawled.__contains__)(final_url):
+                logger.debug('🔁 重定向到已爬取页面: %s -> %s', url, final_url)
+                mark_crawled(url)
+                return []
+            if final_url in url_manager.already_crawled:
+                # 重爬时最终URL上次已爬取、本次还没有重新爬取：交给抓取边界按它自己的URL重新请求
+                logger.debug('🔁 重定向到待重爬页面: %s -> %s', url, final_url)
+                mark_crawled(url)
+                return [urldefrag(fetched.final_url)[0]]
+            if writer is not None:
+                # 最终URL与本页面的输出一起写入后才标记为已爬取
+                writer.claim(url, final_url)
+            else:
+                url_manager.already_crawled.add(final_url)
+    if http_cache is not None:
+        body_hash = body_digest(fetched.body)
+        if cache_entry is not None and cache_entry.body_hash == body_hash:
+            logger.debug('♻️ 内容未变化: %s', url)
+            http_cache.record_hit()
+            mark_crawled(url)
+            return cache_entry.links
+    with crawl_metrics.stage('decode'):
+        page_content = decode_page(fetched.body, fetched.charset)
+    with crawl_metrics.stage('parse'):
+        document = parse_html(page_content, html_parser)
+        document.strip_tags(['script', 'style'])
+    content_selectors = (host_content_rules or {}).get(get_host(url)) or target_area_content_tags
+    with crawl_metrics.stage('extract_content'):
+        content = extract_content(document, content_selectors)
 
-    file_name = extract_url_title_name(url, soup)
+    file_name = extract_url_title_name(url, document)
     if "404" in file_name:
-        logger.info(f'🚫 页面不存在: {url}')
-        url_manager.already_crawled.add(url)
+        logger.info('🚫 页面不存在: %s', url, extra={'event': 'not_found', 'url': url})
+        mark_crawled(url)
         return []
     file_path = os.path.join(base_md_dir.rstrip("/"), f'{file_name}.md')
-    save_content(file_path, content, [] if md_with_links else ['a'])
-    url_manager.already_crawled.add(url)
-    extracted_links = extract_links(soup, base_url, target_area_links_tags, is_domain_match, is_base_path_match,
-                                    exclude_image_urls)
-    common_file_links = extract_common_file_urls(extracted_links)
+    duplicate = None
+    if near_dup is not None:
+        with crawl_metrics.stage('near_dup'):
+            duplicate = near_dup.check(url, content, file_path)
+    if duplicate is not None:
+        logger.info('👯 近似重复页面: %s ≈ %s（距离 %d）', url, duplicate.url, duplicate.distance,
+                    extra={'event': 'near_duplicate', 'url': url})
+        crawl_metrics.inc('near_duplicates')
+        file_path = duplicate.file_path
+    if duplicate is not None and skip_duplicate_links:
+        new_entry = CacheEntry(fetched.etag, fetched.last_modified, body_hash, [], file_path) \
+            if http_cache is not None else None
+        if new_entry is not None and writer is not None:
+            writer.attach(url, functools.partial(http_cache.store, url, new_entry))
+        record_page_info(url, file_path, {}, output_json_file, duplicate_of=duplicate.url, writer=writer)
+        mark_crawled(url)
+        if new_entry is not None:
+            http_cache.record_miss()
+            if writer is None:
+                http_cache.store(url, new_entry)
+        return []
+    with crawl_metrics.stage('extract_links'):
+        extracted_links = extract_links(document, base_url, target_area_links_tags, is_domain_match,
+                                        is_base_path_match, exclude_image_urls, canonicalizer=canonicalizer,
+                                        page_url=fetched.final_url, link_filter=link_filter)
+        common_file_links = extract_common_file_urls(extracted_links)
     common_file_record = {link: title for link, title in common_file_links}
-    record_page_info(url, file_path, common_file_record, output_json_file)
-
-    download_files(common_file_links, file_download_dir, url_manager.already_downloaded)
-    for link, _ in common_file_links:
-        url_manager.already_downloaded.add(link)
-
-    common_file_urls = [link for link, _ in common_file_links]
-    extracted_urls = [link for link, _ in extracted_links]
-    filtered_links = list(filter(lambda x: x not in common_file_urls, extracted_urls))
-    url_manager.uncrawled_urls.update(filtered_links)
-    return filtered_links if filtered_links else []
-
-
-async def async_worker(q: queue.Queue, config: Dict[str, Any], url_manager: UrlManager) -> None:
-    """异步工作线程"""
-    while not q.empty():
-        depth, url = q.get()
-        # if depth > config['max_depth']:
-        #     continue
-        child_urls = await asyncio.to_thread(process_page, url=url, base_url=config['base_url'],
-                                             base_md_dir=config['base_md_dir'],
-                                             target_area_content_tags=config['target_area_content_tags'],
-                                             md_with_links=config['md_with_links'],
-                                             url_manager=url_manager,
-                                             target_area_links_tags=config['target_area_links_tags'],
-                                             is_domain_match=config['is_domain_match'],
-                                             is_base_path_match=config['is_base_path_match'],
-                                             output_json_file=config['output_json'],
-                                             file_download_dir=config['file_download_dir'],
-                                             exclude_image_urls=config['exclude_image_urls'])
-        for child_url in child_urls:
-            q.put((depth + 1, child_url))
-        await asyncio.sleep(config.get('sleep_time', 0.05))
-    url_manager.save_state()
-
-
-def run_worker(q: queue.Queue, config: Dict[str, Any], url_manager: UrlManager):
-    """运行工作线程"""
-    asyncio.run(async_worker(q, config, url_manager))
-
-
-def initialize_logging(is_debug: bool):
-    """初始化日志"""
-    logging.basicConfig(level=logging.DEBUG if is_debug else logging.INFO)
-    logger.debug('🐞 调试模式启用' if is_debug else '🚀 启动爬虫')
+    common_file_urls = {link for link, _ in common_file_links}
+    filtered_links = [link for link, _ in extracted_links if link not in common_file_urls]
+    new_entry = CacheEntry(fetched.etag, fetched.last_modified, body_hash, filtered_links, file_path) \
+        if http_cache is not None else None
+    if new_entry is not None and writer is not None:
+        # 缓存条目在页面输出写入后才保存，否则中途退出后重爬会因 304 跳过一个没有输出的页面
+        writer.attach(url, functools.partial(http_cache.store, url, new_entry))
+    with crawl_metrics.stage('record'):
+        record_page_info(url, file_path, common_file_record, output_json_file,
+                         duplicate_of=duplicate.url if duplicate is not None else None, writer=writer)
+    # 先提交页面记录再提交Markdown：写入线程按顺序写入，Markdown写入后页面的全部输出都已写入
+    saved = duplicate is None and save_content(file_path, content, [] if md_with_links else ['a'], current_url=url,
+                                               parser=html_parser, convert_pool=convert_pool, writer=writer)
+    if not saved or writer is None:
+        mark_crawled(url)
 
+    if new_entry is not None:
+        http_cache.record_miss()
+        if writer is None:
+            http_cache.store(url, new_entry)
 
-def start_crawl_threads(q: queue.Queue, config: Dict[str, Any], url_manager: UrlManager):
-    """启动爬虫线程"""
-    with concurrent.futures.ThreadPoolExecutor(max_workers=config['num_threads']) as executor:
-        tasks = [executor.submit(run_worker, q, config, url_manager) for _ in range(config['num_threads'])]
-        for task in concurrent.futures.as_completed(tasks):
-            task.result()
+    if downloader is not None:
+        downloader.submit(common_file_links)
+    return filtered_links
 
 
-def md_crawl(config: Dict[str, Any]) -> None:
-    """Markdown爬虫主函数"""
+async def async_worker(frontier: Frontier, session: aiohttp.ClientSession, executor: concurrent.futures.Executor,
+                       config: Dict[str, Any], url_manager: UrlManager, http_cache: Optional[HttpCache] = None,
+                       downloader: Optional[Downloader] = None, convert_pool: Optional[ConvertPool] = None,
+                       link_filter: Optional[LinkFilter] = None, liveness: Optional[LivenessChecker] = None,
+                       near_dup: Optional[NearDupIndex] = None, writer: Optional[BatchWriter] = None,
+                       is_known: Optional[Callable[[str], bool]] = None) -> None:
+    """
+    异步工作协程，网络请求在事件循环中完成，解析和写文件交给线程池；请求间隔由调度器按主机控制。
+    重爬模式下发送条件请求，304 时不进入解析线程池。开启可访问性检查时，新发现的链接所在主机不可访问则不入队。
+    只有抓取边界为空且没有在途抓取时才退出
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await frontier.get()
+        if item is None:
+            break
+        depth, url = item
+        try:
+            if config.get('respect_robots', True):
+                await frontier.scheduler.ensure_robots(session, url)
+                if not frontier.scheduler.can_fetch(url):
+                    # 记为已处理，续爬时不再取出；和 304 一样经由写入线程标记，分布式模式下同样汇报给协调器
+                    logger.info('🤖 robots.txt 禁止抓取: %s', url, extra={'event': 'robots_disallowed', 'url': url})
+                    crawl_metrics.inc('pages_disallowed')
+                    if writer is not None:
+                        writer.begin(url)
+                        await loop.run_in_executor(executor, writer.mark_done, url)
+                    else:
+                        url_manager.mark_crawled(url)
+                    continue
+            cache_entry = http_cache.get(url) if http_cache is not None else None
+            with crawl_metrics.stage('fetch'):
+                fetched = await async_fetch_page(session, url, HttpCache.conditional_headers(cache_entry))
+            crawl_metrics.inc('pages')
+            if fetched is not None and fetched.status == 304 and cache_entry is not None:
+                logger.debug('♻️ 304 未修改: %s', url)
+                crawl_metrics.inc('pages_not_modified')
+                http_cache.record_hit()
+                if writer is not None:
+                    # 先登记，重定向到该页面的其他URL在它标记为已爬取前也能识别；
+                    # 写入队列满时 mark_done 会阻塞，不能在事件循环里调用
+                    writer.begin(url)
+                    await loop.run_in_executor(executor, writer.mark_done, url)
+                else:
+                    url_manager.mark_crawled(url)
+                child_urls = cache_entry.links
+            else:
+                child_urls = await loop.run_in_executor(executor, functools.partial(
+                    process_page, url=url, fetched=fetched, base_url=config['base_url'],
+                    base_md_dir=config['base_md_dir'],
+                    target_area_content_tags=config['target_area_content_tags'],
+                    md_with_links=config['md_with_links'],
+                    url_manager=url_manager,
+                    target_area_links_tags=config['target_area_links_tags'],
+                    is_domain_match=config['is_domain_match'],
+                    is_base_path_match=config['is_base_path_match'],
+                    output_json_file=config['output_json'],
+                    downloader=downloader,
+                    html_parser=config.get('html_parser', DEFAULT_PARSER),
+                    host_content_rules=config.get('host_content_rules'),
+                    convert_pool=convert_pool,
+                    link_filter=link_filter,
+                    exclude_image_urls=config['exclude_image_urls'],
+                    http_cache=http_cache, cache_entry=cache_entry, near_dup=near_dup,
+                    skip_duplicate_links=config.get('skip_duplicate_links', False),
+                    writer=writer, is_known=is_known))
+            if liveness is not None:
+                new_urls = [child_url for child_url in child_urls if not frontier.is_seen(child_url)]
+                alive = await liveness.check_many(session, new_urls, hosts_only=True)
+                child_urls = [child_url for child_url in new_urls if alive[child_url]]
+            for child_url in child_urls:
+                if frontier.put(child_url, depth + 1):
+                    url_manager.uncrawled_urls.add(child_url, depth + 1)
+        except Exception as e:
+            crawl_metrics.inc('page_errors')
+            logger.error('❌ 处理页面失败: %s: %s', url, e, extra={'event': 'page_error', 'url': url})
+            if writer is not None and writer.is_pending(url):
+                # process_page 已登记但中途失败，结束登记，否则该页面一直停留在写入中
+                try:
+                    await loop.run_in_executor(executor, functools.partial(writer.mark_done, url, failed=True))
+                except RuntimeError as e:
+                    logger.error('❌ 结束页面登记失败: %s: %s', url, e)
+        finally:
+            frontier.task_done(url)
+
+
+def create_scheduler(config: Dict[str, Any]) -> HostScheduler:
+    """按配置创建主机调度器"""
+    return HostScheduler(default_delay=config.get('sleep_time', 0.05),
+                         default_concurrency=config.get('host_concurrency', DEFAULT_HOST_CONCURRENCY),
+                         host_limits=config.get('host_limits'))
+
+
+async def async_crawl(seeds: List[Tuple[int, str]], config: Dict[str, Any], url_manager: UrlManager,
+                      frontier: Optional[Frontier] = None) -> None:
+    """
+    单事件循环驱动所有抓取：concurrency 个协程共享一个 aiohttp 会话，
+    num_threads 只决定解析线程池的大小，每个主机的请求间隔和并发由 HostScheduler 控制，
+    深度限制、去重和结束判断由 Frontier 负责；分布式模式下由调用方传入与协调器通信的 frontier
+    """
+    # 转换进程用 fork 启动，要在写入线程、指标线程和解析线程池启动前创建，子进程不会继承到持有锁的线程
+    convert_workers = config.get('convert_workers', DEFAULT_CONVERT_WORKERS)
+    convert_pool = ConvertPool(convert_workers) if convert_workers > 0 else None
+    output_store = PackedStore(config['base_md_dir'], shard_size=config.get('packed_shard_size', SHARD_SIZE)) \
+        if config.get('output_backend', 'files') == 'packed' else None
+    canonicalize = url_manager.canonicalizer.canonicalize
+    # 重爬时上次已爬取的页面都要重新请求，只在本次运行内去重
+    refreshed = set() if config.get('recrawl') else None
+
+    def on_durable(url: str) -> None:
+        url_manager.mark_crawled(url)
+        if refreshed is not None:
+            refreshed.add(canonicalize(url))
+        frontier.mark_durable(url)
+
+    # 页面的输出由写入线程批量写入，写入后才在 url_manager 中标记为已爬取
+    writer = BatchWriter(on_durable, store=output_store,
+                         batch_size=config.get('writer_batch_size', WRITER_BATCH_SIZE),
+                         flush_interval=config.get('writer_flush_interval', WRITER_FLUSH_INTERVAL),
+                         fsync=config.get('writer_fsync', False), key=canonicalize)
+    if convert_pool is not None:
+        convert_pool.writer = writer
+
+    def is_known(url: str) -> bool:
+        """已爬取（重爬时为本次运行已重新爬取），或已开始处理、输出还在写入中"""
+        if writer.is_pending(url):
+            return True
+        if refreshed is not None:
+            return canonicalize(url) in refreshed
+        return url in url_manager.already_crawled
+
+    if frontier is None:
+        seen = FingerprintSet() if config.get('dedup_backend', 'set') == 'fingerprint' else None
+        frontier = Frontier(create_scheduler(config), max_depth=config['max_depth'], is_known=is_known, seen=seen,
+                            key=canonicalize, observe=url_manager.canonicalizer.observe)
+    for depth, url in seeds:
+        if frontier.put(url, depth):
+            url_manager.uncrawled_urls.add(url, depth)
+    concurrency = config.get('concurrency', DEFAULT_CONCURRENCY)
+    http_cache = HttpCache(set_file_path(HTTP_CACHE_FILE, config.get('base_dir', 'INFO')), key=canonicalize) \
+        if config.get('recrawl') else None
+    # 检查请求经由抓取的调度器发出，与页面请求共用每个主机的请求间隔
+    liveness = LivenessChecker(set_file_path(LIVENESS_CACHE_FILE, config.get('base_dir', 'INFO')),
+                               scheduler=frontier.scheduler, respect_robots=config.get('respect_robots', True)) \
+        if config.get('check_liveness') else None
+    near_dup_threshold = config.get('near_dup_threshold')
+    near_dup = NearDupIndex(near_dup_threshold, set_file_path(NEAR_DUP_FILE, config.get('base_dir', 'INFO')),
+                            load=config['continue_crawl'] or config.get('recrawl', False)) \
+        if near_dup_threshold is not None else None
+    attachment_store = AttachmentStore(config['file_download_dir'], layout=config.get('attachment_layout', 'hardlink'))
+    link_filter = LinkFilter(config['base_url'], config['is_domain_match'], config['is_base_path_match'],
+                             config['exclude_image_urls'], url_manager.canonicalizer)
+    crawl_metrics.reset()
+    crawl_metrics.register_gauge('queue_depth', lambda: frontier.queue_depth)
+    crawl_metrics.register_gauge('in_flight', lambda: frontier.in_flight)
+    crawl_metrics.register_gauge('writer_pending', lambda: writer.pending)
+    if convert_pool is not None:
+        crawl_metrics.register_gauge('convert_pending_batches', lambda: convert_pool.stats()['pending_batches'])
+    reporter = MetricsReporter(crawl_metrics,
+                               snapshot_path=set_file_path(METRICS_FILE, config.get('base_dir', 'INFO'))
+                               if config.get('metrics_snapshot', True) else None,
+                               interval=config.get('metrics_interval', METRICS_INTERVAL),
+                               port=config.get('metrics_port'))
+    try:
+        async with create_async_session(concurrency) as session:
+            await reporter.start()
+            downloader = Downloader(session, attachment_store, url_manager.already_downloaded,
+                                    concurrency=config.get('download_concurrency', DOWNLOAD_CONCURRENCY),
+                                    max_size=config.get('max_file_size', MAX_FILE_SIZE),
+                                    max_time=config.get('max_download_time', MAX_DOWNLOAD_TIME),
+                                    scheduler=frontier.scheduler, respect_robots=config.get('respect_robots', True))
+            crawl_metrics.register_gauge('downloads_active', lambda: downloader.active)
+            crawl_metrics.register_gauge('downloads_queued', lambda: downloader.stats()['queued'])
+            with concurrent.futures.ThreadPoolExecutor(max_workers=config['num_threads']) as executor:
+                await asyncio.gather(*[async_worker(frontier, session, executor, config, url_manager, http_cache,
+                                                    downloader, convert_pool, link_filter, liveness,
+                                                    near_dup, writer, is_known)
+                                       for _ in range(concurrency)])
+            # 页面抓取不等待附件，全部页面处理完后再等剩余的下载
+            await downloader.join()
+            logger.info(f'📥 下载统计: {downloader.stats()}')
+    finally:
+        if convert_pool is not None:
+            convert_pool.close()
+            logger.info(f'📝 Markdown转换统计: {convert_pool.stats()}')
+        writer.close()
+        logger.info(f'💾 批量写入统计: {writer.stats()}')
+        if output_store is not None:
+            logger.info(f'📦 打包存储统计: {output_store.stats()}')
+            output_store.close()
+        await reporter.stop()
+        attachment_store.export_manifest()
+        logger.info(f'🗃️ 附件存储统计: {attachment_store.stats()}')
+        attachment_store.close()
+        if http_cache is not None:
+            logger.info(f'♻️ 重爬缓存统计: {http_cache.stats()}')
+            http_cache.close()
+        if liveness is not None:
+            logger.info(f'🩺 可访问性检查统计: {liveness.stats()}')
+            liveness.save()
+        if near_dup is not None:
+            logger.info(f'👯 近似重复统计: {near_dup.stats()}')
+            near_dup.save()
+    logger.info(f'📊 抓取边界统计: {frontier.stats()}')
+
+
+def initialize_logging(config: Dict[str, Any]) -> None:
+    """初始化日志：文本日志写入 BASE_DIR/crawler_log.log，log_json 为 True 时另写 JSONL"""
+    is_debug = config.get('is_debug', False)
+    base_dir = config.get('base_dir', 'INFO')
+    setup_logging(level=logging.DEBUG if is_debug else logging.INFO,
+                  log_file=set_file_path(LOG_FILE, base_dir),
+                  json_file=set_file_path(LOG_JSON_FILE, base_dir) if config.get('log_json') else None,
+                  sample_rates=config.get('log_sample_rates'),
+                  rate_limits=config.get('log_rate_limits'),
+                  log_links=config.get('log_links', False))
+    logger.debug('🐞 调试模式启用' if is_debug else '🚀 启动爬虫')
+
+
+def check_config(config: Dict[str, Any]) -> None:
+    """检查并规范化抓取配置：校验匹配规则，把逗号分隔的标签字符串转为列表，创建Markdown目录"""
     if config['is_domain_match'] is False and config['is_base_path_match'] is True:
         raise ValueError('❌ 如果设置为路径匹配，域名匹配必须为True')
     if not config['base_url']:
         raise ValueError('❌ 基础URL是必须的')
+    if config.get('output_backend', 'files') not in ('files', 'packed'):
+        raise ValueError(f'❌ 不支持的输出方式: {config["output_backend"]}')
     if isinstance(config['target_area_links_tags'], str):
         config['target_area_links_tags'] = config['target_area_links_tags'].split(',') if ',' in config[
             'target_area_links_tags'] else [config['target_area_links_tags']]
@@ -127,22 +397,44 @@ def md_crawl(config: Dict[str, Any]) -> None:
         config['target_area_content_tags'] = config['target_area_content_tags'].split(',') if ',' in config[
             'target_area_content_tags'] else [config['target_area_content_tags']]
     if not os.path.exists(config['base_md_dir']):
-        os.makedirs(config['base_md_dir'])
+        os.makedirs(config['base_md_dir'], exist_ok=True)
 
-    initialize_logging(config['is_debug'])
-    logger.info(f'🕸️ 爬取 {config["base_url"]} 深度 ⏬ {config["max_depth"]} 线程 🧵 {config["num_threads"]}')
-    url_manager = UrlManager(base_dir=config.get("base_dir", "INFO"), continue_crawl=config['continue_crawl'])
-    q = queue.Queue()
 
+def create_url_manager(config: Dict[str, Any]) -> UrlManager:
+    """按配置创建URL规范化器和URL状态管理器"""
+    canonicalizer = UrlCanonicalizer(host_denylist_params=config.get('host_denylist_params'))
+    return UrlManager(base_dir=config.get("base_dir", "INFO"), continue_crawl=config['continue_crawl'],
+                      use_fingerprints=config.get('dedup_backend', 'set') == 'fingerprint',
+                      canonicalizer=canonicalizer)
+
+
+def get_seeds(config: Dict[str, Any], url_manager: UrlManager) -> List[Tuple[int, str]]:
+    """续爬时从保存的待爬URL继续，否则从基础URL开始；重爬时总是包含基础URL，整个站点重新请求一遍"""
+    base_seed = (0, config['base_url'])
     if config['continue_crawl'] and url_manager.uncrawled_urls:
-        for url in url_manager.uncrawled_urls:
-            q.put((0, url))
-    else:
-        q.put((0, config['base_url']))
+        seeds = [(depth, url) for url, depth in url_manager.uncrawled_urls.items()]
+        return [base_seed] + seeds if config.get('recrawl') else seeds
+    return [base_seed]
+
+
+def md_crawl(config: Dict[str, Any]) -> None:
+    """Markdown爬虫主函数"""
+    check_config(config)
+    initialize_logging(config)
+    logger.info(f'🕸️ 爬取 {config["base_url"]} 深度 ⏬ {config["max_depth"]} '
+                f'并发 🔀 {config.get("concurrency", DEFAULT_CONCURRENCY)} 解析线程 🧵 {config["num_threads"]} '
+                f'转换进程 ⚙️ {config.get("convert_workers", DEFAULT_CONVERT_WORKERS)}')
+    url_manager = create_url_manager(config)
+    seeds = get_seeds(config, url_manager)
 
-    start_crawl_threads(q, config, url_manager)
-    url_manager.save_state()
-    logger.info('🏁 所有线程已完成')
+    try:
+        asyncio.run(async_crawl(seeds, config, url_manager))
+    finally:
+        url_manager.close()
+        export_records(config['output_json'])
+    logger.info(f'🧹 URL规范化统计: {url_manager.canonicalizer.stats()}')
+    logger.info(f'📈 抓取指标汇总:\n{crawl_metrics.summary()}')
+    logger.info('🏁 所有抓取任务已完成')
 
 
 def set_file_path(filename: str, dir_name: str) -> str:
@@ -159,14 +451,64 @@ class Config:
         self.DEFAULT_BASE_MD_PATH = set_file_path('markdown', self.BASE_DIR)
         self.DEFAULT_MAX_DEPTH = 10
         self.DEFAULT_NUM_THREADS = 2
+        self.DEFAULT_CONCURRENCY = DEFAULT_CONCURRENCY
+        self.DEFAULT_CONVERT_WORKERS = DEFAULT_CONVERT_WORKERS
         self.DEFAULT_TARGET_AREA_CONTENT_TAGS = ['article', 'div', 'main', 'p']
+        # 按主机指定正文区域，支持CSS选择器，如 {'www.nepu.edu.cn': ['div.v_news_content', '#vsb_content']}
+        self.HOST_CONTENT_RULES = {}
         self.DEFAULT_TARGET_AREA_LINKS_TAGS = ['body']
+        # HTML解析后端：'lxml'、'selectolax' 或 'html.parser'，未安装时退回 html.parser
+        self.DEFAULT_HTML_PARSER = DEFAULT_PARSER
         self.DEFAULT_DOMAIN_MATCH = True
         self.DEFAULT_BASE_PATH_MATCH = True
         self.DEFAULT_FILE_DOWNLOAD_DIR = set_file_path("download", self.BASE_DIR)
+        # 附件下载的并发数、单文件大小上限（字节）和时间上限（秒）
+        self.DEFAULT_DOWNLOAD_CONCURRENCY = DOWNLOAD_CONCURRENCY
+        self.MAX_FILE_SIZE = MAX_FILE_SIZE
+        self.MAX_DOWNLOAD_TIME = MAX_DOWNLOAD_TIME
+        # 附件按内容存放，分类目录以硬链接生成（'hardlink'），或只导出 manifest.json（'manifest'）
+        self.ATTACHMENT_LAYOUT = 'hardlink'
         self.DEFAULT_RECORD_JSON_DIR = set_file_path("record_json_file.json", self.BASE_DIR)
         self.CONTINUE_CRAWL = False
+        # 同一主机两次请求的间隔，robots.txt 中有 Crawl-delay 时以其为准
         self.SLEEP_TIME = 0.05
+        self.DEFAULT_HOST_CONCURRENCY = DEFAULT_HOST_CONCURRENCY
+        # 按主机覆盖限制，如 {'www.nepu.edu.cn': {'delay': 1.0, 'concurrency': 4}}
+        self.HOST_LIMITS = {}
+        # 遵守 robots.txt：Crawl-delay 作为主机的请求间隔，Disallow 的页面和附件不抓取
+        self.RESPECT_ROBOTS = True
+        # URL去重方式：'set' 保存完整URL，'fingerprint' 只保存64位指纹，适合千万级URL
+        self.DEDUP_BACKEND = 'set'
+        # 按主机追加判重时忽略的查询参数，如 {'www.nepu.edu.cn': ['wbtreeid', 'sid', '_t']}；默认只忽略 utm_*、gclid 等跟踪参数
+        self.HOST_DENYLIST_PARAMS = {}
+        # 增量重爬：发送条件请求，未变化的页面跳过解析、转换和写文件
+        self.RECRAWL = False
+        # 入队前检查新链接所在主机是否可访问，结果缓存在 BASE_DIR 下
+        self.CHECK_LIVENESS = False
+        # 正文 SimHash 的汉明距离不超过该值的页面视为近似重复，不转换、不写文件；None 表示不判重
+        self.NEAR_DUP_THRESHOLD = None
+        # 近似重复页面是否也不再展开链接
+        self.SKIP_DUPLICATE_LINKS = False
+        # 定期把抓取指标写到 BASE_DIR/metrics.json；METRICS_PORT 不为 None 时在本机该端口提供 /metrics
+        self.METRICS_SNAPSHOT = True
+        self.METRICS_INTERVAL = METRICS_INTERVAL
+        self.METRICS_PORT = None
+        # 调试日志、JSONL 日志和每个页面的完整链接列表默认关闭；
+        # 采样比例和限速以事件名为键，如 {'page_saved': 0.1}、{'fetch_error': 5}，限速为 None 时使用默认值
+        self.IS_DEBUG = False
+        self.LOG_JSON = False
+        self.LOG_LINKS = False
+        self.LOG_SAMPLE_RATES = {}
+        self.LOG_RATE_LIMITS = None
+        # Markdown输出方式：'files' 每页一个 .md 文件；'packed' 追加到 DEFAULT_BASE_MD_PATH 下按URL索引的压缩分片，
+        # 可用 python packed_store.py export 导出为每页一个文件
+        self.OUTPUT_BACKEND = 'files'
+        self.PACKED_SHARD_SIZE = SHARD_SIZE
+        # Markdown、页面记录和断点续爬状态由一个后台线程批量写入：攒够 WRITER_BATCH_SIZE 个写操作
+        # 或等待 WRITER_FLUSH_INTERVAL 秒后写入一批；WRITER_FSYNC 为 True 时每批写完后 fsync
+        self.WRITER_BATCH_SIZE = WRITER_BATCH_SIZE
+        self.WRITER_FLUSH_INTERVAL = WRITER_FLUSH_INTERVAL
+        self.WRITER_FSYNC = False
 
     def get_config(self):
         return {
@@ -175,17 +517,46 @@ class Config:
             "base_md_dir": self.DEFAULT_BASE_MD_PATH,
             "max_depth": self.DEFAULT_MAX_DEPTH,
             "num_threads": self.DEFAULT_NUM_THREADS,
+            "concurrency": self.DEFAULT_CONCURRENCY,
+            "convert_workers": self.DEFAULT_CONVERT_WORKERS,
             "target_area_content_tags": self.DEFAULT_TARGET_AREA_CONTENT_TAGS,
+            "host_content_rules": self.HOST_CONTENT_RULES,
             "md_with_links": False,
             "target_area_links_tags": self.DEFAULT_TARGET_AREA_LINKS_TAGS,
+            "html_parser": self.DEFAULT_HTML_PARSER,
             "is_domain_match": self.DEFAULT_DOMAIN_MATCH,
             "is_base_path_match": self.DEFAULT_BASE_PATH_MATCH,
             "output_json": self.DEFAULT_RECORD_JSON_DIR,
             "file_download_dir": self.DEFAULT_FILE_DOWNLOAD_DIR,
+            "download_concurrency": self.DEFAULT_DOWNLOAD_CONCURRENCY,
+            "max_file_size": self.MAX_FILE_SIZE,
+            "max_download_time": self.MAX_DOWNLOAD_TIME,
+            "attachment_layout": self.ATTACHMENT_LAYOUT,
             "exclude_image_urls": True,
-            "is_debug": True,
+            "is_debug": self.IS_DEBUG,
             "continue_crawl": self.CONTINUE_CRAWL,
-            "sleep_time": self.SLEEP_TIME
+            "sleep_time": self.SLEEP_TIME,
+            "host_concurrency": self.DEFAULT_HOST_CONCURRENCY,
+            "host_limits": self.HOST_LIMITS,
+            "respect_robots": self.RESPECT_ROBOTS,
+            "dedup_backend": self.DEDUP_BACKEND,
+            "host_denylist_params": self.HOST_DENYLIST_PARAMS,
+            "recrawl": self.RECRAWL,
+            "check_liveness": self.CHECK_LIVENESS,
+            "near_dup_threshold": self.NEAR_DUP_THRESHOLD,
+            "skip_duplicate_links": self.SKIP_DUPLICATE_LINKS,
+            "metrics_snapshot": self.METRICS_SNAPSHOT,
+            "metrics_interval": self.METRICS_INTERVAL,
+            "metrics_port": self.METRICS_PORT,
+            "log_json": self.LOG_JSON,
+            "log_links": self.LOG_LINKS,
+            "log_sample_rates": self.LOG_SAMPLE_RATES,
+            "log_rate_limits": self.LOG_RATE_LIMITS,
+            "output_backend": self.OUTPUT_BACKEND,
+            "packed_shard_size": self.PACKED_SHARD_SIZE,
+            "writer_batch_size": self.WRITER_BATCH_SIZE,
+            "writer_flush_interval": self.WRITER_FLUSH_INTERVAL,
+            "writer_fsync": self.WRITER_FSYNC
         }
 
 
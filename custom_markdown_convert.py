@@ -1,7 +1,45 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString
+from bs4.dammit import EntitySubstitution
 from urllib.parse import urlparse, urljoin
 from markdownify import MarkdownConverter, abstract_inline_conversion, chomp
 
+from html_parser import soup_features
+
+# 合并单元格的表格输出为 HTML 时只保留这两个属性
+MERGED_CELL_ATTRS = ('colspan', 'rowspan')
+# 与 markdownify 一致：这些标签内只含空白的文本节点（首尾或与这些标签相邻）不输出
+NESTED_TAGS = {'ol', 'ul', 'li', 'table', 'thead', 'tbody', 'tfoot', 'tr', 'td', 'th'}
+
+
+def _is_merged_cell(tag) -> bool:
+    return tag.name in ('td', 'th') and any(attr in tag.attrs for attr in MERGED_CELL_ATTRS)
+
+
+def _is_nested_node(el) -> bool:
+    return getattr(el, 'name', None) in NESTED_TAGS
+
+
+def _table_html(node, parts: list) -> None:
+    """一次遍历输出去掉多余属性的 HTML"""
+    attrs = ''.join(f' {key}={EntitySubstitution.quoted_attribute_value(EntitySubstitution.substitute_xml(value))}'
+                    for key, value in node.attrs.items() if key in MERGED_CELL_ATTRS)
+    if node.is_empty_element:
+        parts.append(f'<{node.name}{attrs}/>')
+        return
+    parts.append(f'<{node.name}{attrs}>')
+    children = node.contents
+    nested = node.name in NESTED_TAGS
+    last = len(children) - 1
+    for i, child in enumerate(children):
+        if isinstance(child, NavigableString):
+            if (nested and not child.strip()
+                    and (i == 0 or i == last or _is_nested_node(children[i - 1]) or _is_nested_node(children[i + 1]))):
+                continue
+            parts.append(child.output_ready(formatter='minimal'))
+        else:
+            _table_html(child, parts)
+    parts.append(f'</{node.name}>')
+
 
 class CustomMarkdownConverter(MarkdownConverter):
     def __init__(self, current_url, **kwargs):
@@ -9,6 +47,11 @@ class CustomMarkdownConverter(MarkdownConverter):
         self.current_url = current_url
         self.convert_to_absolute = kwargs.get('convert_to_absolute', False)
 
+    def convert(self, html):
+        # parser 选项决定 BeautifulSoup 使用的解析器，默认 html.parser；选择 lxml 或 selectolax 时使用 lxml（未安装时退回 html.parser）
+        soup = BeautifulSoup(html, soup_features(self.options.get('parser')))
+        return self.convert_soup(soup)
+
     def convert_img(self, element, text, convert_as_inline):
         alt_text = element.attrs.get('alt', '') or ''
         src_url = element.attrs.get('src', '') or ''
@@ -28,22 +71,15 @@ class CustomMarkdownConverter(MarkdownConverter):
 
         return f'![{alt_text}]({src_url}{title_part})'
 
-    def _process_table_element(self, element):
-        soup = BeautifulSoup(str(element), 'html.parser')
-        for tag in soup.find_all(True):
-            attrs_to_keep = ['colspan', 'rowspan']
-            tag.attrs = {key: value for key, value in tag.attrs.items() if key in attrs_to_keep}
-        return str(soup)
-
-    def convert_table(self, element, text, convert_as_inline):
-        soup = BeautifulSoup(str(element), 'html.parser')
-        has_colspan_or_rowspan = any(
-            tag.has_attr('colspan') or tag.has_attr('rowspan') for tag in soup.find_all(['td', 'th']))
-
-        if has_colspan_or_rowspan:
-            return self._process_table_element(element)
-        else:
-            return super().convert_table(element, text, convert_as_inline)
+    def process_tag(self, node, convert_as_inline, children_only=False):
+        # 含合并单元格的表格无法用 Markdown 表示，直接在原节点上输出精简后的 HTML，
+        # 不再先转换其子节点，也不再序列化后重新解析
+        if (node.name == 'table' and not children_only and self.should_convert_tag('table')
+                and node.find(_is_merged_cell) is not None):
+            parts = []
+            _table_html(node, parts)
+            return ''.join(parts)
+        return super().process_tag(node, convert_as_inline, children_only)
 
     def convert_a(self, element, text, convert_as_inline):
         prefix, suffix, text = chomp(text)
@@ -79,29 +115,86 @@ def html2md(html_content, current_url, **options):
     return CustomMarkdownConverter(**options).convert(html_content)
 
 
-# 示例用法
-html_content = """
-<html>
-<body>
-<img src="/path/to/image.jpg" alt="示例图片">
-<a href="/path/to/page">示例链接</a>
-<table>
-    <tr>
-        <td colspan="2">Cell with colspan</td>
-    </tr>
-    <tr>
-        <td>Cell 1</td>
-        <td>Cell 2</td>
-    </tr>
-</table>
-</body>
-</html>
-"""
-
-# 假设这是当前页面的完整 URL
-current_url = "https://example.com/some/page.html"
-
-# 将 HTML 转换为 Markdown
-markdown_content = html2md(html_content, current_url=current_url, convert_to_absolute=True)
-
-print(markdown_content)
+if __name__ == "__main__":
+    # 示例用法
+    html_content = """
+    <html>
+    <body>
+    <img src="/path/to/image.jpg" alt="示例图片">
+    <a href="/path/to/page">示例链接</a>
+    <table>
+        <tr>
+            <td colspan="2">Cell with colspan</td>
+        </tr>
+        <tr>
+            <td>Cell 1</td>
+            <td>Cell 2</td>
+        </tr>
+    </table>
+    </body>
+    </html>
+    """
+
+    # 假设这是当前页面的完整 URL
+    current_url = "https://example.com/some/page.html"
+
+    # 将 HTML 转换为 Markdown
+    markdown_content = html2md(html_content, current_url=current_url, convert_to_absolute=True)
+
+    print(markdown_content)
+
+    # 表格回归语料：与原来“序列化后重新解析”的实现逐一对比输出，并比较耗时
+    import time
+
+    class LegacyTableConverter(CustomMarkdownConverter):
+        def process_tag(self, node, convert_as_inline, children_only=False):
+            return MarkdownConverter.process_tag(self, node, convert_as_inline, children_only)
+
+        def _process_table_element(self, element):
+            soup = BeautifulSoup(str(element), 'html.parser')
+            for tag in soup.find_all(True):
+                tag.attrs = {key: value for key, value in tag.attrs.items() if key in MERGED_CELL_ATTRS}
+            return str(soup)
+
+        def convert_table(self, element, text, convert_as_inline):
+            soup = BeautifulSoup(str(element), 'html.parser')
+            if any(tag.has_attr('colspan') or tag.has_attr('rowspan') for tag in soup.find_all(['td', 'th'])):
+                return self._process_table_element(element)
+            return super().convert_table(element, text, convert_as_inline)
+
+    table_corpus = [
+        '<table><tr><th>课程</th><th>学分</th></tr><tr><td>高等数学</td><td>5</td></tr></table>',
+        '<table class="t" border="1"><tr><td colspan="2" style="width:50%">通知</td></tr>'
+        '<tr><td>1</td><td>2</td></tr></table>',
+        """<table width="100%">
+            <thead>
+                <tr><th rowspan="2">序号</th><th colspan="2">成绩</th></tr>
+                <tr><th>平时</th><th>期末</th></tr>
+            </thead>
+            <tbody>
+                <tr> <td>1</td> <td>90</td> <td>85</td> </tr>
+            </tbody>
+        </table>""",
+        '<table><tr><td rowspan="3"><a href="/a?x=1&amp;y=2" title="t">链接</a><br/><img src="a.png"/></td>'
+        '<td>A &lt; B &amp; C</td></tr><tr><td><!-- 注释 -->x</td></tr><tr><td>\xa0</td></tr></table>',
+        '<table><tr><td><table><tr><td colspan="2">内层</td></tr></table></td><td>外层</td></tr></table>',
+        '<table><tr><td><ul>\n<li>一</li>\n<li>二</li>\n</ul></td><td colspan="1"> <p>段落 <b>加粗</b></p> </td></tr>'
+        '</table>',
+        '<div><p>前文</p><table>\n<tr>\n<td colspan="3">合并</td>\n</tr>\n</table><p>后文</p></div>',
+        '<table><caption>标题</caption><tr><td headers="h" colspan="x">非数字</td></tr></table>',
+    ]
+    for parser in ('html.parser', 'lxml'):
+        for index, table_html in enumerate(table_corpus):
+            expected = LegacyTableConverter(current_url=None, parser=parser).convert(table_html)
+            actual = CustomMarkdownConverter(current_url=None, parser=parser).convert(table_html)
+            print(f'{parser:<12} 表格 {index}: {"一致" if actual == expected else "不一致"}')
+            if actual != expected:
+                print(f'    期望: {expected!r}\n    实际: {actual!r}')
+
+    big_table = '<table>' + ''.join(
+        f'<tr><td rowspan="1" class="c">{i}</td><td><a href="/n/{i}">通知 {i}</a></td><td>2024-01-01</td></tr>'
+        for i in range(2000)) + '</table>'
+    for name, converter in (('原实现', LegacyTableConverter), ('新实现', CustomMarkdownConverter)):
+        start = time.perf_counter()
+        converter(current_url=None).convert(big_table)
+        print(f'{name}: 2000 行合并单元格表格 {time.perf_counter() - start:.3f}s')
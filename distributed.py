@@ -0,0 +1,426 @@
+"""
+分布式抓取模式：一个协调器进程和多个 worker 进程，通过本地 TCP 套接字通信（每行一个JSON消息）。
+
+- URL按主机哈希分片，同一主机的URL总由同一个 worker 抓取，主机级的请求间隔、并发上限和 robots.txt 仍然有效
+- 协调器持有全局去重状态和待爬/已爬记录（UrlManager），负责深度检查、分片分配和跨分片的链接转交
+- worker 复用单机的 async_crawl，只是抓取边界换成 RemoteFrontier：新链接、处理完的页面和输出已写入的页面
+  攒批汇报给协调器，待抓取的URL由协调器推送；协调器只把输出已写入的页面记为已爬取
+- 所有分片都没有待抓取和在途的URL时，协调器通知 worker 退出；worker 异常退出时，分给它的URL留在待爬记录中，
+  下次以 continue_crawl 启动时继续
+
+worker 之间不共享状态文件，各自的URL状态、记录文件和附件目录放在 base_dir/shard-<编号> 下，Markdown 写入同一目录。
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from hashlib import blake2b
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from crawler import async_crawl, check_config, create_scheduler, create_url_manager, get_seeds, initialize_logging, \
+    set_file_path
+from fingerprint import FingerprintSet
+from frontier import Frontier
+from record_log import export_records
+from scheduler import HostScheduler, get_host
+from urlmanager import UrlManager
+
+logger = logging.getLogger(__name__)
+
+COORDINATOR_HOST = '127.0.0.1'
+NUM_WORKERS = os.cpu_count() or 1
+# worker 汇报新链接和已完成页面的最长间隔（秒）和每批的最大条数
+REPORT_INTERVAL = 0.05
+REPORT_BATCH = 512
+# 单条消息的最大长度
+MESSAGE_LIMIT = 64 * 1024 * 1024
+WATCHDOG_INTERVAL = 1.0
+# 抓取结束后等待 worker 断开连接的最长时间
+SHUTDOWN_TIMEOUT = 30
+
+
+def shard_of(url: str, num_shards: int) -> int:
+    """URL所属的分片：主机名的哈希对分片数取模，与进程和 PYTHONHASHSEED 无关"""
+    digest = blake2b(get_host(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % num_shards
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class Coordinator:
+    """
+    协调器：全局去重、深度检查、分片分配和结束判断。
+
+    每个分片记录已分配但尚未完成的URL数，worker 先汇报页面的新链接、再汇报页面完成，
+    所以所有分片的计数同时为零时，整个抓取一定已经结束。
+    """
+
+    def __init__(self, num_shards: int, max_depth: int, url_manager: UrlManager, seen=None,
+                 recrawl: bool = False):
+        """
+        :param num_shards: 分片数，即 worker 数
+        :param max_depth: 最大抓取深度
+        :param url_manager: 全局的待爬/已爬记录
+        :param seen: 已分配URL规范形式的集合，默认是 set，URL数量很大时可以传入 FingerprintSet
+        :param recrawl: 重爬模式，上次已爬取的URL也重新分配，只在本次运行内去重
+        """
+        self.num_shards = num_shards
+        self.max_depth = max_depth
+        self.url_manager = url_manager
+        self.seen = seen if seen is not None else set()
+        self.recrawl = recrawl
+        canonicalizer = url_manager.canonicalizer
+        self.canonicalize = canonicalizer.canonicalize if canonicalizer else (lambda url: url)
+        self.observe = canonicalizer.observe if canonicalizer else None
+        self._writers: Dict[int, asyncio.StreamWriter] = {}
+        self._backlog: Dict[int, List[Tuple[int, str]]] = {shard: [] for shard in range(num_shards)}
+        self._outstanding = [0] * num_shards
+        self._dead = set()
+        self._connections = set()
+        self._finished = asyncio.Event()
+        self.assigned = [0] * num_shards
+        self.completed = 0
+        self.durable = 0
+        self.handed_off = 0
+        self.dropped_depth = 0
+        self.dropped_duplicate = 0
+
+    def add(self, items: Iterable[Tuple[int, str]], source_shard: Optional[int] = None) -> None:
+        """接收新链接：去重后分配到所属分片，并立即推送给已连接的 worker"""
+        touched = set()
+        for depth, url in items:
+            if depth > self.max_depth:
+                self.dropped_depth += 1
+                continue
+            # 按规范形式去重，分配和记录的仍是原始URL
+            key = self.canonicalize(url)
+            duplicate = key in self.seen or (not self.recrawl and url in self.url_manager.already_crawled)
+            if self.observe:
+                self.observe(url, key, duplicate)
+            if duplicate:
+                self.dropped_duplicate += 1
+                continue
+            self.seen.add(key)
+            self.url_manager.uncrawled_urls.add(url, depth)
+            shard = shard_of(url, self.num_shards)
+            if shard in self._dead:
+                # 留在待爬记录中，下次续爬时处理
+                continue
+            if source_shard is not None and shard != source_shard:
+                self.handed_off += 1
+            self._backlog[shard].append((depth, url))
+            self._outstanding[shard] += 1
+            self.assigned[shard] += 1
+            touched.add(shard)
+        for shard in touched:
+            self._send_backlog(shard)
+
+    def complete(self, shard: int, urls: List[str]) -> None:
+        """worker 汇报页面处理完成（子链接已经汇报），只用于结束判断"""
+        self.completed += len(urls)
+        self._outstanding[shard] -= len(urls)
+        self._check_finished()
+
+    def mark_durable(self, urls: List[str]) -> None:
+        """worker 汇报页面的输出已经写入，此时才记为已爬取；处理失败的页面留在待爬记录中"""
+        for url in urls:
+            self.url_manager.mark_crawled(url)
+        self.durable += len(urls)
+
+    def _send_backlog(self, shard: int) -> None:
+        writer = self._writers.get(shard)
+        if writer is None or not self._backlog[shard]:
+            return
+        writer.write(encode_message({'op': 'urls', 'items': self._backlog[shard]}))
+        self._backlog[shard] = []
+
+    def _check_finished(self) -> None:
+        if self._finished.is_set() or any(self._outstanding):
+            return
+        self._finished.set()
+        for writer in self._writers.values():
+            writer.write(encode_message({'op': 'stop'}))
+
+    def mark_dead(self, shard: int) -> None:
+        """worker 异常退出：不再等待它的URL，这些URL留在待爬记录中"""
+        if shard in self._dead or self._finished.is_set():
+            return
+        logger.error(f'❌ 分片 {shard} 的 worker 已退出，{self._outstanding[shard]} 个URL留待续爬')
+        self._dead.add(shard)
+        self._writers.pop(shard, None)
+        self._outstanding[shard] = 0
+        self._backlog[shard] = []
+        self._check_finished()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        try:
+            await self._serve_worker(reader, writer)
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _serve_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        hello = json.loads(await reader.readline())
+        shard = hello['shard']
+        self._writers[shard] = writer
+        logger.debug(f'分片 {shard} 的 worker 已连接')
+        self._send_backlog(shard)
+        if self._finished.is_set():
+            writer.write(encode_message({'op': 'stop'}))
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message['op'] == 'links':
+                self.add(message['items'], shard)
+            elif message['op'] == 'done':
+                self.complete(shard, message['urls'])
+            elif message['op'] == 'durable':
+                self.mark_durable(message['urls'])
+        if not self._finished.is_set():
+            self.mark_dead(shard)
+
+    async def _watchdog(self, processes: List[multiprocessing.Process]) -> None:
+        """还没连接就退出的 worker 也要标记，否则会一直等待"""
+        while not self._finished.is_set():
+            for shard, process in enumerate(processes):
+                if process.exitcode is not None:
+                    self.mark_dead(shard)
+            await asyncio.sleep(WATCHDOG_INTERVAL)
+
+    async def serve(self, sock: socket.socket, seeds: List[Tuple[int, str]],
+                    processes: List[multiprocessing.Process]) -> None:
+        """在已监听的套接字上接受 worker 连接，直到抓取结束"""
+        server = await asyncio.start_server(self._handle, sock=sock, limit=MESSAGE_LIMIT)
+        self.add(seeds)
+        self._check_finished()
+        watchdog = asyncio.create_task(self._watchdog(processes))
+        async with server:
+            await self._finished.wait()
+            watchdog.cancel()
+            # worker 收到结束通知后写完剩余输出、发完剩余消息再断开
+            if self._connections:
+                await asyncio.wait(list(self._connections), timeout=SHUTDOWN_TIMEOUT)
+
+    def stats(self) -> Dict[str, Any]:
+        """每个分片分配的URL数、已完成页面数、输出已写入的页面数、跨分片转交的链接数和丢弃计数"""
+        return {
+            'assigned': self.assigned,
+            'completed': self.completed,
+            'durable': self.durable,
+            'handed_off': self.handed_off,
+            'dropped_depth': self.dropped_depth,
+            'dropped_duplicate': self.dropped_duplicate,
+            'dead_shards': sorted(self._dead),
+        }
+
+
+class RemoteFrontier(Frontier):
+    """
+    worker 的抓取边界：去重、深度之外的判断和结束判断都交给协调器。
+
+    put() 只把链接攒起来汇报，不在本地入队（返回 False，所以 worker 不记录待爬URL）；
+    协调器推送的URL进入本地的 HostScheduler；协调器通知结束时关闭调度器，async_crawl 随之退出。
+    页面处理完（task_done）只用于协调器的结束判断，输出写入后（mark_durable，写入线程调用）才另行汇报为已爬取。
+    """
+
+    def __init__(self, scheduler: HostScheduler, max_depth: int, writer: asyncio.StreamWriter):
+        super().__init__(scheduler, max_depth)
+        self.writer = writer
+        self._links: List[Tuple[int, str]] = []
+        self._done: List[str] = []
+        self._durable: List[str] = []
+        self._durable_lock = threading.Lock()
+        self.received = 0
+
+    def put(self, url: str, depth: int) -> bool:
+        if depth > self.max_depth:
+            self.dropped_depth += 1
+            return False
+        self._links.append((depth, url))
+        if len(self._links) >= REPORT_BATCH:
+            self.flush()
+        return False
+
+    def task_done(self, url: str) -> None:
+        self.in_flight -= 1
+        self.scheduler.task_done(url)
+        self._done.append(url)
+        if len(self._done) >= REPORT_BATCH:
+            self.flush()
+
+    def mark_durable(self, url: str) -> None:
+        # 在写入线程中调用，只攒起来，由事件循环中的 flush 发送
+        with self._durable_lock:
+            self._durable.append(url)
+
+    def _check_finished(self) -> None:
+        # 本地队列暂时为空不代表结束，由协调器通知
+        pass
+
+    def flush(self) -> None:
+        """汇报攒下的新链接、已完成页面和输出已写入的页面，新链接必须先于完成消息发出"""
+        if self._links:
+            self.writer.write(encode_message({'op': 'links', 'items': self._links}))
+            self._links = []
+        if self._done:
+            self.writer.write(encode_message({'op': 'done', 'urls': self._done}))
+            self._done = []
+        with self._durable_lock:
+            durable, self._durable = self._durable, []
+        if durable:
+            self.writer.write(encode_message({'op': 'durable', 'urls': durable}))
+
+    async def report(self) -> None:
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            self.flush()
+            await self.writer.drain()
+
+    async def listen(self, reader: asyncio.StreamReader) -> None:
+        """接收协调器推送的URL，收到结束通知或连接断开时关闭调度器"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                logger.error('❌ 与协调器的连接已断开')
+                break
+            message = json.loads(line)
+            if message['op'] == 'urls':
+                for depth, url in message['items']:
+                    self.scheduler.put_nowait((depth, url))
+                self.received += len(message['items'])
+            elif message['op'] == 'stop':
+                break
+        self.scheduler.close()
+
+
+def shard_config(config: Dict[str, Any], shard: int) -> Dict[str, Any]:
+    """worker 的配置：URL状态、记录文件和附件放在各自的目录下"""
+    config = dict(config)
+    shard_dir = os.path.join(config.get('base_dir', 'INFO'), f'shard-{shard}')
+    config['base_dir'] = shard_dir
+    config['output_json'] = set_file_path(os.path.basename(config['output_json']), shard_dir)
+    config['file_download_dir'] = set_file_path('download', shard_dir)
+    if config.get('output_backend', 'files') == 'packed':
+        # 打包存储只能由一个进程写入
+        config['base_md_dir'] = set_file_path('markdown', shard_dir)
+    return config
+
+
+async def _worker_main(shard: int, address: Tuple[str, int], config: Dict[str, Any],
+                       url_manager: UrlManager) -> None:
+    reader, writer = await asyncio.open_connection(*address, limit=MESSAGE_LIMIT)
+    writer.write(encode_message({'op': 'hello', 'shard': shard}))
+    frontier = RemoteFrontier(create_scheduler(config), config['max_depth'], writer)
+    listener = asyncio.create_task(frontier.listen(reader))
+    reporter = asyncio.create_task(frontier.report())
+    try:
+        await async_crawl([], config, url_manager, frontier=frontier)
+    finally:
+        listener.cancel()
+        reporter.cancel()
+        frontier.flush()
+        writer.close()
+        await writer.wait_closed()
+
+
+def run_worker(shard: int, address: Tuple[str, int], config: Dict[str, Any]) -> None:
+    """worker 进程入口"""
+    config = shard_config(config, shard)
+    url_manager = create_url_manager(config)
+    try:
+        asyncio.run(_worker_main(shard, address, config, url_manager))
+    finally:
+        url_manager.close()
+        export_records(config['output_json'])
+
+
+def distributed_crawl(config: Dict[str, Any], num_workers: int = NUM_WORKERS) -> Dict[str, Any]:
+    """
+    以 num_workers 个 worker 进程分布式抓取，参数与 md_crawl 相同，返回协调器的统计
+    """
+    check_config(config)
+    initialize_logging(config)
+    logger.info(f'🕸️ 分布式爬取 {config["base_url"]} worker 👷 {num_workers} 深度 ⏬ {config["max_depth"]}')
+    if num_workers > NUM_WORKERS:
+        # 解析和转换受CPU限制，单核上 1 个 worker 约 95 页/秒、2 个约 76 页/秒
+        logger.warning(f'⚠️ worker 数 {num_workers} 超过CPU核心数 {NUM_WORKERS}，吞吐不会随之提高')
+    sock = socket.create_server((COORDINATOR_HOST, 0))
+    address = sock.getsockname()[:2]
+    # 先启动 worker 再创建协调器的数据库连接和事件循环，fork 出的子进程不继承它们
+    context = multiprocessing.get_context('fork') \
+        if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+    processes = [context.Process(target=run_worker, args=(shard, address, config), name=f'crawl-shard-{shard}')
+                 for shard in range(num_workers)]
+    for process in processes:
+        process.start()
+
+    url_manager = create_url_manager(config)
+    seen = FingerprintSet() if config.get('dedup_backend', 'set') == 'fingerprint' else None
+    coordinator = Coordinator(num_workers, config['max_depth'], url_manager, seen=seen,
+                              recrawl=config.get('recrawl', False))
+    started = time.monotonic()
+    try:
+        asyncio.run(coordinator.serve(sock, get_seeds(config, url_manager), processes))
+    finally:
+        sock.close()
+        for process in processes:
+            process.join()
+        url_manager.close()
+    stats = coordinator.stats()
+    stats['elapsed'] = round(time.monotonic() - started, 3)
+    stats['pages_per_second'] = round(stats['completed'] / max(stats['elapsed'], 1e-6), 1)
+    logger.info(f'🏁 分布式抓取统计: {stats}')
+    return stats
+
+
+if __name__ == "__main__":
+    # 在本机的合成站点上对比不同 worker 数的吞吐
+    # 用法: python distributed.py [worker 数，逗号分隔，如 1,2,4] [主机数] [每个主机的页面数]
+    import shutil
+    import sys
+    import tempfile
+
+    from crawler import Config
+    from synthetic_site import SiteProcess
+
+    worker_counts = [int(n) for n in sys.argv[1].split(',')] if len(sys.argv) > 1 else [1, 2, 4]
+    hosts = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    pages_per_host = int(sys.argv[3]) if len(sys.argv) > 3 else 250
+    logging.disable(logging.INFO)
+
+    print(f'CPU 核心数 {NUM_WORKERS}，worker 数超过核心数时吞吐不会提高')
+    with SiteProcess(hosts=hosts, pages_per_host=pages_per_host) as base_urls:
+        baseline = None
+        for num_workers in worker_counts:
+            work_dir = tempfile.mkdtemp(prefix='distributed-bench-')
+            config = Config(base_url=base_urls[0]).get_config()
+            config.update({
+                'base_dir': work_dir,
+                'base_md_dir': os.path.join(work_dir, 'markdown'),
+                'output_json': os.path.join(work_dir, 'record_json_file.json'),
+                'file_download_dir': os.path.join(work_dir, 'download'),
+                'is_domain_match': False,
+                'is_base_path_match': False,
+                'max_depth': 10 ** 6,
+                'sleep_time': 0,
+                'respect_robots': False,
+                'convert_workers': 0,
+                'is_debug': False,
+            })
+            try:
+                stats = distributed_crawl(config, num_workers)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            baseline = baseline or stats['pages_per_second']
+            print(f'worker {num_workers:>2}  页面 {stats["completed"]:>6}  耗时 {stats["elapsed"]:>7.2f}s  '
+                  f'{stats["pages_per_second"]:>8.1f} 页/秒  加速比 {stats["pages_per_second"] / baseline:.2f}  '
+                  f'跨分片转交 {stats["handed_off"]}  分片分配 {stats["assigned"]}')
@@ -0,0 +1,301 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from attachment_store import AttachmentStore
+from file_handlers import get_file_category
+from metrics import crawl_metrics
+from scheduler import HostScheduler
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_CONCURRENCY = 4
+# 单个文件的大小上限和总耗时上限，超过后放弃该文件
+MAX_FILE_SIZE = 200 * 1024 * 1024
+MAX_DOWNLOAD_TIME = 600
+# 两次收到数据之间的最长等待，防止连接挂起时一直占用下载槽位
+SOCK_READ_TIMEOUT = 30
+CHUNK_SIZE = 64 * 1024
+# 收到的数据攒到该大小后在线程池中写入磁盘并更新摘要，不占用事件循环
+WRITE_BUFFER_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 10.0
+# 与 .part 文件放在一起，记录开始下载时的 ETag 和 Last-Modified，续传时作为 If-Range
+META_SUFFIX = '.meta'
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-\d+/(?:\d+|\*)', re.IGNORECASE)
+UNSATISFIED_RANGE_RE = re.compile(r'bytes\s+\*/(\d+)', re.IGNORECASE)
+
+
+class FileTooLarge(Exception):
+    """附件大小超过 max_size，放弃下载并删除已下载的部分"""
+
+
+class Downloader:
+    """
+    附件下载子系统：与页面抓取共用 aiohttp 会话，但有独立的并发上限，页面处理只提交任务、不等待下载完成。
+
+    下载流式写入 .part 临时文件并同时计算摘要，完成后交给 AttachmentStore 按内容存放；
+    上次中断留下的 .part 文件通过 Range 请求续传，并带上 If-Range（ETag 或 Last-Modified），文件已变化、
+    服务器返回的范围与断点不一致或没有校验信息时从头下载。超过大小上限的文件会被丢弃，超时的文件保留 .part 以便下次续传。
+    只有下载成功的URL才会记入 already_downloaded，存储中已有的URL不会重复下载。
+    磁盘读写、摘要计算和存储的数据库操作都在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, store: AttachmentStore, already_downloaded,
+                 concurrency: int = DOWNLOAD_CONCURRENCY, max_size: int = MAX_FILE_SIZE,
+                 max_time: float = MAX_DOWNLOAD_TIME, chunk_size: int = CHUNK_SIZE,
+                 scheduler: Optional[HostScheduler] = None, respect_robots: bool = True):
+        """
+        :param session: 共享的 aiohttp 会话
+        :param store: 附件存储
+        :param already_downloaded: 已下载URL的集合，通常是 UrlManager.already_downloaded
+        :param concurrency: 同时下载的文件数
+        :param max_size: 单个文件的大小上限（字节）
+        :param max_time: 单个文件的下载时间上限（秒）
+        :param chunk_size: 每次从网络读取的块大小
+        :param scheduler: 页面抓取使用的主机调度器，下载请求与页面请求共用每个主机的请求间隔和并发上限
+        :param respect_robots: 有 scheduler 时，下载前是否先读取主机的 robots.txt，并跳过其禁止抓取的文件
+        """
+        self.session = session
+        self.store = store
+        self.already_downloaded = already_downloaded
+        self.max_size = max_size
+        self.timeout = aiohttp.ClientTimeout(total=max_time, sock_read=SOCK_READ_TIMEOUT)
+        self.chunk_size = chunk_size
+        self.scheduler = scheduler
+        self.respect_robots = respect_robots
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._submitted = set()
+        self._tasks = set()
+        self._reporter = None
+        self.started_at = time.monotonic()
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.too_large = 0
+        self.disallowed = 0
+        self.resumed = 0
+        self.bytes_downloaded = 0
+
+    def submit(self, file_urls: List[Tuple[str, str]]) -> None:
+        """提交 (URL, 文件名) 列表，可以在解析线程中调用，立即返回"""
+        if file_urls:
+            self.loop.call_soon_threadsafe(self._schedule, file_urls)
+
+    def _schedule(self, file_urls: List[Tuple[str, str]]) -> None:
+        for file_url, file_name in file_urls:
+            if file_url in self._submitted:
+                continue
+            self._submitted.add(file_url)
+            task = self.loop.create_task(self._download(file_url, file_name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._reporter is None:
+            self._reporter = self.loop.create_task(self._report_progress())
+
+    async def _run(self, func: Callable, *args: Any) -> Any:
+        """在默认线程池中执行阻塞的磁盘或数据库操作"""
+        return await self.loop.run_in_executor(None, functools.partial(func, *args))
+
+    def _is_downloaded(self, file_url: str) -> bool:
+        return file_url in self.already_downloaded or self.store.get(file_url) is not None
+
+    async def _download(self, file_url: str, file_name: str) -> None:
+        if await self._run(self._is_downloaded, file_url):
+            return
+        file_ext, file_category = get_file_category(file_url)
+        if self.scheduler is not None and self.respect_robots:
+            await self.scheduler.ensure_robots(self.session, file_url)
+            if not self.scheduler.can_fetch(file_url):
+                self.disallowed += 1
+                logger.info('🤖 robots.txt 禁止下载: %s', file_url, extra={'event': 'robots_disallowed', 'url': file_url})
+                return
+        part_path = self.store.part_path(file_url)
+        async with self._semaphore:
+            self.active += 1
+            start = time.perf_counter()
+            try:
+                size, digest = await self._fetch(file_url, part_path)
+                stored_name = await self._run(self.store.add, file_url, part_path, digest, size, file_name,
+                                              file_ext, file_category)
+                await self._run(self._remove, part_path + META_SUFFIX)
+            except FileTooLarge as e:
+                self.too_large += 1
+                crawl_metrics.inc('downloads_too_large')
+                await self._run(self._discard_part, part_path)
+                logger.error('❌ 文件过大，放弃下载: %s.%s - %s', file_name, file_ext, e,
+                             extra={'event': 'download_error', 'url': file_url})
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+                self.failed += 1
+                crawl_metrics.inc('download_failures')
+                logger.error('❌ 文件下载失败: %s.%s - %r', file_name, file_ext, e,
+                             extra={'event': 'download_error', 'url': file_url})
+                return
+            finally:
+                self.active -= 1
+        crawl_metrics.observe('download', time.perf_counter() - start)
+        crawl_metrics.inc('files_downloaded')
+        await self._run(self.already_downloaded.add, file_url)
+        self.completed += 1
+        logger.info('📥 下载文件: %s (%d 字节)', stored_name, size, extra={'event': 'file_saved', 'url': file_url})
+
+    async def _fetch(self, file_url: str, part_path: str) -> Tuple[int, str]:
+        """把文件流式写入 part_path，边写边计算 SHA-256，返回 (文件总大小, 摘要)；已有 .part 文件时尝试从断点续传"""
+        offset, validator = await self._run(self._resume_state, part_path)
+        if offset:
+            result = await self._request(file_url, part_path, offset, validator)
+            if result is not None:
+                return result
+            logger.debug('⚠️ 无法续传，从头下载: %s', file_url)
+            await self._run(self._discard_part, part_path)
+        return await self._request(file_url, part_path, 0, None)
+
+    async def _request(self, file_url: str, part_path: str, offset: int,
+                       validator: Optional[str]) -> Optional[Tuple[int, str]]:
+        """
+        请求文件并写入 part_path。offset 大于 0 时请求 offset 之后的部分，
+        服务器返回的范围与断点不一致时返回 None，由调用方从头下载。
+        有 scheduler 时等到主机的请求间隔已过、有空闲的并发槽位后才发出请求，下载期间占用该槽位
+        """
+        if self.scheduler is None:
+            return await self._stream(file_url, part_path, offset, validator)
+        await self.scheduler.acquire(file_url, wait_for_slot=True)
+        try:
+            return await self._stream(file_url, part_path, offset, validator)
+        finally:
+            self.scheduler.release(file_url)
+
+    async def _stream(self, file_url: str, part_path: str, offset: int,
+                      validator: Optional[str]) -> Optional[Tuple[int, str]]:
+        request_headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if offset else None
+        async with self.session.get(file_url, headers=request_headers, timeout=self.timeout) as response:
+            if response.status == 416 and offset:
+                # 请求的起点超出文件末尾：文件总长度等于已下载的长度时，说明上次其实已经下载完整
+                match = UNSATISFIED_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                if match is None or int(match.group(1)) != offset:
+                    return None
+                return offset, (await self._run(self._hash_file, part_path)).hexdigest()
+            response.raise_for_status()
+            if offset and response.status == 206:
+                match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                if match is None or int(match.group(1)) != offset:
+                    return None
+                self.resumed += 1
+                hasher = await self._run(self._hash_file, part_path)
+            else:
+                # 服务器不支持 Range 或文件已变化（If-Range 不匹配），从头下载
+                offset = 0
+                hasher = hashlib.sha256()
+                await self._run(self._write_meta, part_path, response.headers.get('ETag'),
+                                response.headers.get('Last-Modified'))
+            if response.content_length is not None and offset + response.content_length > self.max_size:
+                raise FileTooLarge(f'{offset + response.content_length} 字节超过上限 {self.max_size}')
+            written = offset
+            buffer = bytearray()
+            f = await self._run(open, part_path, 'ab' if offset else 'wb')
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    written += len(chunk)
+                    if written > self.max_size:
+                        raise FileTooLarge(f'超过上限 {self.max_size} 字节')
+                    buffer += chunk
+                    self.bytes_downloaded += len(chunk)
+                    crawl_metrics.inc('bytes_downloaded', len(chunk))
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await self._run(self._write_block, f, hasher, bytes(buffer))
+                        buffer.clear()
+                if buffer:
+                    await self._run(self._write_block, f, hasher, bytes(buffer))
+            finally:
+                await self._run(f.close)
+            return written, hasher.hexdigest()
+
+    @staticmethod
+    def _write_block(f, hasher: 'hashlib._Hash', data: bytes) -> None:
+        f.write(data)
+        hasher.update(data)
+
+    @staticmethod
+    def _resume_state(part_path: str) -> Tuple[int, Optional[str]]:
+        """
+        已下载的字节数和续传用的 If-Range 值：强 ETag 优先，其次 Last-Modified；
+        没有校验信息时无法确认文件未变化，删除 .part 从头下载
+        """
+        if not os.path.exists(part_path):
+            return 0, None
+        try:
+            with open(part_path + META_SUFFIX, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        etag = meta.get('etag')
+        validator = etag if etag and not etag.startswith('W/') else meta.get('last_modified')
+        if not validator:
+            Downloader._discard_part(part_path)
+            return 0, None
+        return os.path.getsize(part_path), validator
+
+    @staticmethod
+    def _write_meta(part_path: str, etag: Optional[str], last_modified: Optional[str]) -> None:
+        with open(part_path + META_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump({'etag': etag, 'last_modified': last_modified}, f)
+
+    def _hash_file(self, path: str) -> 'hashlib._Hash':
+        """计算续传前已下载部分的摘要"""
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(WRITE_BUFFER_SIZE), b''):
+                hasher.update(chunk)
+        return hasher
+
+    @staticmethod
+    def _discard_part(part_path: str) -> None:
+        """删除 .part 文件和它的校验信息"""
+        Downloader._remove(part_path)
+        Downloader._remove(part_path + META_SUFFIX)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    async def _report_progress(self) -> None:
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            logger.info(f'📥 下载进度: {self.stats()}')
+
+    def stats(self) -> Dict[str, float]:
+        """已完成、失败、过大、robots.txt 禁止、续传、进行中、排队中的文件数，下载字节数和平均吞吐（字节/秒）"""
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        return {
+            'completed': self.completed,
+            'failed': self.failed,
+            'too_large': self.too_large,
+            'disallowed': self.disallowed,
+            'resumed': self.resumed,
+            'active': self.active,
+            'queued': len(self._tasks) - self.active,
+            'bytes': self.bytes_downloaded,
+            'throughput': round(self.bytes_downloaded / elapsed, 1),
+        }
+
+    async def join(self) -> None:
+        """等待所有已提交的下载完成"""
+        # 让解析线程通过 call_soon_threadsafe 提交、尚未执行的回调先运行
+        await asyncio.sleep(0)
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        if self._reporter is not None:
+            self._reporter.cancel()
+            self._reporter = None
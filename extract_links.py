@@ -1,13 +1,15 @@
 import json
 import logging
-from typing import List, Tuple
-from urllib.parse import urlparse, urljoin
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
 
-from bs4 import BeautifulSoup
+from canonical import UrlCanonicalizer
+from html_parser import HtmlDocument, parse_html
+from log_setup import LINKS_LOGGER
 
-# 设置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# 每个页面的完整链接列表，只在 log_links 打开时输出
+links_logger = logging.getLogger(LINKS_LOGGER)
 
 FILE_TYPES = {}
 
@@ -20,39 +22,109 @@ def load_file_types():
         FILE_TYPES = json.load(file)
 
 
-def extract_links(soup: BeautifulSoup, base_url: str, target_tags: List[str],
-                  domain_matching: bool = False, path_matching: bool = False,
-                  exclude_image_urls: bool = True) -> List[Tuple[str, str]]:
-    base_parsed = urlparse(base_url)
-    load_file_types()
-
-    def is_relevant_link(href: str) -> bool:
-        full_url = urljoin(base_url, href)
-        parsed_url = urlparse(full_url)
+# exclude_image_urls 为 True 时排除的图片链接
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
-        if any(parsed_url.path.lower().endswith(f'.{ext}') for ext in FILE_TYPES):
-            return True
 
-        domain_matches = base_parsed.netloc == parsed_url.netloc if domain_matching else True
-        path_matches = base_parsed.path in parsed_url.path if path_matching else True
+def _url_extension(path: str) -> str:
+    """路径最后一段的小写后缀，没有后缀时返回空字符串"""
+    last_segment = path[path.rfind('/') + 1:]
+    dot = last_segment.rfind('.')
+    return last_segment[dot + 1:].lower() if dot >= 0 else ''
 
-        is_valid = all([parsed_url.scheme, parsed_url.netloc])
-        if exclude_image_urls:
-            is_valid = is_valid and not href.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))
 
-        return domain_matches and path_matches and is_valid
+class LinkFilter:
+    """
+    链接过滤器：按抓取配置创建一次，之后每个页面调用 filter 批量处理该页的所有链接。
 
-    links = []
-    for tag in target_tags:
-        for element in soup.find_all(tag):
-            for link in element.find_all('a', href=True):
-                if is_relevant_link(link['href']):
-                    full_link = urljoin(base_url, link['href'])
-                    link_text = link.get_text(strip=True)
-                    links.append((full_link, link_text))
+    基础URL的主机和路径前缀预先解析好，文件后缀用集合查找，每个 href 只解析一次，同一页面内重复的链接只保留第一个。
+    """
 
-    logger.info(f'📥 提取到的链接及其标题: {links}')
+    def __init__(self, base_url: str, domain_matching: bool = False, path_matching: bool = False,
+                 exclude_image_urls: bool = True, canonicalizer: Optional[UrlCanonicalizer] = None):
+        """
+        :param base_url: 抓取的基础URL，用于域名和路径匹配
+        :param domain_matching: 是否只保留与基础URL同一主机的链接
+        :param path_matching: 是否只保留路径以基础URL路径开头的链接
+        :param exclude_image_urls: 是否排除图片链接
+        :param canonicalizer: URL规范化器，只用于判断重复链接，返回的仍是原始URL
+        """
+        load_file_types()
+        base_parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.base_netloc = base_parts.netloc
+        self.base_path = base_parts.path
+        self.domain_matching = domain_matching
+        self.path_matching = path_matching
+        self.exclude_image_urls = exclude_image_urls
+        self.canonicalizer = canonicalizer
+        self.file_extensions = {ext.lower() for ext in FILE_TYPES}
+
+    def is_relevant(self, url: str) -> bool:
+        """判断一个绝对URL是否需要保留：文件链接总是保留，其余按域名、路径匹配"""
+        parts = urlsplit(url)
+        if not parts.scheme or not parts.netloc:
+            return False
+        extension = _url_extension(parts.path)
+        if self.exclude_image_urls and extension in IMAGE_EXTENSIONS:
+            return False
+        if extension in self.file_extensions:
+            return True
+        if self.domain_matching and parts.netloc != self.base_netloc:
+            return False
+        if self.path_matching and not parts.path.startswith(self.base_path):
+            return False
+        return True
+
+    def filter(self, page_url: str, links: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        处理一个页面的全部链接
+
+        :param page_url: 页面URL，相对链接以它为基准解析
+        :param links: (href, 链接文本)，通常来自 HtmlDocument.iter_links
+        :return: 去重后的 (绝对URL, 链接文本) 列表，保持页面中的顺序；URL去掉片段，其余保持原样
+        """
+        seen_hrefs = set()
+        seen_urls = set()
+        result = []
+        canonicalize = self.canonicalizer.canonicalize if self.canonicalizer else None
+        for href, link_text in links:
+            href = href.strip()
+            # 纯锚点指向当前页面本身
+            if not href or href[0] == '#' or href in seen_hrefs:
+                continue
+            seen_hrefs.add(href)
+            full_link = href if href.startswith(('http://', 'https://')) else urljoin(page_url, href)
+            full_link = urldefrag(full_link)[0]
+            if not self.is_relevant(full_link):
+                continue
+            key = canonicalize(full_link) if canonicalize else full_link
+            if key in seen_urls:
+                continue
+            seen_urls.add(key)
+            result.append((full_link, link_text))
+        return result
+
+
+def extract_links(document: HtmlDocument, base_url: str, target_tags: List[str],
+                  domain_matching: bool = False, path_matching: bool = False,
+                  exclude_image_urls: bool = True,
+                  canonicalizer: Optional[UrlCanonicalizer] = None,
+                  page_url: Optional[str] = None,
+                  link_filter: Optional[LinkFilter] = None) -> List[Tuple[str, str]]:
+    """
+    提取页面目标区域中的链接
 
+    :param page_url: 页面URL，相对链接以它为基准解析，默认为 base_url
+    :param link_filter: 预先创建的 LinkFilter，传入时忽略 domain_matching 等过滤参数
+    """
+    if link_filter is None:
+        link_filter = LinkFilter(base_url, domain_matching, path_matching, exclude_image_urls, canonicalizer)
+    links = link_filter.filter(page_url or base_url, document.iter_links(target_tags))
+    logger.debug('📥 提取到 %d 个链接: %s', len(links), page_url or base_url)
+    if links_logger.isEnabledFor(logging.INFO):
+        links_logger.info('📥 提取到的链接及其标题: %s: %s', page_url or base_url, links,
+                          extra={'event': 'links', 'url': page_url or base_url})
     return links
 
 
@@ -70,10 +142,10 @@ if __name__ == "__main__":
         </body>
     </html>
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
+    document = parse_html(html_content)
     base_url = "https://example.com"
     target_tags = ['body']
 
-    links = extract_links(soup, base_url, target_tags, domain_matching=True, exclude_image_urls=True)
+    links = extract_links(document, base_url, target_tags, domain_matching=True, exclude_image_urls=True)
     for link, text in links:
         print(f"Link: {link}, Text: {text}")
@@ -1,72 +1,89 @@
+import asyncio
 import json
 import logging
 import os
-from copy import deepcopy
 from datetime import datetime
-from json import JSONDecodeError
-from typing import List, Optional, Tuple
+from typing import List, NamedTuple, Optional, Tuple
 from urllib.parse import urlparse
 
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+from bs4 import UnicodeDammit
 
+from convert_pool import ConvertPool
 from custom_markdown_convert import html2md
+from html_parser import HtmlDocument
+from metrics import crawl_metrics
+from record_log import get_record_log
+from scheduler import get_host
+from writer import BatchWriter, write_markdown
 
 logger = logging.getLogger(__name__)
-
-# 定义日志文件路径
-log_file_path = 'file_handlers_log.log'
-
-# 配置日志记录器
-logging.basicConfig(
-    level=logging.ERROR,  # 设置日志级别，这里是DEBUG
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # 日志格式
-    handlers=[
-        logging.FileHandler(log_file_path),  # 将日志输出到文件
-        logging.StreamHandler()  # 同时保留控制台输出
-    ]
-)
-session = requests.Session()
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+FETCH_TIMEOUT = 2
+
+
+class FetchResult(NamedTuple):
+    """一次页面抓取的结果，final_url 是重定向后的最终URL，status 为 304 时 body 为空"""
+    body: bytes
+    charset: Optional[str]
+    final_url: str
+    status: int = 200
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
 
+def create_async_session(concurrency: int) -> aiohttp.ClientSession:
+    """创建异步会话，连接池大小与抓取并发数一致"""
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300)
+    return aiohttp.ClientSession(headers=headers, connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT))
 
-def fetch_page(url: str) -> Optional[str]:
-    """获取页面内容"""
+
+async def async_fetch_page(session: aiohttp.ClientSession, url: str,
+                           request_headers: Optional[dict] = None) -> Optional[FetchResult]:
+    """
+    异步获取页面内容，只负责网络I/O，解码交给解析阶段
+
+    :param request_headers: 额外的请求头，如条件请求的 If-None-Match / If-Modified-Since
+    :return: FetchResult，非HTML或请求失败时返回None
+    """
     try:
-        logger.debug(f'正在爬取: {url}')
-        response = session.get(url, headers=headers, timeout=2)
-        response.encoding = response.apparent_encoding
-        if 'text/html' in response.headers.get('Content-Type', ''):
-            return response.text
-        else:
-            logger.info(f'❌ 内容不是 text/html: {url}')
-            return None
-    except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-        logger.error(f'❌ 请求错误: {url}: {e}')
+        logger.debug('正在爬取: %s', url)
+        async with session.get(url, headers=request_headers) as response:
+            crawl_metrics.record_status(get_host(url), response.status)
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status == 304:
+                return FetchResult(b'', None, str(response.url), 304, etag, last_modified)
+            if 'text/html' not in response.headers.get('Content-Type', ''):
+                logger.info('❌ 内容不是 text/html: %s', url, extra={'event': 'not_html', 'url': url})
+                return None
+            body = await response.read()
+            crawl_metrics.inc('bytes_fetched', len(body))
+            return FetchResult(body, response.charset, str(response.url), response.status, etag, last_modified)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        crawl_metrics.record_status(get_host(url), 'error')
+        logger.error('❌ 请求错误: %s: %r', url, e, extra={'event': 'fetch_error', 'url': url})
         return None
 
 
-def extract_content(soup: BeautifulSoup, target_area_content_tags: List[str]) -> str:
+def decode_page(body: bytes, charset: Optional[str]) -> str:
+    """解码页面，优先使用响应头编码，其次是页面meta声明，最后按内容检测"""
+    return UnicodeDammit(body, [charset] if charset else [], is_html=True).unicode_markup
+
+
+def extract_content(document: HtmlDocument, target_area_content_tags: List[str]) -> str:
     """
-    提取BeautifulSoup对象中多个特定标签的内容，并拼接成一个新的HTML字符串
+    提取文档中的正文区域，只取最外层的匹配节点，拼接成一个新的HTML字符串
 
-    :param soup: BeautifulSoup, 原始的BeautifulSoup对象
-    :param target_tags: List[str], 目标标签名称列表
+    :param document: HtmlDocument, 解析后的页面
+    :param target_area_content_tags: List[str], 目标标签名或CSS选择器列表，如 ['article', 'div.content', '#main']
     :return: str, 包含提取内容的新的HTML字符串
     """
     if not target_area_content_tags:
-        return str(soup)
-    new_soup = BeautifulSoup('<html><head><meta charset="utf-8"></head><body></body></html>', 'html.parser')
-    soup_copy = deepcopy(soup)
-    extracted_tags = set()
-    for tag_name in target_area_content_tags:
-        if tag_name not in extracted_tags:
-            tags = soup_copy.find_all(tag_name)
-            for tag in tags:
-                new_soup.body.append(tag)
-            extracted_tags.add(tag_name)
-    return str(new_soup)
+        return document.html()
+    return document.region_html(target_area_content_tags)
 
 
 def extract_common_file_urls(links: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
@@ -78,38 +95,26 @@ def extract_common_file_urls(links: List[Tuple[str, str]]) -> List[Tuple[str, st
     return [(link, title) for link, title in links if any(link.lower().endswith(ext) for ext in common_file_extensions)]
 
 
-def record_page_info(url: str, file_path: str, file_links: dict, output_json_file: str) -> None:
+def record_page_info(url: str, file_path: str, file_links: dict, output_json_file: str,
+                     duplicate_of: Optional[str] = None, writer: Optional[BatchWriter] = None) -> None:
+    """
+    记录页面信息，追加到记录日志中，同一URL以最后一条为准，抓取结束后由 export_records 导出为JSON。
+    近似重复的页面不单独保存，file_path 指向代表页面的文件，duplicate_of 为代表页面的URL。
+    传入 writer 时由后台写入线程批量追加
+    """
     date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    """记录页面信息到JSON文件，避免重复URL，如存在则更新信息"""
-
     page_info = {
         'url': url,
         'file_path': file_path,
         'file_links': file_links,
         "date": date,
     }
-
-    if os.path.exists(output_json_file):
-        try:
-            with open(output_json_file, 'r') as json_file:
-                existing_data = json.load(json_file)
-        except JSONDecodeError:
-            existing_data = []
-
-        updated = False
-        for index, entry in enumerate(existing_data):
-            if entry['url'] == url:
-                existing_data[index].update(page_info)
-                updated = True
-                break
-        if not updated:
-            existing_data.append(page_info)
-
-        with open(output_json_file, 'w') as json_file:
-            json.dump(existing_data, json_file, indent=2, ensure_ascii=False)
+    if duplicate_of is not None:
+        page_info['duplicate_of'] = duplicate_of
+    if writer is not None:
+        writer.write_record(output_json_file, page_info)
     else:
-        with open(output_json_file, 'w') as json_file:
-            json.dump([page_info], json_file, indent=2, ensure_ascii=False)
+        get_record_log(output_json_file).append(page_info)
 
 
 # 全局变量存储文件类型
@@ -125,30 +130,14 @@ def load_file_types():
         FILE_TYPES = json.load(file)
 
 
-def download_files(file_urls: List[Tuple[str, str]], download_dir: str, already_downloaded: set) -> None:
-    """下载文件并分类"""
+def get_file_category(file_url: str) -> Tuple[str, str]:
+    """根据URL后缀返回 (后缀, 分类目录名)"""
     load_file_types()
-    dir_path = os.path.join(os.path.dirname(__file__), download_dir)
-    os.makedirs(dir_path, exist_ok=True)
-
-    for file_url, file_name in file_urls:
-        if file_url not in already_downloaded:
-            # 从 URL 中提取文件后缀
-            file_ext = file_url.split('.')[-1].split('?')[0].lower()
-            file_category = FILE_TYPES.get(file_ext, '其他文件')
-            file_path = os.path.join(download_dir, file_category, f"{file_name}.{file_ext}")
-            os.makedirs(os.path.dirname(file_path), exist_ok=True)
-            try:
-                response = session.get(file_url, headers=headers)
-                response.raise_for_status()
-                with open(file_path, 'wb') as file:
-                    file.write(response.content)
-                logger.info(f'📥 下载文件: {file_name}.{file_ext}')
-            except requests.RequestException as e:
-                logger.error(f'❌ 文件下载失败: {file_name}.{file_ext} - {e}')
-
-
-def extract_url_title_name(url: str, soup: BeautifulSoup) -> str:
+    file_ext = file_url.split('.')[-1].split('?')[0].lower()
+    return file_ext, FILE_TYPES.get(file_ext, '其他文件')
+
+
+def extract_url_title_name(url: str, document: HtmlDocument) -> str:
     """
     优化地从URL和页面标题中提取更规范的文件名。
 
@@ -159,7 +148,8 @@ def extract_url_title_name(url: str, soup: BeautifulSoup) -> str:
     """
 
     # 获取页面标题并清理
-    title = soup.title.string.strip("/") if soup.title else "Untitled"
+    title = document.title()
+    title = title.strip("/") if title else "Untitled"
 
     parsed_url = urlparse(url)
     path = parsed_url.path
@@ -176,15 +166,28 @@ def extract_url_title_name(url: str, soup: BeautifulSoup) -> str:
     return file_name
 
 
-def save_content(file_path: str, content: str, filter_tags: List[str]) -> None:
-    """保存内容到Markdown文件"""
+def save_content(file_path: str, content: str, filter_tags: List[str], current_url: str = None,
+                 parser: str = None, convert_pool: Optional[ConvertPool] = None,
+                 writer: Optional[BatchWriter] = None) -> bool:
+    """
+    保存内容到Markdown文件，parser 为转换时使用的HTML解析后端。
+    传入 convert_pool 时转换交给进程池，文件在转换完成后写入；否则在当前线程中转换。
+    传入 writer 时Markdown交给后台写入线程（进程池模式下由 convert_pool 的 writer 写入），写入后通知 current_url 完成
+    :return: 内容为空、没有需要写入的Markdown时返回 False
+    """
     if content:
         strip_elements = ['img']
         strip_elements.extend(filter_tags)
-        output = html2md(content, strip=strip_elements)
-        logger.info(f'创建 📝 {file_path.split("/")[-1]}')
-
-        with open(file_path, 'w') as f:
-            f.write(output)
-    else:
-        logger.error(f'❌ 空内容: {file_path}. 请检查目标元素，跳过。')
+        if convert_pool is not None:
+            convert_pool.submit(file_path, content, current_url, {'strip': strip_elements, 'parser': parser})
+            return True
+        with crawl_metrics.stage('html2md'):
+            markdown = html2md(content, current_url, strip=strip_elements, parser=parser)
+        if writer is not None:
+            writer.write_markdown(file_path, markdown, current_url)
+        else:
+            write_markdown(file_path, markdown)
+        return True
+    logger.error('❌ 空内容: %s. 请检查目标元素，跳过。', file_path,
+                 extra={'event': 'no_content', 'url': current_url})
+    return False
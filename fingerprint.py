@@ -0,0 +1,256 @@
+"""
+URL 指纹集合：用 64 位指纹代替完整URL字符串做去重，适合千万级URL。
+
+误判策略：
+- 指纹表本身是精确的 64 位集合，只有两个不同URL的指纹相同时才会误判为"已存在"，
+  n 个URL中出现任意一次碰撞的概率约为 n² / 2^65（1千万URL约 2.7e-6，1亿URL约 2.7e-4）。
+  误判的后果是该URL被当作已爬取而跳过，不会出现漏判（已存在的URL一定能查到）。
+- 可选的布隆过滤器只用来快速排除一定不存在的URL，布隆过滤器认为"可能存在"时仍会查指纹表确认，
+  所以它不会引入额外的误判，只在指纹表通过 mmap 放在磁盘上时减少随机访问。
+"""
+import mmap
+import math
+import os
+import struct
+import threading
+from array import array
+from hashlib import blake2b
+from typing import Iterable, Optional
+
+MAGIC = b'URLFP001'
+# 文件头：魔数、表容量、元素个数、布隆过滤器字节数、布隆哈希函数个数
+HEADER = struct.Struct('<8sQQQQ')
+MAX_LOAD_FACTOR = 0.6
+MIN_CAPACITY = 1024
+
+
+def url_fingerprint(url: str) -> int:
+    """URL 的 64 位指纹，0 保留给空槽位"""
+    fingerprint = int.from_bytes(blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+    return fingerprint or 1
+
+
+class BloomFilter:
+    """按指纹做双重哈希的布隆过滤器"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01, bits: Optional[memoryview] = None,
+                 num_hashes: int = 0):
+        if bits is not None:
+            self.bits = bits
+            self.num_hashes = num_hashes
+        else:
+            num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+            self.bits = bytearray((num_bits + 7) // 8)
+            self.num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        self.num_bits = len(self.bits) * 8
+
+    def _positions(self, fingerprint: int):
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, fingerprint: int) -> None:
+        for pos in self._positions(fingerprint):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, fingerprint: int) -> bool:
+        bits = self.bits
+        for pos in self._positions(fingerprint):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class FingerprintSet:
+    """
+    64 位指纹的开放寻址哈希表（线性探测），每个URL约占 8 / 装载因子 字节，接口与 set 的常用部分一致。
+
+    可以保存到文件，并通过 mmap 以写时复制方式加载：未访问的页面不会读入内存，修改只影响本进程，
+    需要持久化时再调用 save()。
+    """
+
+    def __init__(self, capacity: int = MIN_CAPACITY, bloom_capacity: int = 0, bloom_error_rate: float = 0.01):
+        """
+        :param capacity: 初始槽位数，会向上取整到2的幂
+        :param bloom_capacity: 预计元素个数，大于0时启用布隆过滤器前置过滤
+        :param bloom_error_rate: 布隆过滤器的误判率
+        """
+        self.capacity = 1 << (max(MIN_CAPACITY, capacity) - 1).bit_length()
+        self._table = array('Q', bytes(8 * self.capacity))
+        self._count = 0
+        self._mmap = None
+        self.bloom = BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity > 0 else None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _probe(self, fingerprint: int) -> int:
+        """返回指纹所在槽位或第一个空槽位"""
+        # 掩码取自同一张表，扩容时并发的查询不会拿到新容量配旧表
+        table = self._table
+        mask = len(table) - 1
+        slot = fingerprint & mask
+        while True:
+            value = table[slot]
+            if value == 0 or value == fingerprint:
+                return slot
+            slot = (slot + 1) & mask
+
+    def contains_fingerprint(self, fingerprint: int) -> bool:
+        if self.bloom is not None and fingerprint not in self.bloom:
+            return False
+        table = self._table
+        mask = len(table) - 1
+        slot = fingerprint & mask
+        while True:
+            value = table[slot]
+            if value == fingerprint:
+                return True
+            if value == 0:
+                return False
+            slot = (slot + 1) & mask
+
+    def add_fingerprint(self, fingerprint: int) -> bool:
+        """加入指纹，返回是否是新元素"""
+        with self._lock:
+            slot = self._probe(fingerprint)
+            if self._table[slot] == fingerprint:
+                return False
+            self._table[slot] = fingerprint
+            self._count += 1
+            if self.bloom is not None:
+                self.bloom.add(fingerprint)
+            if self._count > self.capacity * MAX_LOAD_FACTOR:
+                self._resize(self.capacity * 2)
+            return True
+
+    def __contains__(self, url: str) -> bool:
+        return self.contains_fingerprint(url_fingerprint(url))
+
+    def add(self, url: str) -> None:
+        self.add_fingerprint(url_fingerprint(url))
+
+    def update(self, urls: Iterable[str]) -> None:
+        for url in urls:
+            self.add(url)
+
+    def _resize(self, capacity: int) -> None:
+        old_table = self._table
+        table = array('Q', bytes(8 * capacity))
+        mask = capacity - 1
+        for value in old_table:
+            if value:
+                slot = value & mask
+                while table[slot]:
+                    slot = (slot + 1) & mask
+                table[slot] = value
+        self._table = table
+        self.capacity = capacity
+        if self._mmap is not None:
+            old_table.release()
+            self._release_mmap()
+
+    def _release_mmap(self) -> None:
+        if self.bloom is not None and isinstance(self.bloom.bits, memoryview):
+            self.bloom.bits = bytearray(self.bloom.bits)
+            self.bloom.num_bits = len(self.bloom.bits) * 8
+        self._mmap.close()
+        self._mmap = None
+
+    def save(self, path: str) -> None:
+        """原子地保存到文件"""
+        with self._lock:
+            bloom_bits = bytes(self.bloom.bits) if self.bloom is not None else b''
+            num_hashes = self.bloom.num_hashes if self.bloom is not None else 0
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, self.capacity, self._count, len(bloom_bits), num_hashes))
+                f.write(memoryview(self._table).cast('B'))
+                f.write(bloom_bits)
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, use_mmap: bool = True) -> 'FingerprintSet':
+        """从文件加载；use_mmap 为 True 时以写时复制方式映射，不会一次性读入整个表"""
+        fingerprint_set = cls.__new__(cls)
+        fingerprint_set._lock = threading.Lock()
+        with open(path, 'rb') as f:
+            if use_mmap:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+                fingerprint_set._mmap = buffer
+            else:
+                buffer = bytearray(f.read())
+                fingerprint_set._mmap = None
+        magic, capacity, count, bloom_size, num_hashes = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f'不是URL指纹文件: {path}')
+        table_end = HEADER.size + capacity * 8
+        fingerprint_set.capacity = capacity
+        fingerprint_set._count = count
+        fingerprint_set._table = memoryview(buffer)[HEADER.size:table_end].cast('Q')
+        fingerprint_set.bloom = None
+        if bloom_size:
+            bits = memoryview(buffer)[table_end:table_end + bloom_size]
+            fingerprint_set.bloom = BloomFilter(0, bits=bits, num_hashes=num_hashes)
+        return fingerprint_set
+
+    def close(self) -> None:
+        """释放 mmap"""
+        with self._lock:
+            if self._mmap is not None:
+                table = self._table
+                self._table = array('Q')
+                self._table.frombytes(table.tobytes())
+                table.release()
+                self._release_mmap()
+
+
+if __name__ == "__main__":
+    # 对比 set 和 FingerprintSet 的每URL内存占用与查询吞吐
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    def make_urls(suffix=''):
+        return [f'https://www{i % 50}.nepu.edu.cn/info/{i // 1000}/{i}.htm{suffix}' for i in range(count)]
+
+    urls = make_urls()
+    misses = make_urls('?miss')
+
+    def measure(name, factory):
+        tracemalloc.start()
+        container = factory()
+        # 在计量范围内重新生成URL，set 需要一直持有这些字符串，指纹集合只保留指纹
+        for url in make_urls():
+            container.add(url)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        hits = sum(1 for url in urls if url in container)
+        hit_rate = count / (time.perf_counter() - start)
+        start = time.perf_counter()
+        false_hits = sum(1 for url in misses if url in container)
+        miss_rate = count / (time.perf_counter() - start)
+        print(f'{name:<28} {memory / count:8.1f} B/URL  命中查询 {hit_rate:12,.0f}/s  '
+              f'未命中查询 {miss_rate:12,.0f}/s  命中 {hits}  误判 {false_hits}')
+        return container
+
+    print(f'URL数量: {count}')
+    measure('set[str]', set)
+    measure('FingerprintSet', lambda: FingerprintSet(capacity=int(count / MAX_LOAD_FACTOR) + 1))
+    fingerprints = measure('FingerprintSet + Bloom', lambda: FingerprintSet(
+        capacity=int(count / MAX_LOAD_FACTOR) + 1, bloom_capacity=count))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'crawled.fp')
+        fingerprints.save(path)
+        start = time.perf_counter()
+        loaded = FingerprintSet.load(path)
+        print(f'mmap 加载 {os.path.getsize(path) / 1024 / 1024:.1f} MiB 用时 {time.perf_counter() - start:.4f}s, '
+              f'抽查 {all(url in loaded for url in urls[:1000])}')
+        loaded.close()
@@ -0,0 +1,91 @@
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+from scheduler import HostScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Frontier:
+    """
+    抓取边界：入队时完成深度检查和去重，跟踪在途抓取数。
+
+    只有当队列为空且没有在途抓取时才算结束，此时所有等待中的协程的 get() 都会返回 None；
+    某一时刻队列暂时为空、但其他协程还在处理页面时，协程会继续等待新的链接入队。
+    """
+
+    def __init__(self, scheduler: HostScheduler, max_depth: int, is_known: Callable[[str], bool] = None,
+                 seen=None, key: Optional[Callable[[str], str]] = None,
+                 observe: Optional[Callable[[str, str, bool], None]] = None):
+        """
+        :param scheduler: 按主机调度的队列
+        :param max_depth: 最大抓取深度，种子URL深度为0
+        :param is_known: 判断URL是否已经处理过（如已爬取），入队时跳过
+        :param seen: 记录已入队URL的集合，默认是 set，URL数量很大时可以传入 FingerprintSet
+        :param key: URL的去重键，如 UrlCanonicalizer.canonicalize；seen 中保存去重键，入队的仍是原始URL
+        :param observe: 每次去重判断后以 (原始URL, 去重键, 去重键是否已存在) 调用，如 UrlCanonicalizer.observe
+        """
+        self.scheduler = scheduler
+        self.max_depth = max_depth
+        self.is_known = is_known
+        self.seen = seen if seen is not None else set()
+        self.key = key
+        self.observe = observe
+        self.in_flight = 0
+        self.dropped_depth = 0
+        self.dropped_duplicate = 0
+
+    def put(self, url: str, depth: int) -> bool:
+        """URL入队，超过最大深度或已见过的URL直接丢弃，返回是否入队"""
+        if depth > self.max_depth:
+            self.dropped_depth += 1
+            return False
+        key = self.key(url) if self.key else url
+        duplicate = key in self.seen or (self.is_known and self.is_known(url))
+        if self.observe:
+            self.observe(url, key, duplicate)
+        if duplicate:
+            self.dropped_duplicate += 1
+            return False
+        self.seen.add(key)
+        self.scheduler.put_nowait((depth, url))
+        return True
+
+    def is_seen(self, url: str) -> bool:
+        """URL（或它的另一种写法）是否已经入队过"""
+        return (self.key(url) if self.key else url) in self.seen
+
+    async def get(self) -> Optional[Tuple[int, str]]:
+        """取出下一个可抓取的 (depth, url)，整个抓取结束时返回 None"""
+        self._check_finished()
+        item = await self.scheduler.get()
+        if item is not None:
+            self.in_flight += 1
+        return item
+
+    def task_done(self, url: str) -> None:
+        """标记URL处理完成，子链接必须在调用前入队，否则可能被误判为抓取结束"""
+        self.in_flight -= 1
+        self.scheduler.task_done(url)
+        self._check_finished()
+
+    def mark_durable(self, url: str) -> None:
+        """页面的输出已经写入、在本地标记为已爬取，由写入线程调用；单机模式下不需要额外处理"""
+
+    def _check_finished(self) -> None:
+        if self.in_flight == 0 and self.scheduler.empty():
+            self.scheduler.close()
+
+    @property
+    def queue_depth(self) -> int:
+        return self.scheduler.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        """队列深度、在途抓取数和丢弃计数"""
+        return {
+            'queued': self.queue_depth,
+            'in_flight': self.in_flight,
+            'seen': len(self.seen),
+            'dropped_depth': self.dropped_depth,
+            'dropped_duplicate': self.dropped_duplicate,
+        }
@@ -2,16 +2,20 @@ import asyncio
 import json
 import logging
 import os
-from collections import deque
 from urllib.parse import urlparse, urljoin
 
 import aiohttp
-from bs4 import BeautifulSoup
 
-from utils import is_valid_url
+from canonical import UrlCanonicalizer
+from html_parser import parse_html
+from liveness import LIVENESS_CACHE_FILE, LivenessChecker
+from log_setup import setup_logging
+from metrics import crawl_metrics
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# 只需要提取链接，使用最快的解析后端，未安装时自动退回 html.parser
+LINK_PARSER = 'selectolax'
+DISCOVERY_CONCURRENCY = 32
+FETCH_TIMEOUT = 10
 
 
 async def fetch(session, url):
@@ -28,8 +32,8 @@ async def fetch(session, url):
             # 尝试检测编码并使用正确的编码进行解码
             encoding = response.charset or 'utf-8'
             return await response.text(encoding=encoding, errors='ignore')
-    except aiohttp.ClientError as e:
-        logging.error(f"Error fetching {url}: {e}")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logging.error("Error fetching %s: %r", url, e, extra={'event': 'fetch_error', 'url': url})
         return None
 
 
@@ -45,15 +49,13 @@ async def get_links(session, url):
     if not html_content:
         return []
 
-    soup = BeautifulSoup(html_content, 'html.parser')
     links = []
 
-    for a_tag in soup.find_all('a', href=True):
-        href = a_tag['href']
+    for href, link_text in parse_html(html_content, LINK_PARSER).iter_links():
         full_url = urljoin(url, href)
         parsed_url = urlparse(full_url)
         if parsed_url.netloc:
-            title = a_tag.get_text(strip=True) or parsed_url.netloc
+            title = link_text or parsed_url.netloc
             links.append({
                 'url': full_url,
                 'title': title
@@ -92,57 +94,85 @@ def is_within_domain(base_domain, url, domain_parts_count):
     return base_domain == '.'.join(domain_parts)
 
 
-async def crawl_domain(base_url, max_level=3, domain_parts_count=3, domains_json_path="domains.json", dir_name="data"):
+async def crawl_domain(base_url, max_level=3, domain_parts_count=3, domains_json_path="domains.json", dir_name="data",
+                       concurrency=DISCOVERY_CONCURRENCY, resolver=None):
     """
-    异步递归爬取指定域名下的所有链接，并记录域名、级别和标题。
+    按层并发地广度优先爬取指定域名下的链接，并记录子域名、级别和标题。
+
+    同一层的页面在 concurrency 个并发请求内同时抓取，链接的有效性由 LivenessChecker 按主机检查，
+    检查结果缓存在 dir_name 下，重复运行时有效期内的主机不再请求。结果以URL为键保存在字典中。
 
     :param base_url: 基础URL
     :param max_level: 最大递归级别
     :param domain_parts_count: 基础域名的组成部分数量
+    :param concurrency: 同时抓取的页面数
+    :param resolver: aiohttp 的DNS解析器，为 None 时使用默认解析器（基准测试中用于把合成站点的子域名解析到本机）
     :return: 包含域名、级别和标题的字典列表
     """
-    visited = set()
-    results = []
     base_domain = '.'.join(urlparse(base_url).netloc.split('.')[-domain_parts_count:])
-    queue = deque([(base_url, 1)])
-
-    async with aiohttp.ClientSession() as session:
-        while queue:
-            url, level = queue.popleft()
-            url = url.rstrip('/')
-            if url in visited or level > max_level:
-                continue
-            visited.add(url)
-            logging.info(f"Crawling {url} at level {level}")
-
-            links = await get_links(session, url)
-            for link in links:
-                if not is_within_domain(base_domain, link['url'], domain_parts_count):
-                    continue
-                full_url = str(link['url']).rstrip('/')
-                if not is_valid_url(full_url):
+    # 去重键：规范化后再去掉末尾斜杠，保持 domains.json 中域名URL的原有格式；抓取的仍是页面中的原始URL
+    canonicalizer = UrlCanonicalizer()
+    visited = {canonicalizer.canonicalize(base_url).rstrip('/')}
+    current_level = [base_url]
+    results = {}
+    liveness = LivenessChecker(cache_path=os.path.join(os.path.dirname(__file__), dir_name, LIVENESS_CACHE_FILE),
+                               concurrency=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_links(url, level):
+        async with semaphore:
+            logging.info("Crawling %s at level %d", url, level)
+            crawl_metrics.inc('pages')
+            with crawl_metrics.stage('fetch'):
+                return await get_links(session, url)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ttl_dns_cache=300, resolver=resolver)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT)) as session:
+        for level in range(1, max_level + 1):
+            if not current_level:
+                break
+            pages = await asyncio.gather(*[fetch_links(url, level) for url in current_level])
+            # 去重键 -> (第一次出现的原始URL, 各处的链接标题)
+            candidates = {}
+            for links in pages:
+                for link in links:
+                    if not is_within_domain(base_domain, link['url'], domain_parts_count):
+                        continue
+                    raw_url = str(link['url'])
+                    canonical = canonicalizer.canonicalize(raw_url)
+                    full_url = canonical.rstrip('/')
+                    canonicalizer.observe(raw_url, canonical, full_url in visited or full_url in candidates)
+                    if full_url not in visited:
+                        candidates.setdefault(full_url, (raw_url, []))[1].append(link['title'])
+            valid_hosts = await liveness.check_many(session, candidates, hosts_only=True)
+
+            next_level = []
+            for full_url, (raw_url, titles) in candidates.items():
+                if not valid_hosts[full_url]:
                     continue
-                if full_url in visited:
+                visited.add(full_url)
+                next_level.append(raw_url)
+                parsed_url = urlparse(full_url)
+                if parsed_url.path or parsed_url.params or parsed_url.query or parsed_url.fragment:
                     continue
-                queue.append((full_url, level + 1))
-                if is_within_domain(base_domain, full_url, domain_parts_count):
-                    existing_result = next((result for result in results if result['url'] == full_url), None)
+                for title in titles:
+                    existing_result = results.get(full_url)
                     if existing_result:
-                        if link['title'] and not link['title'].isascii() and existing_result['title'].isascii():
-                            existing_result['title'] = link['title']
+                        if title and not title.isascii() and existing_result['title'].isascii():
+                            existing_result['title'] = title
                     else:
-                        if full_url in visited:
-                            continue
-                        parsed_url = urlparse(full_url)
-                        if parsed_url.path or parsed_url.params or parsed_url.query or parsed_url.fragment:
-                            continue
-                        logging.info(f"Adding {full_url}")
-                        results.append({
+                        logging.info("Adding %s", full_url)
+                        results[full_url] = {
                             'id': len(results) + 1,
                             'url': full_url,
                             'level': level,
-                            'title': link['title']
-                        })
+                            'title': title
+                        }
+            current_level = next_level
+    logging.info(f"URL canonicalization stats: {canonicalizer.stats()}")
+    liveness.save()
+    logging.info(f"Liveness check stats: {liveness.stats()}")
+    results = list(results.values())
     save_results_to_json(results, dir_name, domains_json_path)
     return results
 
@@ -153,6 +183,7 @@ def get_domain_urls(base_url, max_level, domain_parts_count):
 
 
 if __name__ == "__main__":
+    setup_logging(log_file=None)
     base_url = "https://www.nepu.edu.cn"
     results = get_domain_urls(base_url, 3, 3)
     for result in results:
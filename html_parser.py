@@ -0,0 +1,241 @@
+"""
+HTML 解析后端：页面处理只通过 HtmlDocument 的几个方法访问文档，解析器可以按配置切换。
+
+- lxml：BeautifulSoup + lxml，接口与原来完全一致，比 html.parser 快数倍
+- selectolax：基于 lexbor 的 C 解析器，链接提取和区域选择最快
+- html.parser：Python 标准库实现，不需要额外依赖，默认后端，也是其他后端未安装时的兜底
+
+默认使用 html.parser，与原来的输出完全一致；lxml 和 selectolax 是可选依赖，需要在配置中显式选择，未安装时自动退回 html.parser。
+selectolax 按 HTML5 规范解析，会给表格补上 <tbody>，保留为HTML的合并单元格表格因此与其他后端略有差别。
+"""
+import logging
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+PARSER_BACKENDS = ('lxml', 'selectolax', 'html.parser')
+DEFAULT_PARSER = 'html.parser'
+REGION_TEMPLATE = '<html><head><meta charset="utf-8"></head><body>{}</body></html>'
+TAG_NAME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9-]*$')
+_warned = set()
+
+
+@lru_cache(maxsize=None)
+def _lxml_available() -> bool:
+    try:
+        BeautifulSoup('', 'lxml')
+        return True
+    except FeatureNotFound:
+        return False
+
+
+def resolve_backend(name: Optional[str]) -> str:
+    """返回实际可用的后端名，请求的后端未安装时退回 html.parser"""
+    name = name or DEFAULT_PARSER
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f'❌ 不支持的HTML解析后端: {name}，可选 {PARSER_BACKENDS}')
+    available = {
+        'lxml': _lxml_available,
+        'selectolax': lambda: LexborHTMLParser is not None,
+        'html.parser': lambda: True,
+    }[name]()
+    if available:
+        return name
+    if name not in _warned:
+        _warned.add(name)
+        logger.warning(f'⚠️ 解析后端 {name} 未安装，使用 html.parser')
+    return 'html.parser'
+
+
+def soup_features(backend: Optional[str]) -> str:
+    """Markdown 转换仍基于 BeautifulSoup，selectolax 后端在转换时使用 lxml（若已安装）"""
+    backend = resolve_backend(backend)
+    if backend == 'selectolax':
+        return resolve_backend('lxml')
+    return backend
+
+
+class HtmlDocument:
+    """解析后的页面，各后端实现同一组操作"""
+    backend = ''
+
+    def title(self) -> Optional[str]:
+        """<title> 的文本，没有标题时返回 None"""
+        raise NotImplementedError
+
+    def strip_tags(self, names: Iterable[str]) -> None:
+        """删除指定标签及其内容，如 script、style"""
+        raise NotImplementedError
+
+    def html(self) -> str:
+        """整个文档的HTML"""
+        raise NotImplementedError
+
+    def region_html(self, selectors: List[str]) -> str:
+        """
+        提取正文区域，拼成一个新的HTML文档。selectors 可以是标签名或CSS选择器，
+        按文档顺序只取最外层的匹配节点（已选中节点内部的匹配不再重复输出），不修改、不复制当前文档
+        """
+        raise NotImplementedError
+
+    def iter_links(self, target_tags: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+        """依次返回目标区域内 <a href> 的 (href, 链接文本)，target_tags 为空时遍历整个文档"""
+        raise NotImplementedError
+
+
+class SoupDocument(HtmlDocument):
+    """BeautifulSoup 后端，lxml 和 html.parser 共用"""
+
+    def __init__(self, html: str, features: str):
+        self.backend = features
+        self.soup = BeautifulSoup(html, features)
+
+    def title(self) -> Optional[str]:
+        # title.string 在不同后端下对空白和子节点的处理不一致，统一取去掉首尾空白的全部文本
+        title = self.soup.title
+        return title.get_text(strip=True) if title else None
+
+    def strip_tags(self, names: Iterable[str]) -> None:
+        for tag in self.soup(list(names)):
+            tag.decompose()
+
+    def html(self) -> str:
+        return str(self.soup)
+
+    def region_html(self, selectors: List[str]) -> str:
+        if all(TAG_NAME_RE.match(selector) for selector in selectors):
+            matches = self.soup.find_all(selectors)
+        else:
+            matches = self.soup.select(', '.join(selectors))
+        parts = []
+        outermost = None
+        for node in matches:
+            # 匹配结果按文档顺序排列，节点若在某个已选中节点内部，必然在最近选中的那个节点内部
+            if outermost is not None and any(parent is outermost for parent in node.parents):
+                continue
+            outermost = node
+            parts.append(str(node))
+        return REGION_TEMPLATE.format(''.join(parts))
+
+    def iter_links(self, target_tags: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+        areas = [element for tag in target_tags for element in self.soup.find_all(tag)] if target_tags \
+            else [self.soup]
+        for element in areas:
+            for link in element.find_all('a', href=True):
+                yield link['href'], link.get_text(strip=True)
+
+
+class LexborDocument(HtmlDocument):
+    """selectolax（lexbor）后端"""
+    backend = 'selectolax'
+
+    def __init__(self, html: str):
+        self.tree = LexborHTMLParser(html)
+
+    def title(self) -> Optional[str]:
+        title = self.tree.css_first('title')
+        return title.text(strip=True) if title is not None else None
+
+    def strip_tags(self, names: Iterable[str]) -> None:
+        self.tree.strip_tags(list(names))
+
+    def html(self) -> str:
+        return self.tree.html
+
+    def region_html(self, selectors: List[str]) -> str:
+        parts = []
+        outermost = None
+        for node in self.tree.css(', '.join(selectors)):
+            if outermost is not None and self._is_inside(node, outermost):
+                continue
+            outermost = node.mem_id
+            parts.append(node.html)
+        return REGION_TEMPLATE.format(''.join(parts))
+
+    @staticmethod
+    def _is_inside(node, ancestor_id: int) -> bool:
+        parent = node.parent
+        while parent is not None:
+            if parent.mem_id == ancestor_id:
+                return True
+            parent = parent.parent
+        return False
+
+    def iter_links(self, target_tags: Optional[List[str]] = None) -> Iterator[Tuple[str, str]]:
+        areas = [element for tag in target_tags for element in self.tree.css(tag)] if target_tags \
+            else [self.tree.root]
+        for element in areas:
+            if element is None:
+                continue
+            for link in element.css('a[href]'):
+                yield link.attributes.get('href') or '', link.text(strip=True)
+
+
+def parse_html(html: str, backend: Optional[str] = None) -> HtmlDocument:
+    """用指定后端解析HTML"""
+    backend = resolve_backend(backend)
+    if backend == 'selectolax':
+        return LexborDocument(html)
+    return SoupDocument(html, backend)
+
+
+if __name__ == "__main__":
+    # 用保存的页面语料对比各后端的速度，并检查 Markdown 和链接输出是否与 html.parser 一致
+    # 用法: python html_parser.py <语料目录，包含 .html 文件> [正文标签，逗号分隔]
+    import os
+    import sys
+    import time
+
+    from custom_markdown_convert import html2md
+
+    if len(sys.argv) < 2:
+        print('用法: python html_parser.py <语料目录> [正文标签，如 article,div,main,p]')
+        sys.exit(1)
+    corpus_dir = sys.argv[1]
+    content_tags = sys.argv[2].split(',') if len(sys.argv) > 2 else ['article', 'div', 'main', 'p']
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                pages.append((name, f.read().decode('utf-8', errors='replace')))
+    print(f'语料: {len(pages)} 个页面')
+
+    def run(backend):
+        outputs = {}
+        parse_time = convert_time = 0.0
+        for name, html in pages:
+            start = time.perf_counter()
+            document = parse_html(html, backend)
+            document.strip_tags(['script', 'style'])
+            title = document.title()
+            region = document.region_html(content_tags)
+            links = list(document.iter_links(['body']))
+            parse_time += time.perf_counter() - start
+            start = time.perf_counter()
+            markdown = html2md(region, 'https://example.com/', strip=['img', 'a'], parser=backend)
+            convert_time += time.perf_counter() - start
+            outputs[name] = (title, links, markdown)
+        return parse_time, convert_time, outputs
+
+    _, _, reference = run('html.parser')
+    for backend in PARSER_BACKENDS:
+        if resolve_backend(backend) != backend:
+            print(f'{backend:<12} 未安装，跳过')
+            continue
+        parse_time, convert_time, outputs = run(backend)
+        same_links = sum(outputs[name][:2] == reference[name][:2] for name in outputs)
+        same_markdown = sum(outputs[name][2] == reference[name][2] for name in outputs)
+        print(f'{backend:<12} 解析+提取 {parse_time:8.3f}s  Markdown转换 {convert_time:8.3f}s  '
+              f'标题和链接一致 {same_links}/{len(pages)}  Markdown一致 {same_markdown}/{len(pages)}')
+        for name in outputs:
+            if outputs[name] != reference[name]:
+                print(f'    不一致: {name}')
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from hashlib import blake2b
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+HTTP_CACHE_FILE = 'http_cache.db'
+COMMIT_EVERY = 200
+
+
+class CacheEntry(NamedTuple):
+    """一个页面上次抓取时的校验信息和提取结果"""
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body_hash: str
+    links: List[str]
+    file_path: Optional[str]
+
+
+def body_digest(body: bytes) -> str:
+    """页面内容的哈希，用于在服务器不支持条件请求时判断内容是否变化"""
+    return blake2b(body, digest_size=16).hexdigest()
+
+
+class HttpCache:
+    """
+    按规范化URL保存 ETag、Last-Modified、内容哈希和页面的子链接，用于增量重爬。
+
+    重爬时带上 If-None-Match / If-Modified-Since 发送条件请求，304 或内容哈希不变时直接复用缓存的子链接，
+    跳过解析、Markdown转换和写文件。数据跨运行保留，与 UrlManager 的抓取状态相互独立。
+    """
+
+    def __init__(self, path: str, key: Optional[Callable[[str], str]] = None):
+        """
+        :param path: 缓存数据库路径
+        :param key: URL的缓存键，通常是 UrlCanonicalizer.canonicalize，同一页面的不同写法共用一条缓存
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+                          'body_hash TEXT NOT NULL, links TEXT NOT NULL, file_path TEXT, fetched_at REAL)')
+        self.conn.commit()
+
+    def _key(self, url: str) -> str:
+        return self.key(url) if self.key else url
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        url = self._key(url)
+        with self._lock:
+            row = self.conn.execute('SELECT etag, last_modified, body_hash, links, file_path FROM pages WHERE url = ?',
+                                    (url,)).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, body_hash, links, file_path = row
+        return CacheEntry(etag, last_modified, body_hash, json.loads(links), file_path)
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, str]:
+        """根据缓存生成条件请求头"""
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def store(self, url: str, entry: CacheEntry) -> None:
+        url = self._key(url)
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                              (url, entry.etag, entry.last_modified, entry.body_hash,
+                               json.dumps(entry.links, ensure_ascii=False), entry.file_path, time.time()))
+            self._uncommitted += 1
+            if self._uncommitted >= COMMIT_EVERY:
+                self.conn.commit()
+                self._uncommitted = 0
+
+    def record_hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {'unchanged': self.hits, 'changed_or_new': self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+if __name__ == "__main__":
+    # 检查：重爬时通过另一种写法（index.html、末尾斜杠、跟踪参数）访问同一页面，也会带上条件请求头
+    # 用法: python http_cache.py
+    import asyncio
+    import logging
+    import shutil
+    import tempfile
+
+    from aiohttp import web
+
+    from crawler import Config, md_crawl
+
+    conditional_requests = []
+    links = {'href': '/doc/index.html'}
+
+    async def home(request):
+        return web.Response(text=f'<html><head><title>Home</title></head><body>'
+                                 f'<a href="{links["href"]}">Doc</a></body></html>', content_type='text/html')
+
+    async def doc(request):
+        if 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers:
+            conditional_requests.append(str(request.rel_url))
+            if request.headers.get('If-None-Match') == '"doc-v1"':
+                return web.Response(status=304, headers={'ETag': '"doc-v1"'})
+        return web.Response(text='<html><head><title>Doc</title></head><body><article>Doc</article></body></html>',
+                            content_type='text/html', headers={'ETag': '"doc-v1"'})
+
+    def serve(app: web.Application, started: threading.Event, address: list) -> None:
+        """在单独的线程和事件循环中运行测试站点，md_crawl 在主线程中运行自己的事件循环"""
+        async def run():
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            address.append(runner.addresses[0])
+            started.set()
+            await asyncio.Event().wait()
+        asyncio.run(run())
+
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/doc/', doc)
+    app.router.add_get('/doc/index.html', doc)
+    logging.disable(logging.INFO)
+    started, address = threading.Event(), []
+    threading.Thread(target=serve, args=(app, started, address), daemon=True).start()
+    started.wait()
+    base_url = f'http://127.0.0.1:{address[0][1]}/'
+    work_dir = tempfile.mkdtemp(prefix='http-cache-check-')
+    config = Config(base_url=base_url).get_config()
+    config.update({
+        'base_dir': work_dir,
+        'base_md_dir': os.path.join(work_dir, 'markdown'),
+        'output_json': os.path.join(work_dir, 'record_json_file.json'),
+        'file_download_dir': os.path.join(work_dir, 'download'),
+        'recrawl': True, 'continue_crawl': True, 'sleep_time': 0, 'is_debug': False,
+    })
+    try:
+        md_crawl(dict(config))
+        links['href'] = '/doc/?utm_source=check'
+        md_crawl(dict(config))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f'条件请求: {conditional_requests}')
+    assert conditional_requests == ['/doc/?utm_source=check'], '通过别名URL重爬时没有发送条件请求'
+    print('✅ 别名URL命中重爬缓存')
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+from typing import Dict, Iterable, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+import validators
+
+from scheduler import HostScheduler
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_CACHE_FILE = 'liveness_cache.db'
+CHECK_TIMEOUT = 5
+CHECK_CONCURRENCY = 32
+# 结果的缓存时间（秒）：可访问的结果保留较久，失败的结果较短，DNS 解析失败的主机单独记忆
+POSITIVE_TTL = 24 * 3600
+NEGATIVE_TTL = 3600
+DNS_FAILURE_TTL = 6 * 3600
+# aiohttp 3.10 起 DNS 解析失败单独抛出 ClientConnectorDNSError，更早的版本只能看 os_error
+_DNS_ERROR = getattr(aiohttp, 'ClientConnectorDNSError', None)
+
+
+class LivenessResult(NamedTuple):
+    alive: bool
+    reason: str
+    expires_at: float
+
+
+def host_root(url: str) -> str:
+    """URL所在主机的根地址，如 https://jwc.nepu.edu.cn"""
+    parts = urlsplit(url)
+    return f'{parts.scheme.lower()}://{parts.netloc.lower()}'
+
+
+def host_key(url: str) -> str:
+    """主机级结果的缓存键，与主机根地址本身的URL级结果区分开"""
+    return 'host:' + host_root(url)
+
+
+class LivenessChecker:
+    """
+    带缓存的URL可访问性检查，替代逐个发送 requests.head 的 utils.is_valid_url。
+
+    检查使用调用方传入的 aiohttp 会话以复用连接，结果按URL和按主机分别缓存（可访问/不可访问的有效期不同），
+    主机 DNS 解析失败、无法连接、超时或根地址返回 5xx 时，该主机下的所有URL直接判为不可访问，不再发请求；
+    根地址返回 403/404/405 等说明服务器正常工作，主机仍算可访问。
+    同一URL并发的检查共享一次请求，缓存可以保存到 SQLite 文件，下次运行继续使用。
+    传入 scheduler 时检查请求与页面抓取一样遵守主机的请求间隔、robots.txt 的 Crawl-delay，并计入主机并发数。
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, timeout: float = CHECK_TIMEOUT,
+                 concurrency: int = CHECK_CONCURRENCY, positive_ttl: float = POSITIVE_TTL,
+                 negative_ttl: float = NEGATIVE_TTL, dns_failure_ttl: float = DNS_FAILURE_TTL,
+                 scheduler: Optional[HostScheduler] = None, respect_robots: bool = True):
+        """
+        :param cache_path: 缓存文件路径，为 None 时只缓存在内存中
+        :param timeout: 单次请求的超时时间（秒）
+        :param concurrency: check_many 同时检查的URL数
+        :param positive_ttl: 可访问结果的缓存时间
+        :param negative_ttl: 不可访问结果的缓存时间
+        :param dns_failure_ttl: DNS 解析失败的缓存时间
+        :param scheduler: 抓取使用的主机调度器，检查请求经由它控制每个主机的请求间隔
+        :param respect_robots: 有 scheduler 时，检查前是否先读取主机的 robots.txt
+        """
+        self.cache_path = cache_path
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.concurrency = concurrency
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.dns_failure_ttl = dns_failure_ttl
+        self.scheduler = scheduler
+        self.respect_robots = respect_robots
+        self._cache: Dict[str, LivenessResult] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.probes = 0
+        self.dns_failures = 0
+        if cache_path and os.path.exists(cache_path):
+            self._load()
+
+    def _load(self) -> None:
+        now = time.time()
+        conn = sqlite3.connect(self.cache_path)
+        try:
+            rows = conn.execute('SELECT key, alive, reason, expires_at FROM liveness WHERE expires_at > ?',
+                                (now,)).fetchall()
+        except sqlite3.DatabaseError as e:
+            logger.warning(f'⚠️ 无法读取可访问性缓存 {self.cache_path}: {e}')
+            rows = []
+        finally:
+            conn.close()
+        for key, alive, reason, expires_at in rows:
+            self._cache[key] = LivenessResult(bool(alive), reason, expires_at)
+        logger.debug(f'加载可访问性缓存 {len(self._cache)} 条')
+
+    def save(self) -> None:
+        """把未过期的结果写入缓存文件"""
+        if not self.cache_path:
+            return
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        now = time.time()
+        conn = sqlite3.connect(self.cache_path)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS liveness (key TEXT PRIMARY KEY, alive INTEGER NOT NULL, '
+                         'reason TEXT, expires_at REAL NOT NULL)')
+            conn.execute('DELETE FROM liveness WHERE expires_at <= ?', (now,))
+            conn.executemany('INSERT OR REPLACE INTO liveness VALUES (?, ?, ?, ?)',
+                             [(key, int(result.alive), result.reason, result.expires_at)
+                              for key, result in self._cache.items() if result.expires_at > now])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cached(self, key: str) -> Optional[LivenessResult]:
+        """URL或主机（host_key）的缓存结果，没有或已过期时返回 None"""
+        result = self._cache.get(key)
+        if result is None:
+            return None
+        if result.expires_at <= time.time():
+            del self._cache[key]
+            return None
+        return result
+
+    def _remember(self, key: str, alive: bool, reason: str, ttl: Optional[float] = None) -> LivenessResult:
+        if ttl is None:
+            ttl = self.positive_ttl if alive else self.negative_ttl
+        result = LivenessResult(alive, reason, time.time() + ttl)
+        self._cache[key] = result
+        return result
+
+    async def check(self, session: aiohttp.ClientSession, url: str) -> bool:
+        """检查URL是否可访问（非404、非错误状态码）"""
+        if not validators.url(url):
+            logger.debug('❌ URL格式无效: %s', url)
+            return False
+        host = host_key(url)
+        host_result = self.cached(host)
+        if host_result is not None and not host_result.alive:
+            self.hits += 1
+            return False
+        result = self.cached(url)
+        if result is not None:
+            self.hits += 1
+            return result.alive
+        return await self._shared(url, lambda: self._probe(session, url, host))
+
+    async def check_host(self, session: aiohttp.ClientSession, url: str) -> bool:
+        """检查URL所在主机是否可访问，每个主机在有效期内只检查一次"""
+        if not validators.url(url):
+            logger.debug('❌ URL格式无效: %s', url)
+            return False
+        host = host_key(url)
+        result = self.cached(host)
+        if result is not None:
+            self.hits += 1
+            return result.alive
+        return await self._shared(host, lambda: self._probe_host(session, host_root(url), host))
+
+    async def _shared(self, key: str, probe) -> bool:
+        """同一个键并发的检查共享一次请求"""
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.ensure_future(probe())
+            self._inflight[key].add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
+
+    async def check_many(self, session: aiohttp.ClientSession, urls: Iterable[str],
+                         hosts_only: bool = False) -> Dict[str, bool]:
+        """批量检查，最多同时检查 concurrency 个，返回 URL 到结果的字典"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        check = self.check_host if hosts_only else self.check
+
+        async def bounded(url):
+            async with semaphore:
+                return await check(session, url)
+
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, await asyncio.gather(*[bounded(url) for url in urls])))
+
+    async def _request_status(self, session: aiohttp.ClientSession, url: str) -> int:
+        """请求URL并返回状态码，经由 scheduler 遵守主机的请求间隔"""
+        self.probes += 1
+        if self.scheduler is not None:
+            if self.respect_robots:
+                await self.scheduler.ensure_robots(session, url)
+            await self.scheduler.acquire(url)
+        try:
+            async with session.head(url, timeout=self.timeout, allow_redirects=True) as response:
+                status = response.status
+            if 400 <= status and status != 404:
+                # 有些服务器不支持 HEAD，改用 GET 重试
+                async with session.get(url, timeout=self.timeout, allow_redirects=True) as response:
+                    status = response.status
+            return status
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release(url)
+
+    def _remember_unreachable(self, host: str, e: aiohttp.ClientConnectorError) -> None:
+        """DNS 解析失败或无法连接：记住主机不可访问"""
+        if isinstance(e.os_error, socket.gaierror) or (_DNS_ERROR is not None and isinstance(e, _DNS_ERROR)):
+            self.dns_failures += 1
+            logger.debug('❌ DNS解析失败: %s', host)
+            self._remember(host, False, 'dns', self.dns_failure_ttl)
+        else:
+            logger.debug('❌ 无法连接: %s: %r', host, e)
+            self._remember(host, False, 'connect')
+
+    async def _probe_host(self, session: aiohttp.ClientSession, root: str, host: str) -> bool:
+        """请求主机根地址：连接失败、超时或 5xx 时主机不可访问，其余状态码（包括 403/404/405）都算可访问"""
+        try:
+            status = await self._request_status(session, root)
+        except aiohttp.ClientConnectorError as e:
+            self._remember_unreachable(host, e)
+            return False
+        except (aiohttp.ServerDisconnectedError, asyncio.TimeoutError) as e:
+            logger.debug('❌ 主机无响应: %s: %r', host, e)
+            return self._remember(host, False, 'timeout').alive
+        except aiohttp.ClientError as e:
+            # 收到了响应但无法处理（如重定向过多），服务器本身在工作
+            logger.debug('⚠️ 主机检查请求失败: %s: %r', host, e)
+            return self._remember(host, True, 'error').alive
+        if status >= 500:
+            logger.debug('❌ 主机服务器错误: %s (%s)', host, status)
+            return self._remember(host, False, str(status)).alive
+        return self._remember(host, True, str(status)).alive
+
+    async def _probe(self, session: aiohttp.ClientSession, url: str, host: str) -> bool:
+        try:
+            status = await self._request_status(session, url)
+        except aiohttp.ClientConnectorError as e:
+            self._remember_unreachable(host, e)
+            return self._remember(url, False, 'connect').alive
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug('❌ 请求失败: %s, 错误: %r', url, e)
+            return self._remember(url, False, 'error').alive
+        # 服务器有响应，说明主机可访问
+        self._remember(host, True, 'ok')
+        if status >= 400:
+            logger.debug('❌ URL不可访问: %s (%s)', url, status)
+            return self._remember(url, False, str(status)).alive
+        return self._remember(url, True, str(status)).alive
+
+    def stats(self) -> Dict[str, int]:
+        """缓存条数、缓存命中数、实际发出的检查数和 DNS 解析失败的主机数"""
+        return {'cached': len(self._cache), 'hits': self.hits, 'probes': self.probes,
+                'dns_failures': self.dns_failures}
@@ -0,0 +1,237 @@
+"""
+统一的日志配置，取代各模块中的 logging.basicConfig。
+
+- 调用方线程只把日志记录放入队列，格式化和写控制台、文件都在后台的 QueueListener 线程中进行，
+  抓取线程不再争用处理器的锁，也不为被丢弃的日志付出格式化的开销（热路径上的日志使用 %s 占位符）
+- 高频事件（extra={'event': ...}）可以按比例采样或按每秒条数限速，被丢弃的条数附在该事件下一条日志上
+- 除文本日志外可同时输出 JSONL，每行一个 JSON 对象，extra 中的字段原样保留
+- 每个页面的链接列表只在 log_links=True 时输出（日志器 LINKS_LOGGER）
+
+fork 出的子进程（站点进程、分布式 worker、转换进程）继承同样的处理器，在子进程中重新启动后台线程。
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.util import Finalize, register_after_fork
+from typing import Dict, List, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FILE = 'crawler_log.log'
+LOG_JSON_FILE = 'crawler_log.jsonl'
+# 输出每个页面完整链接列表的日志器，默认关闭
+LINKS_LOGGER = 'extract_links.links'
+# 默认的限速：事件名 -> 每秒最多输出的条数
+RATE_LIMITS = {
+    'page_saved': 20,
+    'file_saved': 20,
+    'not_html': 10,
+    'not_found': 10,
+    'no_content': 10,
+    'near_duplicate': 10,
+    'fetch_error': 10,
+    'page_error': 10,
+    'convert_error': 10,
+    'write_error': 10,
+    'download_error': 10,
+}
+
+# LogRecord 的标准属性，其余属性来自 extra，写入 JSONL
+_RECORD_ATTRS = set(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+
+class EventFilter(logging.Filter):
+    """
+    按事件名（extra={'event': ...}）采样和限速，没有事件名的日志不受影响。
+
+    sample_rates 中的事件每 1/比例 条保留一条；rate_limits 中的事件每秒最多保留指定条数。
+    被丢弃的条数记在该事件下一条保留的日志的 suppressed 属性上。
+    """
+
+    def __init__(self, sample_rates: Optional[Dict[str, float]] = None,
+                 rate_limits: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._windows: Dict[str, List[float]] = {}
+        self._suppressed: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if event is None or (event not in self.sample_rates and event not in self.rate_limits):
+            return True
+        with self._lock:
+            keep = True
+            rate = self.sample_rates.get(event)
+            if rate is not None:
+                count = self._counts.get(event, 0)
+                self._counts[event] = count + 1
+                keep = rate > 0 and count % max(1, round(1 / rate)) == 0
+            limit = self.rate_limits.get(event)
+            if keep and limit is not None:
+                now = time.monotonic()
+                window = self._windows.get(event)
+                if window is None or now - window[0] >= 1:
+                    window = self._windows[event] = [now, 0]
+                window[1] += 1
+                keep = window[1] <= limit
+            if not keep:
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False
+            suppressed = self._suppressed.pop(event, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    def reset_lock(self) -> None:
+        self._lock = threading.Lock()
+
+
+class TextFormatter(logging.Formatter):
+    """文本格式，附上被采样或限速丢弃的条数"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, 'suppressed', 0)
+        return f'{text}（此前省略 {suppressed} 条）' if suppressed else text
+
+
+class JsonFormatter(logging.Formatter):
+    """JSONL 格式：时间、级别、日志器、消息，以及 extra 中的全部字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(QueueHandler):
+    """
+    只在进程内传递记录，不像 QueueHandler 默认那样在调用方线程中格式化消息，格式化留给后台线程。
+    参数在格式化前被修改时，日志中是修改后的值
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_queue_handler: Optional[_LazyQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_handlers: List[logging.Handler] = []
+_fork_hook_registered = False
+
+
+class _ForkMarker:
+    pass
+
+
+# register_after_fork 以对象的弱引用登记回调，需要一个一直存在的对象
+_fork_marker = _ForkMarker()
+
+
+def setup_logging(level: int = logging.INFO, log_file: Optional[str] = LOG_FILE, json_file: Optional[str] = None,
+                  console: bool = True, sample_rates: Optional[Dict[str, float]] = None,
+                  rate_limits: Optional[Dict[str, int]] = None, log_links: bool = False,
+                  levels: Optional[Dict[str, int]] = None) -> None:
+    """
+    配置根日志器，重复调用时替换之前的配置（例如站点进程改为写入站点自己的日志文件）
+
+    :param level: 根日志器的级别
+    :param log_file: 文本日志文件，为 None 时不写文件
+    :param json_file: JSONL 日志文件，为 None 时不输出
+    :param console: 是否输出到控制台
+    :param sample_rates: 事件名 -> 保留比例（0~1）
+    :param rate_limits: 事件名 -> 每秒最多输出的条数，默认 RATE_LIMITS
+    :param log_links: 是否输出每个页面的完整链接列表
+    :param levels: 单独指定级别的日志器，如 {'aiohttp': logging.WARNING}
+    """
+    global _queue_handler, _listener, _handlers, _fork_hook_registered
+    shutdown_logging()
+    for handler in _handlers:
+        handler.close()
+    handlers: List[logging.Handler] = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(TextFormatter(LOG_FORMAT))
+    if json_file:
+        os.makedirs(os.path.dirname(json_file) or '.', exist_ok=True)
+        json_handler = logging.FileHandler(json_file, encoding='utf-8')
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+
+    _queue_handler = _LazyQueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(EventFilter(sample_rates, RATE_LIMITS if rate_limits is None else rate_limits))
+    _handlers = handlers
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    logging.getLogger(LINKS_LOGGER).setLevel(logging.INFO if log_links else logging.WARNING)
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    _start_listener()
+    if not _fork_hook_registered:
+        _register_exit_flush(None)
+        os.register_at_fork(after_in_child=_restart_in_child)
+        register_after_fork(_fork_marker, _register_exit_flush)
+        _fork_hook_registered = True
+
+
+def _start_listener() -> None:
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_in_child() -> None:
+    """fork 后子进程中没有父进程的后台线程，换一个新队列重新启动"""
+    global _listener
+    if _listener is None:
+        return
+    _queue_handler.queue = queue.SimpleQueue()
+    for log_filter in _queue_handler.filters:
+        if isinstance(log_filter, EventFilter):
+            log_filter.reset_lock()
+    _start_listener()
+
+
+def _register_exit_flush(_) -> None:
+    """
+    退出时写完剩余日志。multiprocessing 的子进程以 os._exit 退出，不执行 atexit，
+    所以登记为 multiprocessing 的退出清理，主进程中它也在 atexit 时执行
+    """
+    Finalize(None, shutdown_logging, exitpriority=-100)
+
+
+def shutdown_logging() -> None:
+    """写完队列中剩余的日志并停止后台线程，未配置或已停止时什么也不做"""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in _handlers:
+        handler.flush()
@@ -2,32 +2,57 @@ import json
 import logging
 import os
 
-from crawler import md_crawl, set_file_path, Config
+from crawler import set_file_path, Config
+from log_setup import setup_logging
 from get_domains import get_domain_urls
+from orchestrator import SiteOrchestrator, SITE_STATUS_FILE
 
 DEFAULT_MAX_DEPTH = 10
 DEFAULT_NUM_THREADS = 2
+DEFAULT_CONCURRENCY = 64
+CONVERT_WORKERS = os.cpu_count() or 1
+# 同时爬取的站点数；DEFAULT_CONCURRENCY 和 CONVERT_WORKERS 是所有站点合计的预算，按运行中的站点平分
+MAX_PARALLEL_SITES = 8
+TOTAL_CONCURRENCY = DEFAULT_CONCURRENCY * 4
 DEFAULT_TARGET_AREA_CONTENT_TAGS = ['article', 'div', 'main', 'p']
+HOST_CONTENT_RULES = {}
 DEFAULT_TARGET_AREA_LINKS_TAGS = ['body']
+# HTML解析后端，可改为 'lxml' 或 'selectolax' 提速（需安装对应依赖）
+DEFAULT_HTML_PARSER = 'html.parser'
 DEFAULT_DOMAIN_MATCH = True
 DEFAULT_BASE_PATH_MATCH = False
 
 CONTINUE_CRAWL = True
 SLEEP_TIME = 2.0
+HOST_CONCURRENCY = 2
+HOST_LIMITS = {}
+DEDUP_BACKEND = 'set'
+HOST_DENYLIST_PARAMS = {}
+RECRAWL = False
+CHECK_LIVENESS = False
+# 打印页、只改动一项的列表页等近似重复页面不再保存：设为汉明距离阈值（如 3）开启，None 表示不判重
+NEAR_DUP_THRESHOLD = None
+SKIP_DUPLICATE_LINKS = False
+METRICS_SNAPSHOT = True
+METRICS_INTERVAL = 10.0
+# 多个站点并行时只有第一个占用端口的站点提供 /metrics
+METRICS_PORT = None
+IS_DEBUG = False
+# 每个站点目录下另写一份 JSONL 日志；每个页面的完整链接列表默认不输出
+LOG_JSON = False
+LOG_LINKS = False
+# 'packed' 时每个站点的Markdown写入按URL索引的压缩分片，而不是每页一个文件
+OUTPUT_BACKEND = 'files'
+# 后台批量写入每批写完后是否 fsync，开启后断电也不丢已标记为已爬取的页面
+WRITER_FSYNC = False
+DOWNLOAD_CONCURRENCY = 4
+MAX_FILE_SIZE = 200 * 1024 * 1024
+MAX_DOWNLOAD_TIME = 600
+ATTACHMENT_LAYOUT = 'hardlink'
 logger = logging.getLogger(__name__)
 
 log_file_path = 'main_log.log'
 
-# 配置日志记录器
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  # 日志格式
-    handlers=[
-        logging.FileHandler(log_file_path),  # 将日志输出到文件
-        logging.StreamHandler()  # 同时保留控制台输出
-    ]
-)
-
 
 def prepare_params(result):
     try:
@@ -45,19 +70,43 @@ def prepare_params(result):
             'base_url': config.base_url,
             'max_depth': DEFAULT_MAX_DEPTH,
             'num_threads': DEFAULT_NUM_THREADS,
+            'concurrency': DEFAULT_CONCURRENCY,
+            'convert_workers': CONVERT_WORKERS,
             'base_md_dir': config.DEFAULT_BASE_MD_PATH,
             'target_area_content_tags': DEFAULT_TARGET_AREA_CONTENT_TAGS,
+            'host_content_rules': HOST_CONTENT_RULES,
             'target_area_links_tags': DEFAULT_TARGET_AREA_LINKS_TAGS,
+            'html_parser': DEFAULT_HTML_PARSER,
             'is_domain_match': DEFAULT_DOMAIN_MATCH,
             'is_base_path_match': DEFAULT_BASE_PATH_MATCH,
             'file_download_dir': config.DEFAULT_FILE_DOWNLOAD_DIR,
+            'download_concurrency': DOWNLOAD_CONCURRENCY,
+            'max_file_size': MAX_FILE_SIZE,
+            'max_download_time': MAX_DOWNLOAD_TIME,
+            'attachment_layout': ATTACHMENT_LAYOUT,
             'output_json': config.DEFAULT_RECORD_JSON_DIR,
             'md_with_links': False,
             'exclude_image_urls': True,
-            'is_debug': True,
+            'is_debug': IS_DEBUG,
             'continue_crawl': CONTINUE_CRAWL,
             'base_dir': config.BASE_DIR,
-            'sleep_time': config.SLEEP_TIME
+            'sleep_time': config.SLEEP_TIME,
+            'host_concurrency': HOST_CONCURRENCY,
+            'host_limits': HOST_LIMITS,
+            'respect_robots': True,
+            'dedup_backend': DEDUP_BACKEND,
+            'host_denylist_params': HOST_DENYLIST_PARAMS,
+            'recrawl': RECRAWL,
+            'check_liveness': CHECK_LIVENESS,
+            'near_dup_threshold': NEAR_DUP_THRESHOLD,
+            'skip_duplicate_links': SKIP_DUPLICATE_LINKS,
+            'metrics_snapshot': METRICS_SNAPSHOT,
+            'metrics_interval': METRICS_INTERVAL,
+            'metrics_port': METRICS_PORT,
+            'log_json': LOG_JSON,
+            'log_links': LOG_LINKS,
+            'output_backend': OUTPUT_BACKEND,
+            'writer_fsync': WRITER_FSYNC
         }
         return crawl_config
     except Exception as e:
@@ -75,24 +124,17 @@ def main():
         if not results:
             results = get_domain_urls(base_url, max_level=3, domain_parts_count=3)
 
-        for result in results:
-            try:
-                if os.path.exists("data/urls.txt"):
-                    with open("data/urls.txt", "r") as f:
-                        urls = f.readlines()
-                        urls = [url.strip() for url in urls]
-                        if result['url'] in urls:
-                            continue
-                crawl_config = prepare_params(result)
-                if crawl_config:
-                    md_crawl(crawl_config)
-                with open("data/urls.txt", "a") as f:
-                    f.write(result['url'] + '\n')
-            except Exception as e:
-                logging.error(f"Error processing result: {e}")
+        orchestrator = SiteOrchestrator(prepare_params, status_path=os.path.join("data", SITE_STATUS_FILE),
+                                        max_sites=MAX_PARALLEL_SITES, total_concurrency=TOTAL_CONCURRENCY,
+                                        total_convert_workers=CONVERT_WORKERS, recrawl=RECRAWL)
+        # 兼容旧版本记录在 urls.txt 中的已完成站点
+        orchestrator.store.import_done_urls("data/urls.txt")
+        orchestrator.run(results)
     except Exception as e:
         logging.error(f"An error occurred in main: {e}")
 
 
 if __name__ == "__main__":
+    # 各站点进程在 md_crawl 中改为写入站点目录下的 crawler_log.log
+    setup_logging(log_file=log_file_path)
     main()
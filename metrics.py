@@ -0,0 +1,278 @@
+"""
+抓取过程的指标：各阶段耗时的直方图、计数器、按主机的HTTP状态码和队列深度等即时值。
+
+所有模块共用进程内的 crawl_metrics，记录一次只是几次加法和一次短暂加锁，可以常开。
+抓取期间定期写出JSON快照，可选在本机端口上提供 Prometheus 文本格式，结束时输出汇总报告。
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = 'metrics.json'
+METRICS_INTERVAL = 10.0
+METRICS_HOST = '127.0.0.1'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 直方图的桶上限（秒），覆盖从毫秒级的解析到分钟级的大文件下载
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+           float('inf'))
+
+
+class Histogram:
+    """固定桶的耗时直方图，分位数按桶内线性插值估算"""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = min(BUCKETS[i], self.max)
+                return lower + (upper - lower) * max(rank - seen, 0) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'total': round(self.sum, 4),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics: 'CrawlMetrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class CrawlMetrics:
+    """
+    进程内的指标集合，线程安全。
+
+    - 阶段耗时：with crawl_metrics.stage('parse'): ...，或直接 observe(阶段, 秒数)
+    - 计数器：inc('pages')、inc('bytes_fetched', len(body))
+    - HTTP状态码：record_status(主机, 状态码)，请求失败记为 'error'
+    - 即时值：register_gauge('queue_depth', lambda: frontier.queue_depth)，在生成快照时读取
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """开始新的抓取时清空所有指标"""
+        with self._lock:
+            self.started_at = time.time()
+            self._started = time.monotonic()
+            self.histograms: Dict[str, Histogram] = {}
+            self.counters: Dict[str, float] = {}
+            self.statuses: Dict[Tuple[str, str], int] = {}
+            self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def stage(self, name: str) -> _StageTimer:
+        return _StageTimer(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_status(self, host: str, status) -> None:
+        key = (host, str(status))
+        with self._lock:
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def register_gauge(self, name: str, read: Callable[[], float]) -> None:
+        with self._lock:
+            self.gauges[name] = read
+
+    def _read_gauges(self) -> Dict[str, float]:
+        values = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                values[name] = read()
+            except Exception as e:
+                logger.debug(f'读取指标 {name} 失败: {e!r}')
+        return values
+
+    def snapshot(self) -> Dict:
+        """当前所有指标的字典，用于JSON快照和汇总"""
+        gauges = self._read_gauges()
+        with self._lock:
+            elapsed = max(time.monotonic() - self._started, 1e-6)
+            counters = dict(self.counters)
+            statuses = {}
+            for (host, status), count in sorted(self.statuses.items()):
+                statuses.setdefault(host, {})[status] = count
+            stages = {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+        return {
+            'started_at': self.started_at,
+            'elapsed': round(elapsed, 3),
+            'pages_per_second': round(counters.get('pages', 0) / elapsed, 2),
+            'bytes_per_second': round(counters.get('bytes_fetched', 0) / elapsed, 1),
+            'counters': counters,
+            'gauges': gauges,
+            'statuses': statuses,
+            'stages': stages,
+        }
+
+    def write_snapshot(self, path: str) -> None:
+        """原子地写出JSON快照"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def prometheus(self) -> str:
+        """Prometheus 文本格式"""
+        gauges = self._read_gauges()
+        lines = []
+        with self._lock:
+            lines.append('# TYPE crawler_stage_seconds histogram')
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bucket, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bucket == float('inf') else repr(bucket)
+                    lines.append(f'crawler_stage_seconds_bucket{{stage="{_escape(name)}",le="{le}"}} {cumulative}')
+                lines.append(f'crawler_stage_seconds_sum{{stage="{_escape(name)}"}} {histogram.sum}')
+                lines.append(f'crawler_stage_seconds_count{{stage="{_escape(name)}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'# TYPE crawler_{name}_total counter')
+                lines.append(f'crawler_{name}_total {value}')
+            lines.append('# TYPE crawler_http_responses_total counter')
+            for (host, status), count in sorted(self.statuses.items()):
+                lines.append(f'crawler_http_responses_total{{host="{_escape(host)}",status="{status}"}} {count}')
+            lines.append('# TYPE crawler_uptime_seconds gauge')
+            lines.append(f'crawler_uptime_seconds {time.monotonic() - self._started}')
+        for name, value in sorted(gauges.items()):
+            lines.append(f'# TYPE crawler_{name} gauge')
+            lines.append(f'crawler_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """结束时的汇总报告：吞吐、各阶段耗时和状态码分布"""
+        snapshot = self.snapshot()
+        lines = [f'页面 {snapshot["counters"].get("pages", 0)}，耗时 {snapshot["elapsed"]}s，'
+                 f'{snapshot["pages_per_second"]} 页/秒，{snapshot["bytes_per_second"]} 字节/秒',
+                 f'{"阶段":<16}{"次数":>8}{"总耗时s":>10}{"平均ms":>10}{"p50 ms":>10}{"p99 ms":>10}']
+        for name, stage in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total']):
+            lines.append(f'{name:<16}{stage["count"]:>8}{stage["total"]:>10.2f}{stage["mean"] * 1000:>10.2f}'
+                         f'{stage["p50"] * 1000:>10.2f}{stage["p99"] * 1000:>10.2f}')
+        for host, statuses in snapshot['statuses'].items():
+            lines.append(f'{host}: {statuses}')
+        return '\n'.join(lines)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+crawl_metrics = CrawlMetrics()
+
+
+class MetricsReporter:
+    """
+    在抓取的事件循环中定期写JSON快照，并可选在 127.0.0.1:port 上提供 /metrics（Prometheus 文本格式）
+    """
+
+    def __init__(self, metrics: CrawlMetrics, snapshot_path: Optional[str] = None,
+                 interval: float = METRICS_INTERVAL, port: Optional[int] = None):
+        """
+        :param snapshot_path: JSON快照路径，为 None 时不写文件
+        :param interval: 快照间隔（秒）
+        :param port: Prometheus 端口，为 None 时不启动
+        """
+        self.metrics = metrics
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.port = port
+        self._task: Optional[asyncio.Task] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        if self.snapshot_path:
+            self._task = asyncio.create_task(self._write_loop())
+        if self.port is None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, METRICS_HOST, self.port).start()
+            logger.info(f'📈 指标地址: http://{METRICS_HOST}:{self.port}/metrics')
+        except OSError as e:
+            # 多个站点并行时端口可能已被占用，不影响抓取
+            logger.warning(f'⚠️ 无法监听指标端口 {self.port}: {e}')
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.metrics.prometheus().encode('utf-8'),
+                            headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+    async def _write_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self._write()
+
+    def _write(self) -> None:
+        try:
+            self.metrics.write_snapshot(self.snapshot_path)
+        except OSError as e:
+            logger.warning(f'⚠️ 指标快照写入失败: {e}')
+
+    async def stop(self) -> None:
+        """停止定期写入和端口，并写出最后一次快照"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self.snapshot_path:
+            self._write()
@@ -0,0 +1,221 @@
+import html
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from hashlib import blake2b
+from typing import Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_FILE = 'near_dup.db'
+# 64位 SimHash 的汉明距离不超过该值时视为近似重复
+DEFAULT_THRESHOLD = 3
+# 正文词数少于该值的页面不参与判重，过短的页面指纹区分度不够
+MIN_TOKENS = 30
+SHINGLE_SIZE = 3
+FINGERPRINT_BITS = 64
+
+# 每个位计数器的位宽，正文的特征总权重不能超过 2**LANE_BITS
+LANE_BITS = 24
+_LANE_MASK = (1 << LANE_BITS) - 1
+# _SPREAD_TABLES[p][v]：第 p 个字节的值为 v 时，对应的8个位计数器各加1
+_SPREAD_TABLES = [[sum(1 << ((p * 8 + bit) * LANE_BITS) for bit in range(8) if value >> bit & 1)
+                   for value in range(256)] for p in range(8)]
+
+TAG_RE = re.compile(r'<[^>]+>')
+# 英文单词和数字按词切分，中文等非ASCII字符逐字切分
+TOKEN_RE = re.compile(r'[a-z0-9]+|[^\x00-\x7f\s]')
+
+
+def content_tokens(content_html: str) -> List[str]:
+    """正文区域HTML的词序列，去掉标签、实体解码并转为小写"""
+    text = html.unescape(TAG_RE.sub(' ', content_html)).lower()
+    return TOKEN_RE.findall(text)
+
+
+def simhash(tokens: List[str], shingle_size: int = SHINGLE_SIZE) -> int:
+    """
+    64位 SimHash：以连续 shingle_size 个词为特征，按出现次数加权。
+
+    64个位的计数器打包在一个大整数里（每位 LANE_BITS 位宽），每个特征的哈希按字节查表展开后一次累加，
+    避免对每个特征逐位循环
+    """
+    if len(tokens) < shingle_size:
+        shingles = Counter([' '.join(tokens)])
+    else:
+        shingles = Counter(' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1))
+    t0, t1, t2, t3, t4, t5, t6, t7 = _SPREAD_TABLES
+    counters = 0
+    total = 0
+    for shingle, weight in shingles.items():
+        d = blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        spread = t0[d[0]] + t1[d[1]] + t2[d[2]] + t3[d[3]] + t4[d[4]] + t5[d[5]] + t6[d[6]] + t7[d[7]]
+        counters += spread * weight if weight != 1 else spread
+        total += weight
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        # 该位为1的特征权重超过一半时，指纹的该位为1
+        if 2 * (counters >> (bit * LANE_BITS) & _LANE_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class DuplicateMatch(NamedTuple):
+    url: str
+    file_path: str
+    distance: int
+
+
+class NearDupIndex:
+    """
+    近似重复页面索引：按正文区域的 SimHash 判断页面是否与已保存的页面近似重复。
+
+    索引只保存每个重复簇中第一个被保存的页面（代表页面），指纹分成 threshold + 1 段，
+    汉明距离不超过 threshold 的两个指纹至少有一段完全相同，所以只需比较与某一段相同的候选，不用遍历全部页面。
+    解析线程并发调用，内部加锁；可以保存到 SQLite 文件，续爬时继续使用。
+    """
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, path: Optional[str] = None, load: bool = False,
+                 min_tokens: int = MIN_TOKENS):
+        """
+        :param threshold: 视为近似重复的最大汉明距离
+        :param path: 索引文件路径，为 None 时只保存在内存中
+        :param load: 是否加载已有的索引文件（续爬、重爬时）
+        :param min_tokens: 参与判重的最少正文词数
+        """
+        if not 0 <= threshold < FINGERPRINT_BITS // 2:
+            raise ValueError(f'❌ 近似重复阈值必须在 0 到 {FINGERPRINT_BITS // 2 - 1} 之间: {threshold}')
+        self.threshold = threshold
+        self.path = path
+        self.min_tokens = min_tokens
+        bands = threshold + 1
+        width = FINGERPRINT_BITS // bands
+        # (偏移, 掩码)，最后一段包含除不尽的剩余位
+        self._bands = [(i * width, (1 << (width if i < bands - 1 else FINGERPRINT_BITS - i * width)) - 1)
+                       for i in range(bands)]
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in self._bands]
+        self._pages: Dict[int, DuplicateMatch] = {}
+        self._fingerprints: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.duplicates = 0
+        self.skipped_short = 0
+        self.comparisons = 0
+        if load and path and os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute('SELECT url, fingerprint, file_path FROM pages').fetchall()
+        except sqlite3.DatabaseError as e:
+            logger.warning(f'⚠️ 无法读取近似重复索引 {self.path}: {e}')
+            rows = []
+        finally:
+            conn.close()
+        for url, fingerprint, file_path in rows:
+            # SQLite 整数是有符号的，存取时转换
+            self._add(url, fingerprint & (1 << FINGERPRINT_BITS) - 1, file_path)
+        logger.debug(f'加载近似重复索引 {len(rows)} 条')
+
+    def save(self) -> None:
+        """把代表页面的指纹写入索引文件"""
+        if not self.path:
+            return
+        with self._lock:
+            rows = [(url, fingerprint - (1 << FINGERPRINT_BITS) if fingerprint >> (FINGERPRINT_BITS - 1) else
+                     fingerprint, self._pages[fingerprint].file_path)
+                    for url, fingerprint in self._fingerprints.items()]
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, fingerprint INTEGER NOT NULL, '
+                         'file_path TEXT)')
+            conn.execute('DELETE FROM pages')
+            conn.executemany('INSERT INTO pages VALUES (?, ?, ?)', rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _band_keys(self, fingerprint: int):
+        return [(fingerprint >> offset) & mask for offset, mask in self._bands]
+
+    def _add(self, url: str, fingerprint: int, file_path: str) -> None:
+        if fingerprint in self._pages:
+            return
+        self._pages[fingerprint] = DuplicateMatch(url, file_path, 0)
+        self._fingerprints[url] = fingerprint
+        for table, key in zip(self._tables, self._band_keys(fingerprint)):
+            table.setdefault(key, []).append(fingerprint)
+
+    def _find(self, fingerprint: int) -> Optional[DuplicateMatch]:
+        best = None
+        for table, key in zip(self._tables, self._band_keys(fingerprint)):
+            for candidate in table.get(key, ()):
+                self.comparisons += 1
+                distance = hamming_distance(fingerprint, candidate)
+                if distance <= self.threshold and (best is None or distance < best.distance):
+                    best = self._pages[candidate]._replace(distance=distance)
+        return best
+
+    def check(self, url: str, content_html: str, file_path: str) -> Optional[DuplicateMatch]:
+        """
+        判断页面是否与已保存的页面近似重复：重复时返回代表页面，否则把该页面加入索引并返回 None
+        """
+        tokens = content_tokens(content_html)
+        if len(tokens) < self.min_tokens:
+            with self._lock:
+                self.skipped_short += 1
+            return None
+        fingerprint = simhash(tokens)
+        with self._lock:
+            self.checked += 1
+            match = self._find(fingerprint)
+            if match is not None and match.url != url:
+                self.duplicates += 1
+                return match
+            if match is None:
+                self._add(url, fingerprint, file_path)
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        """代表页面数、检查的页面数、近似重复页面数、过短跳过的页面数和指纹比较次数"""
+        with self._lock:
+            return {
+                'pages': len(self._pages),
+                'checked': self.checked,
+                'duplicates': self.duplicates,
+                'skipped_short': self.skipped_short,
+                'comparisons': self.comparisons,
+            }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    words = ['通知', '教学', '科研', '学院', '招生', 'notice', 'campus', 'library', 'exam', 'schedule']
+    rng = random.Random(0)
+    base = [rng.choice(words) for _ in range(400)]
+    near = list(base)
+    near[100:103] = ['变更', '内容', 'changed']
+    other = [rng.choice(words) for _ in range(400)]
+    fingerprints = {name: simhash(content_tokens(' '.join(tokens)))
+                    for name, tokens in (('base', base), ('near', near), ('other', other))}
+    print('base/near 距离', hamming_distance(fingerprints['base'], fingerprints['near']))
+    print('base/other 距离', hamming_distance(fingerprints['base'], fingerprints['other']))
+
+    index = NearDupIndex(threshold=3)
+    pages = [' '.join(rng.choice(words) for _ in range(300)) for _ in range(2000)]
+    start = time.perf_counter()
+    for i, page in enumerate(pages):
+        index.check(f'https://example.com/{i}', f'<p>{page}</p>', f'{i}.md')
+    print(f'{len(pages)} 个页面 {time.perf_counter() - start:.3f}s', index.stats())
+    print('重复检测:', index.check('https://example.com/copy', f'<div>{pages[5]}</div>', 'copy.md'))
@@ -0,0 +1,197 @@
+import logging
+import multiprocessing
+import os
+import sqlite3
+import time
+from multiprocessing.connection import wait
+from typing import Any, Callable, Dict, List, Optional
+
+from crawler import md_crawl
+
+logger = logging.getLogger(__name__)
+
+SITE_STATUS_FILE = 'site_status.db'
+# 同时爬取的站点数，每个站点在独立的进程中运行
+MAX_PARALLEL_SITES = 8
+# 所有站点合计的并发请求数和 Markdown 转换进程数，按正在运行的站点平分
+TOTAL_CONCURRENCY = 256
+TOTAL_CONVERT_WORKERS = os.cpu_count() or 1
+# 站点失败后最多尝试的次数
+MAX_ATTEMPTS = 2
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class SiteStatusStore:
+    """
+    站点爬取状态的持久化记录（SQLite），替代 data/urls.txt。
+
+    每个站点的状态为 pending / running / done / failed；进程被中断时仍为 running 的站点，
+    下次启动时以续爬方式（continue_crawl）重新运行，从该站点已保存的待爬URL继续。
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS sites (url TEXT PRIMARY KEY, title TEXT, status TEXT NOT NULL, '
+                          'attempts INTEGER NOT NULL DEFAULT 0, started_at REAL, finished_at REAL, error TEXT)')
+        self.conn.commit()
+
+    def add(self, url: str, title: str) -> None:
+        """登记站点，已登记的站点保持原状态"""
+        self.conn.execute('INSERT OR IGNORE INTO sites (url, title, status) VALUES (?, ?, ?)', (url, title, PENDING))
+        self.conn.commit()
+
+    def import_done_urls(self, urls_file: str) -> int:
+        """导入旧版 urls.txt 中记录的已完成站点，返回导入的条数"""
+        if not os.path.exists(urls_file):
+            return 0
+        with open(urls_file, 'r') as f:
+            urls = [line.strip() for line in f if line.strip()]
+        self.conn.executemany('INSERT OR IGNORE INTO sites (url, status, finished_at) VALUES (?, ?, ?)',
+                              [(url, DONE, time.time()) for url in urls])
+        self.conn.commit()
+        return len(urls)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute('SELECT status, attempts, error FROM sites WHERE url = ?', (url,)).fetchone()
+        return {'status': row[0], 'attempts': row[1], 'error': row[2]} if row else None
+
+    def mark_running(self, url: str) -> None:
+        self.conn.execute('UPDATE sites SET status = ?, attempts = attempts + 1, started_at = ?, error = NULL '
+                          'WHERE url = ?', (RUNNING, time.time(), url))
+        self.conn.commit()
+
+    def mark_finished(self, url: str, status: str, error: Optional[str] = None) -> None:
+        self.conn.execute('UPDATE sites SET status = ?, finished_at = ?, error = ? WHERE url = ?',
+                          (status, time.time(), error, url))
+        self.conn.commit()
+
+    def counts(self) -> Dict[str, int]:
+        """各状态的站点数"""
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM sites GROUP BY status').fetchall())
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def _crawl_site(config: Dict[str, Any]) -> None:
+    """在子进程中爬取一个站点"""
+    md_crawl(config)
+
+
+class SiteOrchestrator:
+    """
+    多站点并行爬取：最多 max_sites 个站点同时在独立进程中运行，一个慢站点或大站点不再阻塞其他站点。
+
+    全局的并发请求数和转换进程数按同时运行的站点数平分给各站点；站点状态记录在 SiteStatusStore 中，
+    已完成的站点跳过（重爬模式下重新运行），上次中断时正在运行的站点续爬，失败的站点最多尝试 max_attempts 次。
+    """
+
+    def __init__(self, make_config: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]], status_path: str,
+                 max_sites: int = MAX_PARALLEL_SITES, total_concurrency: int = TOTAL_CONCURRENCY,
+                 total_convert_workers: int = TOTAL_CONVERT_WORKERS, max_attempts: int = MAX_ATTEMPTS,
+                 recrawl: bool = False):
+        """
+        :param make_config: 由 domains.json 中的一条结果生成 md_crawl 配置的函数，如 main.prepare_params
+        :param status_path: 状态数据库路径
+        :param max_sites: 同时爬取的站点数
+        :param total_concurrency: 所有站点合计的并发请求数
+        :param total_convert_workers: 所有站点合计的 Markdown 转换进程数
+        :param max_attempts: 每个站点最多尝试的次数
+        :param recrawl: 重爬模式，已完成的站点也重新运行（以续爬方式保留已有状态，由 md_crawl 发送条件请求）
+        """
+        self.make_config = make_config
+        self.store = SiteStatusStore(status_path)
+        self.max_sites = max_sites
+        self.total_concurrency = total_concurrency
+        self.total_convert_workers = total_convert_workers
+        self.max_attempts = max_attempts
+        self.recrawl = recrawl
+        self.context = multiprocessing.get_context('fork') \
+            if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+
+    def _budget(self, active_sites: int) -> Dict[str, int]:
+        """按同时运行的站点数平分全局预算"""
+        active_sites = max(1, min(self.max_sites, active_sites))
+        return {
+            'concurrency': max(1, self.total_concurrency // active_sites),
+            'convert_workers': self.total_convert_workers // active_sites,
+        }
+
+    def run(self, sites: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        爬取 sites（domains.json 的结果列表）中尚未完成的站点，全部结束后返回各状态的站点数
+        """
+        pending = []
+        for site in sites:
+            self.store.add(site['url'], site.get('title'))
+            status = self.store.get(site['url'])
+            if status['status'] == DONE and self.recrawl:
+                pending.append((site, True))
+                continue
+            if status['status'] == DONE or (status['status'] == FAILED and status['attempts'] >= self.max_attempts):
+                continue
+            # 上次中断时正在运行的站点，从已保存的进度继续
+            pending.append((site, status['status'] == RUNNING))
+        logger.info(f'🗺️ 待爬站点 {len(pending)} 个，同时运行 {self.max_sites} 个')
+
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < self.max_sites:
+                    site, resume = pending.pop(0)
+                    process = self._launch(site, resume, len(pending) + len(running) + 1)
+                    if process is not None:
+                        running[process.sentinel] = (process, site)
+                if not running:
+                    continue
+                for sentinel in wait(list(running)):
+                    process, site = running.pop(sentinel)
+                    process.join()
+                    retry = self._finish(site, process.exitcode)
+                    if retry:
+                        pending.append((site, True))
+        except KeyboardInterrupt:
+            # 保留 running 状态，下次启动时续爬
+            logger.warning(f'⚠️ 中断，停止 {len(running)} 个正在运行的站点')
+            for process, _ in running.values():
+                process.terminate()
+            for process, _ in running.values():
+                process.join()
+            raise
+        finally:
+            counts = self.store.counts()
+            self.store.close()
+        logger.info(f'🏁 站点统计: {counts}')
+        return counts
+
+    def _launch(self, site: Dict[str, Any], resume: bool, active_sites: int) -> Optional[multiprocessing.Process]:
+        config = self.make_config(site)
+        if not config:
+            self.store.mark_finished(site['url'], FAILED, 'invalid config')
+            return None
+        config.update(self._budget(active_sites))
+        if resume:
+            config['continue_crawl'] = True
+        self.store.mark_running(site['url'])
+        process = self.context.Process(target=_crawl_site, args=(config,), name=f'site-{site["url"]}')
+        process.start()
+        logger.info(f'🚀 开始爬取站点 {site["url"]}（{"续爬" if resume else "新建"}，并发 {config["concurrency"]}，'
+                    f'转换进程 {config["convert_workers"]}）')
+        return process
+
+    def _finish(self, site: Dict[str, Any], exitcode: int) -> bool:
+        """记录站点的结束状态，需要重试时返回 True"""
+        if exitcode == 0:
+            self.store.mark_finished(site['url'], DONE)
+            logger.info(f'✅ 站点完成 {site["url"]}')
+            return False
+        attempts = self.store.get(site['url'])['attempts']
+        self.store.mark_finished(site['url'], FAILED, f'exit code {exitcode}')
+        logger.error(f'❌ 站点失败 {site["url"]}（退出码 {exitcode}，第 {attempts} 次）')
+        return attempts < self.max_attempts
@@ -0,0 +1,305 @@
+"""
+打包的Markdown输出：页面不再各写一个 .md 文件，而是追加到大小有上限的分片文件中，按URL建立偏移索引。
+
+- 分片为 JSONL，每行一个页面 {"url", "file_name", "markdown", "time"}，每行单独压缩成一个 zstd 帧
+  （未安装 zstandard 时为 gzip 成员）。多个帧直接拼接仍是合法的压缩流，zstd -dc / zcat 可以直接读出整个分片
+- 索引（SQLite）记录 URL -> (分片, 偏移, 长度)，读取单个页面时 mmap 分片文件，只解压这一帧
+- 以URL为键，标题相同的页面不再互相覆盖；同一URL再次写入时追加新记录并更新索引
+- export 按分片顺序导出为原来的每页一个文件的目录结构，iter_pages 按分片顺序依次读出全部页面
+"""
+import gzip
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from metrics import crawl_metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.db'
+# 分片文件的大小上限（字节，压缩后）
+SHARD_SIZE = 256 * 1024 * 1024
+# 每写入多少个页面提交一次索引
+COMMIT_EVERY = 200
+ZSTD_LEVEL = 3
+# gzip 只在未安装 zstandard 时使用，1 级的压缩率与默认的 6 级相差不多，速度快得多
+GZIP_LEVEL = 1
+DEFAULT_COMPRESSION = 'zstd' if zstandard is not None else 'gzip'
+SHARD_SUFFIXES = {'zstd': '.jsonl.zst', 'gzip': '.jsonl.gz', 'none': '.jsonl'}
+
+
+class PackedStore:
+    """按URL索引的分片Markdown存储，写入和读取都是线程安全的"""
+
+    def __init__(self, root: str, shard_size: int = SHARD_SIZE, compression: Optional[str] = None,
+                 commit_every: int = COMMIT_EVERY):
+        """
+        :param root: 存储目录，分片文件和索引都在其中
+        :param shard_size: 分片文件的大小上限（字节）
+        :param compression: 'zstd'、'gzip' 或 'none'，默认 zstd（未安装 zstandard 时为 gzip）；
+                            已有的存储沿用创建时的压缩方式
+        :param commit_every: 每写入多少个页面提交一次索引
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.shard_size = shard_size
+        self.commit_every = commit_every
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, INDEX_FILE), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, shard INTEGER NOT NULL, '
+                          'offset INTEGER NOT NULL, length INTEGER NOT NULL, file_name TEXT)')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'compression'").fetchone()
+        self.compression = row[0] if row else (compression or DEFAULT_COMPRESSION)
+        if self.compression not in SHARD_SUFFIXES:
+            raise ValueError(f'❌ 不支持的压缩方式: {self.compression}')
+        if self.compression == 'zstd' and zstandard is None:
+            raise RuntimeError(f'❌ {root} 使用 zstd 压缩，需要安装 zstandard')
+        self.conn.execute("INSERT OR IGNORE INTO meta VALUES ('compression', ?)", (self.compression,))
+        self.conn.commit()
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL) if self.compression == 'zstd' else None
+        self._decompressor = zstandard.ZstdDecompressor() if self.compression == 'zstd' else None
+        self._maps: Dict[int, Tuple[int, mmap.mmap]] = {}
+        self._uncommitted = 0
+        self.written = 0
+        self.bytes_raw = 0
+        self.bytes_stored = 0
+        # 续爬时接着写最后一个分片
+        shards = self._shard_ids()
+        self._shard = shards[-1] if shards else 0
+        self._file = open(self.shard_path(self._shard), 'ab')
+        self._offset = self._file.tell()
+
+    def shard_path(self, shard: int) -> str:
+        return os.path.join(self.root, f'shard-{shard:05d}{SHARD_SUFFIXES[self.compression]}')
+
+    def _shard_ids(self):
+        suffix = SHARD_SUFFIXES[self.compression]
+        return sorted(int(name[6:-len(suffix)]) for name in os.listdir(self.root)
+                      if name.startswith('shard-') and name.endswith(suffix))
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == 'zstd':
+            return self._compressor.compress(data)
+        if self.compression == 'gzip':
+            return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+        return data
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.compression == 'zstd':
+            return self._decompressor.decompress(data)
+        if self.compression == 'gzip':
+            return gzip.decompress(data)
+        return data
+
+    def put(self, url: str, file_path: str, markdown: str) -> None:
+        """
+        写入一个页面
+
+        :param file_path: 按原来的每页一个文件的方式保存时的路径，只保留文件名，导出时使用
+        """
+        line = json.dumps({'url': url, 'file_name': os.path.basename(file_path), 'markdown': markdown,
+                           'time': round(time.time(), 3)}, ensure_ascii=False).encode('utf-8') + b'\n'
+        # 压缩在锁外进行，多个写入线程可以并行
+        frame = self._compress(line)
+        with self._lock:
+            if self._offset and self._offset + len(frame) > self.shard_size:
+                self._roll()
+            self._file.write(frame)
+            self.conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)',
+                              (url, self._shard, self._offset, len(frame), os.path.basename(file_path)))
+            self._offset += len(frame)
+            self.written += 1
+            self.bytes_raw += len(line)
+            self.bytes_stored += len(frame)
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._commit()
+
+    def _roll(self) -> None:
+        # 写满的分片不会再被 flush(fsync=True) 同步，关闭前先落盘；每个分片只有一次，开销可以忽略
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._shard += 1
+        self._file = open(self.shard_path(self._shard), 'ab')
+        self._offset = 0
+
+    def _commit(self, fsync: bool = False) -> None:
+        # 先把分片数据交给操作系统（fsync 时写入磁盘），再提交指向它的索引
+        self._file.flush()
+        if fsync:
+            os.fsync(self._file.fileno())
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def flush(self, fsync: bool = False) -> None:
+        """提交索引；fsync 为 True 时先把当前分片写入磁盘，断电后索引也不会指向丢失的数据"""
+        with self._lock:
+            self._commit(fsync)
+
+    def _locate(self, url: str) -> Optional[Tuple[int, int, int]]:
+        with self._lock:
+            if self._uncommitted:
+                self._commit()
+            return self.conn.execute('SELECT shard, offset, length FROM pages WHERE url = ?', (url,)).fetchone()
+
+    def _read(self, shard: int, offset: int, length: int) -> bytes:
+        with self._lock:
+            size, mapped = self._maps.get(shard, (0, None))
+            if offset + length > size:
+                # 正在写入的分片变长后重新映射
+                if mapped is not None:
+                    mapped.close()
+                with open(self.shard_path(shard), 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[shard] = (size, mapped)
+            return mapped[offset:offset + length]
+
+    def _record(self, shard: int, offset: int, length: int) -> Dict[str, str]:
+        return json.loads(self._decompress(self._read(shard, offset, length)))
+
+    def get(self, url: str) -> Optional[str]:
+        """读取一个页面的Markdown，不存在时返回 None"""
+        location = self._locate(url)
+        return self._record(*location)['markdown'] if location else None
+
+    def __contains__(self, url: str) -> bool:
+        return self._locate(url) is not None
+
+    def iter_pages(self) -> Iterator[Dict[str, str]]:
+        """按分片和偏移顺序读出每个URL最新的记录，顺序读取文件，适合下游处理全部页面"""
+        self.flush()
+        with self._lock:
+            locations = self.conn.execute('SELECT shard, offset, length FROM pages ORDER BY shard, offset').fetchall()
+        for shard, offset, length in locations:
+            yield self._record(shard, offset, length)
+
+    def export(self, target_dir: str) -> int:
+        """
+        导出为每页一个 .md 文件的目录结构，返回导出的页面数。
+        文件名与原来的保存方式相同，重名时加序号而不是覆盖
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        used = set()
+        count = 0
+        for record in self.iter_pages():
+            file_name = record['file_name']
+            stem, ext = os.path.splitext(file_name)
+            number = 1
+            while file_name in used:
+                number += 1
+                file_name = f'{stem}_{number}{ext}'
+            used.add(file_name)
+            with open(os.path.join(target_dir, file_name), 'w') as f:
+                f.write(record['markdown'])
+            count += 1
+        logger.info(f'📦 导出 {count} 个页面: {target_dir}')
+        return count
+
+    def stats(self) -> Dict[str, float]:
+        """本次写入的页面数、压缩前后的字节数、索引中的页面数和分片数"""
+        with self._lock:
+            pages = self.conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            return {
+                'written': self.written,
+                'bytes_raw': self.bytes_raw,
+                'bytes_stored': self.bytes_stored,
+                'ratio': round(self.bytes_raw / self.bytes_stored, 2) if self.bytes_stored else 0.0,
+                'pages': pages,
+                'shards': self._shard + 1,
+                'compression': self.compression,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._commit()
+            self._file.close()
+            for _, mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+            self.conn.close()
+
+
+def write_page(store: PackedStore, url: str, file_path: str, markdown: str) -> None:
+    """与 writer.write_markdown 对应的打包写入"""
+    logger.info('创建 📦 %s', os.path.basename(file_path), extra={'event': 'page_saved'})
+    with crawl_metrics.stage('write'):
+        store.put(url, file_path, markdown)
+
+
+if __name__ == "__main__":
+    # 用法:
+    #   python packed_store.py export <存储目录> <导出目录>   导出为每页一个文件
+    #   python packed_store.py get <存储目录> <URL>           读取单个页面
+    #   python packed_store.py stats <存储目录>
+    #   python packed_store.py bench [页面数]                 与每页一个文件的写入和读取对比
+    import shutil
+    import sys
+    import tempfile
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    if command == 'export':
+        store = PackedStore(sys.argv[2])
+        print(store.export(sys.argv[3]))
+        store.close()
+    elif command == 'get':
+        store = PackedStore(sys.argv[2])
+        print(store.get(sys.argv[3]))
+        store.close()
+    elif command == 'stats':
+        store = PackedStore(sys.argv[2])
+        print(store.stats())
+        store.close()
+    else:
+        count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+        words = ['通知', '教学', '科研', '学院', 'notice', 'campus', 'library', 'exam', '| 表格 | 单元格 |', '\n\n']
+        pages = [(f'https://example.com/{i}.html', f'/tmp/页面 {i}.md',
+                  ' '.join(words[(i * 7 + j) % len(words)] for j in range(600))) for i in range(count)]
+        work_dir = tempfile.mkdtemp(prefix='packed-bench-')
+        try:
+            files_dir = os.path.join(work_dir, 'files')
+            os.makedirs(files_dir)
+            start = time.perf_counter()
+            for _, file_path, markdown in pages:
+                with open(os.path.join(files_dir, os.path.basename(file_path)), 'w') as f:
+                    f.write(markdown)
+            files_write = time.perf_counter() - start
+            start = time.perf_counter()
+            for name in os.listdir(files_dir):
+                with open(os.path.join(files_dir, name)) as f:
+                    f.read()
+            files_scan = time.perf_counter() - start
+
+            store = PackedStore(os.path.join(work_dir, 'packed'))
+            start = time.perf_counter()
+            for url, file_path, markdown in pages:
+                store.put(url, file_path, markdown)
+            store.flush()
+            packed_write = time.perf_counter() - start
+            start = time.perf_counter()
+            scanned = sum(1 for _ in store.iter_pages())
+            packed_scan = time.perf_counter() - start
+            start = time.perf_counter()
+            for url, _, _ in pages[::97]:
+                store.get(url)
+            packed_get = (time.perf_counter() - start) / len(pages[::97])
+            print(f'每页一个文件: 写入 {files_write:.2f}s  读取全部 {files_scan:.2f}s')
+            print(f'打包存储:     写入 {packed_write:.2f}s  读取全部 {packed_scan:.2f}s（{scanned} 页）  '
+                  f'单页读取 {packed_get * 1e6:.0f}µs')
+            print(store.stats())
+            store.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
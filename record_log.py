@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+from json import JSONDecodeError
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def get_log_path(output_json_file: str) -> str:
+    """记录日志与导出的JSON文件放在一起，扩展名为 .jsonl"""
+    return os.path.splitext(output_json_file)[0] + '.jsonl'
+
+
+class RecordLog:
+    """
+    页面记录的追加日志：每个页面追加一行JSON，不再读取和重写整个文件。
+
+    同一个URL多次记录时以最后一条为准（按URL upsert），export() 把日志压缩合并成原来的JSON数组格式。
+    """
+
+    def __init__(self, output_json_file: str):
+        self.output_json_file = output_json_file
+        self.log_path = get_log_path(output_json_file)
+        self._lock = threading.Lock()
+        self._file = open(self.log_path, 'a', encoding='utf-8')
+
+    def append(self, record: Dict[str, Any], flush: bool = True) -> None:
+        """追加一条记录，多线程安全；批量写入时 flush=False，写完一批后调用 flush()"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            if flush:
+                self._file.flush()
+
+    def flush(self, fsync: bool = False) -> None:
+        with self._lock:
+            self._file.flush()
+            if fsync:
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def export(self) -> int:
+        """
+        把已有的JSON文件和追加日志按URL合并，原子地写回JSON文件，然后清空日志。
+
+        合并规则与旧版 record_page_info 一致：已存在的URL保留原来的位置并更新字段，新URL追加到末尾。
+        :return: 导出的记录数
+        """
+        with self._lock:
+            self._file.flush()
+            records = {}
+            if os.path.exists(self.output_json_file):
+                try:
+                    with open(self.output_json_file, 'r', encoding='utf-8') as json_file:
+                        for entry in json.load(json_file):
+                            records[entry['url']] = entry
+                except JSONDecodeError:
+                    logger.error(f'❌ 记录文件损坏，将只导出追加日志: {self.output_json_file}')
+            with open(self.log_path, 'r', encoding='utf-8') as log_file:
+                for line in log_file:
+                    try:
+                        entry = json.loads(line)
+                    except JSONDecodeError:
+                        # 进程中断时最后一行可能不完整
+                        continue
+                    if entry['url'] in records:
+                        records[entry['url']].update(entry)
+                    else:
+                        records[entry['url']] = entry
+
+            tmp_path = self.output_json_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as json_file:
+                json.dump(list(records.values()), json_file, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.output_json_file)
+            self._file.truncate(0)
+            return len(records)
+
+
+_record_logs: Dict[str, RecordLog] = {}
+_record_logs_lock = threading.Lock()
+
+
+def get_record_log(output_json_file: str) -> RecordLog:
+    """每个输出文件共用一个 RecordLog"""
+    with _record_logs_lock:
+        if output_json_file not in _record_logs:
+            _record_logs[output_json_file] = RecordLog(output_json_file)
+        return _record_logs[output_json_file]
+
+
+def export_records(output_json_file: str) -> int:
+    """压缩追加日志并导出为JSON数组，同时关闭该输出文件的 RecordLog"""
+    with _record_logs_lock:
+        record_log = _record_logs.pop(output_json_file, None)
+    if record_log is None:
+        if not os.path.exists(get_log_path(output_json_file)):
+            return 0
+        record_log = RecordLog(output_json_file)
+    try:
+        count = record_log.export()
+    finally:
+        record_log.close()
+    logger.info(f'🗂️ 导出 {count} 条页面记录: {output_json_file}')
+    return count
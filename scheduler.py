@@ -0,0 +1,205 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# robots.txt 中过大的 Crawl-delay 会让整个主机停摆，这里设置上限
+MAX_ROBOTS_DELAY = 60.0
+ROBOTS_TIMEOUT = 5
+
+
+def get_host(url: str) -> str:
+    """获取URL的主机名（含端口）"""
+    return urlparse(url).netloc.lower()
+
+
+class HostScheduler:
+    """
+    按主机调度的待抓取队列，用法与 asyncio.Queue 一致（put_nowait/get/task_done/join）。
+
+    每个主机有独立的队列、下一次允许请求的时间和并发上限；get() 只会返回已经就绪的主机上的URL，
+    某个主机在冷却时，协程会继续处理其他就绪主机，而不是全局 sleep。调用 close() 后 get() 返回 None。
+    """
+
+    def __init__(self, default_delay: float = 0.05, default_concurrency: int = 2,
+                 host_limits: Optional[Dict[str, Dict[str, Any]]] = None, user_agent: str = '*'):
+        """
+        :param default_delay: 同一主机两次请求之间的默认间隔（秒）
+        :param default_concurrency: 同一主机默认的最大并发请求数
+        :param host_limits: 按主机覆盖的限制，如 {'www.nepu.edu.cn': {'delay': 1.0, 'concurrency': 4}}
+        :param user_agent: 读取 robots.txt 时使用的 User-Agent
+        """
+        self.default_delay = default_delay
+        self.default_concurrency = default_concurrency
+        self.host_limits = {host.lower(): limits for host, limits in (host_limits or {}).items()}
+        self.user_agent = user_agent
+        self._queues: Dict[str, Deque[Tuple[int, str]]] = OrderedDict()
+        self._next_time: Dict[str, float] = {}
+        self._active: Dict[str, int] = {}
+        # 等待主机并发槽位的 acquire(wait_for_slot=True)
+        self._slot_waiters: Dict[str, List[asyncio.Future]] = {}
+        self._robots_delay: Dict[str, float] = {}
+        self._robots: Dict[str, RobotFileParser] = {}
+        self._robots_tasks: Dict[str, asyncio.Task] = {}
+        self._size = 0
+        self._unfinished = 0
+        self._wakeup = asyncio.Event()
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._closed = False
+
+    def get_delay(self, host: str) -> float:
+        """主机请求间隔：显式配置 > robots.txt 的 Crawl-delay > 默认值"""
+        limits = self.host_limits.get(host, {})
+        if 'delay' in limits:
+            return limits['delay']
+        return self._robots_delay.get(host, self.default_delay)
+
+    def get_concurrency(self, host: str) -> int:
+        """主机最大并发数"""
+        return self.host_limits.get(host, {}).get('concurrency', self.default_concurrency)
+
+    def qsize(self) -> int:
+        return self._size
+
+    def empty(self) -> bool:
+        return self._size == 0
+
+    def put_nowait(self, item: Tuple[int, str]) -> None:
+        """加入待抓取项 (depth, url)"""
+        host = get_host(item[1])
+        if host not in self._queues:
+            self._queues[host] = deque()
+            self._active.setdefault(host, 0)
+        self._queues[host].append(item)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._wakeup.set()
+
+    def _pop_ready(self, now: float) -> Tuple[Optional[Tuple[int, str]], Optional[float]]:
+        """取出一个就绪主机上的待抓取项；没有就绪主机时返回最近的就绪等待时间"""
+        wait = None
+        for host, host_queue in self._queues.items():
+            if not host_queue or self._active[host] >= self.get_concurrency(host):
+                continue
+            ready_at = self._next_time.get(host, 0.0)
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            item = host_queue.popleft()
+            self._size -= 1
+            self._active[host] += 1
+            self._next_time[host] = now + self.get_delay(host)
+            # 轮转到末尾，保证各主机公平
+            self._queues.move_to_end(host)
+            return item, None
+        return None, wait
+
+    async def get(self) -> Optional[Tuple[int, str]]:
+        """等待并返回一个可以立即抓取的 (depth, url)，关闭后返回 None"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._closed:
+                return None
+            item, wait = self._pop_ready(loop.time())
+            if item is not None:
+                return item
+            self._wakeup.clear()
+            # 用定时器唤醒而不是 wait_for，避免 wait_for 吞掉取消信号
+            timer = loop.call_later(wait, self._wakeup.set) if wait is not None else None
+            try:
+                await self._wakeup.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+
+    async def acquire(self, url: str, wait_for_slot: bool = False) -> None:
+        """
+        为不经过队列的请求（如可访问性检查、附件下载）占用主机：等到该主机的请求间隔已过，并计入该主机的并发数，
+        用完后调用 release。wait_for_slot 为 True 时还要等到该主机有空闲的并发槽位；
+        调用方自己可能正占用同一主机的槽位时（如页面处理中的可访问性检查）不能等待，否则会造成死锁
+        """
+        host = get_host(url)
+        self._active.setdefault(host, 0)
+        loop = asyncio.get_running_loop()
+        while True:
+            if wait_for_slot and self._active[host] >= self.get_concurrency(host):
+                waiter = loop.create_future()
+                self._slot_waiters.setdefault(host, []).append(waiter)
+                await waiter
+                continue
+            now = loop.time()
+            ready_at = self._next_time.get(host, 0.0)
+            if ready_at <= now:
+                break
+            await asyncio.sleep(ready_at - now)
+        self._active[host] += 1
+        self._next_time[host] = now + self.get_delay(host)
+
+    def release(self, url: str) -> None:
+        """释放主机并发槽位，并从完成时刻起计算该主机的下一次请求时间"""
+        host = get_host(url)
+        now = asyncio.get_running_loop().time()
+        self._active[host] -= 1
+        self._next_time[host] = max(self._next_time.get(host, 0.0), now + self.get_delay(host))
+        for waiter in self._slot_waiters.pop(host, []):
+            if not waiter.done():
+                waiter.set_result(None)
+        self._wakeup.set()
+
+    def task_done(self, url: str) -> None:
+        """标记URL处理完成，释放主机并发槽位，并从完成时刻起计算该主机的下一次请求时间"""
+        self.release(url)
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+        self._wakeup.set()
+
+    def close(self) -> None:
+        """关闭队列，唤醒所有等待中的 get()"""
+        self._closed = True
+        self._wakeup.set()
+
+    async def join(self) -> None:
+        """等待所有已加入的项处理完成"""
+        await self._finished.wait()
+
+    async def ensure_robots(self, session: aiohttp.ClientSession, url: str) -> None:
+        """每个主机只读取一次 robots.txt，保存其中的 Disallow 规则（见 can_fetch），Crawl-delay 作为该主机的请求间隔"""
+        host = get_host(url)
+        if host not in self._robots_tasks:
+            self._robots_tasks[host] = asyncio.ensure_future(self._load_robots(session, url, host))
+        await asyncio.shield(self._robots_tasks[host])
+
+    def can_fetch(self, url: str) -> bool:
+        """robots.txt 是否允许抓取该URL，需先调用 ensure_robots；没有或读取失败的 robots.txt 视为全部允许"""
+        parser = self._robots.get(get_host(url))
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    async def _load_robots(self, session: aiohttp.ClientSession, url: str, host: str) -> None:
+        parsed = urlparse(url)
+        robots_url = f'{parsed.scheme}://{parsed.netloc}/robots.txt'
+        try:
+            async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=ROBOTS_TIMEOUT)) as response:
+                if response.status != 200:
+                    return
+                text = await response.text(errors='ignore')
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug('⚠️ 读取 robots.txt 失败: %s: %s', robots_url, e)
+            return
+        parser = RobotFileParser()
+        parser.parse(text.splitlines())
+        self._robots[host] = parser
+        delay = parser.crawl_delay(self.user_agent)
+        if delay is None:
+            return
+        delay = min(float(delay), MAX_ROBOTS_DELAY)
+        self._robots_delay[host] = delay
+        logger.info(f'🤖 {host} robots.txt Crawl-delay: {delay}s')
@@ -0,0 +1,274 @@
+"""
+本地合成站点：在同一台机器的多个端口上模拟多个主机，页面内容和链接由随机种子确定，
+用于分布式模式的测试和性能基准，不访问外网。
+
+每个主机有 pages_per_host 个页面（/p/<编号>.html），页面之间有主机内和跨主机的链接，
+从第一个主机的首页出发可以到达所有页面。页面大小、表格数、附件、响应延迟和出错的页面比例都可以配置。
+指定 domain 时所有主机共用一个端口，按 Host 头区分 h0.<domain>、h1.<domain> ……，用于子域名发现，
+客户端需要使用 SyntheticResolver 把这些域名解析到本机。站点在独立进程中运行，不与爬虫争用 GIL。
+"""
+import asyncio
+import multiprocessing
+import random
+import socket
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+
+SITE_HOSTS = 4
+PAGES_PER_HOST = 250
+LINKS_PER_PAGE = 8
+# 每个页面中指向其他主机的链接数
+CROSS_HOST_LINKS = 2
+PARAGRAPHS = 6
+TABLES = 1
+TABLE_ROWS = 5
+# 每个页面中的附件链接数，附件从 ATTACHMENT_COUNT 个文件中选取
+ATTACHMENTS_PER_PAGE = 0
+ATTACHMENT_COUNT = 20
+ATTACHMENT_BYTES = 64 * 1024
+# 返回 500 的页面比例，由随机种子确定，同一页面每次请求的结果相同
+ERROR_RATE = 0.0
+# 模拟服务器的响应延迟（秒）
+LATENCY = 0.01
+SEED = 42
+BIND_HOST = '127.0.0.1'
+
+WORDS = ('crawler', 'frontier', 'markdown', 'schedule', 'latency', 'shard', 'worker', 'coordinator', 'host',
+         'robots', 'canonical', 'fingerprint', 'queue', 'download', 'archive', 'notice', 'campus', 'library',
+         '学院', '通知', '教学', '科研', '招生', '就业', '图书馆', '实验室', '公告', '新闻')
+
+
+class SyntheticSite:
+    """合成站点，页面在第一次请求时生成并缓存"""
+
+    def __init__(self, hosts: int = SITE_HOSTS, pages_per_host: int = PAGES_PER_HOST,
+                 links_per_page: int = LINKS_PER_PAGE, cross_host_links: int = CROSS_HOST_LINKS,
+                 paragraphs: int = PARAGRAPHS, tables: int = TABLES, attachments_per_page: int = ATTACHMENTS_PER_PAGE,
+                 attachment_count: int = ATTACHMENT_COUNT, attachment_bytes: int = ATTACHMENT_BYTES,
+                 latency: float = LATENCY, error_rate: float = ERROR_RATE, seed: int = SEED, bind: str = BIND_HOST,
+                 domain: Optional[str] = None):
+        """
+        :param hosts: 模拟的主机数，每个主机占用一个端口（指定 domain 时共用一个端口）
+        :param pages_per_host: 每个主机的页面数
+        :param links_per_page: 每个页面的随机链接数
+        :param cross_host_links: 其中指向其他主机的链接数
+        :param paragraphs: 每个页面的正文段落数，决定页面大小
+        :param tables: 每个页面的表格数
+        :param attachments_per_page: 每个页面的附件链接数
+        :param attachment_count: 每个主机的附件文件数
+        :param attachment_bytes: 每个附件的大小（字节）
+        :param latency: 每个请求的响应延迟（秒）
+        :param error_rate: 返回 500 的页面比例，各主机首页不出错
+        :param seed: 随机种子，相同参数生成相同的站点
+        :param bind: 监听地址
+        :param domain: 子域名模式的根域名，如 'bench.test'
+        """
+        self.hosts = hosts
+        self.pages_per_host = pages_per_host
+        self.links_per_page = links_per_page
+        self.cross_host_links = cross_host_links
+        self.paragraphs = paragraphs
+        self.tables = tables
+        self.attachments_per_page = attachments_per_page
+        self.attachment_count = attachment_count
+        self.attachment_bytes = attachment_bytes
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.bind = bind
+        self.domain = domain
+        self.ports: List[int] = []
+        self._host_of_port: Dict[int, int] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def total_pages(self) -> int:
+        return self.hosts * self.pages_per_host
+
+    @property
+    def base_urls(self) -> List[str]:
+        return [self.host_url(host) for host in range(self.hosts)]
+
+    def host_url(self, host: int) -> str:
+        if self.domain:
+            return f'http://h{host}.{self.domain}:{self.ports[0]}/'
+        return f'http://{self.bind}:{self.ports[host]}/'
+
+    def page_url(self, host: int, page: int) -> str:
+        return f'{self.host_url(host)}p/{page}.html'
+
+    def is_error_page(self, host: int, page: int) -> bool:
+        if not self.error_rate or page == 0:
+            return False
+        return random.Random(self.seed * 7919 + host * 100003 + page).random() < self.error_rate
+
+    @lru_cache(maxsize=None)
+    def page_html(self, host: int, page: int) -> bytes:
+        rng = random.Random(self.seed * 1000003 + host * 100003 + page)
+        links = [(host, (page + 1) % self.pages_per_host)]
+        anchors = []
+        if page == 0:
+            # 各主机首页互相串联，保证所有主机都能到达，另外链接几个随机主机的首页，类似门户的站群导航
+            home_links = [(host + 1) % self.hosts] + [rng.randrange(self.hosts) for _ in range(self.cross_host_links)]
+            anchors.extend(f'<li><a href="{self.host_url(h)}">h{h}</a></li>' for h in home_links)
+        for i in range(self.links_per_page):
+            target_host = rng.randrange(self.hosts) if i < self.cross_host_links else host
+            links.append((target_host, rng.randrange(self.pages_per_host)))
+        anchors.extend(f'<li><a href="{self.page_url(h, p)}">h{h}-p{p}</a></li>' for h, p in links)
+        attachments = ''.join(f'<li><a href="/files/{n}.pdf">附件 {n}</a></li>'
+                              for n in (rng.randrange(self.attachment_count)
+                                        for _ in range(self.attachments_per_page)))
+        paragraphs = ''.join('<p>' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 80))) + '</p>'
+                             for _ in range(self.paragraphs))
+        tables = ''.join('<table><tr><th>主机</th><th>页面</th><th>序号</th><th>内容</th></tr>' +
+                         ''.join(f'<tr><td>{host}</td><td>{page}</td><td>{row}</td><td>{rng.choice(WORDS)}</td></tr>'
+                                 for row in range(TABLE_ROWS)) + '</table>'
+                         for _ in range(self.tables))
+        html = (f'<html><head><meta charset="utf-8"><title>h{host}-p{page}</title></head><body>'
+                f'<nav><ul>{"".join(anchors)}</ul></nav><article><h1>主机 {host} 页面 {page}</h1>{paragraphs}'
+                f'{tables}<ul>{attachments}</ul></article></body></html>')
+        return html.encode('utf-8')
+
+    @lru_cache(maxsize=None)
+    def attachment(self, host: int, number: int) -> bytes:
+        rng = random.Random(self.seed * 15485863 + host * 100003 + number)
+        return b'%PDF-1.4\n' + rng.randbytes(max(self.attachment_bytes - 9, 0))
+
+    def _host_of(self, request: web.Request) -> Optional[int]:
+        if not self.domain:
+            return self._host_of_port.get(request.url.port)
+        name = request.host.rsplit(':', 1)[0]
+        label = name[:-len(self.domain) - 1] if name.endswith('.' + self.domain) else ''
+        if label[:1] == 'h' and label[1:].isdigit() and int(label[1:]) < self.hosts:
+            return int(label[1:])
+        return None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        host = self._host_of(request)
+        name = request.match_info.get('page', '0')
+        if host is None or not name.isdigit() or int(name) >= self.pages_per_host:
+            raise web.HTTPNotFound()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.is_error_page(host, int(name)):
+            raise web.HTTPInternalServerError()
+        return web.Response(body=self.page_html(host, int(name)), content_type='text/html', charset='utf-8')
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        host = self._host_of(request)
+        name = request.match_info['file']
+        if host is None or not name.isdigit() or int(name) >= self.attachment_count:
+            raise web.HTTPNotFound()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.Response(body=self.attachment(host, int(name)), content_type='application/pdf')
+
+    async def start(self) -> List[str]:
+        """在 hosts 个随机端口（子域名模式下为一个端口）上启动，返回各主机的首页URL"""
+        app = web.Application()
+        app.router.add_get('/', self._handle)
+        app.router.add_get('/p/{page}.html', self._handle)
+        app.router.add_get('/files/{file}.pdf', self._handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        for host in range(1 if self.domain else self.hosts):
+            site = web.TCPSite(self._runner, self.bind, 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            self.ports.append(port)
+            self._host_of_port[port] = host
+        return self.base_urls
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+class SyntheticResolver(AbstractResolver):
+    """把子域名模式的 <domain> 及其子域名解析到合成站点的监听地址，其他域名交给默认解析器"""
+
+    def __init__(self, domain: str, address: str = BIND_HOST):
+        self.domain = domain
+        self.address = address
+        self._default = DefaultResolver()
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET):
+        if host == self.domain or host.endswith('.' + self.domain):
+            return [{'hostname': host, 'host': self.address, 'port': port, 'family': socket.AF_INET,
+                     'proto': 0, 'flags': socket.AI_NUMERICHOST}]
+        return await self._default.resolve(host, port, family)
+
+    async def close(self) -> None:
+        await self._default.close()
+
+
+def _serve(options: dict, conn) -> None:
+    async def run():
+        site = SyntheticSite(**options)
+        conn.send(await site.start())
+        # 父进程关闭连接后退出
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await site.stop()
+
+    try:
+        asyncio.run(run())
+    except EOFError:
+        pass
+
+
+class SiteProcess:
+    """
+    在独立进程中运行合成站点，用作上下文管理器：
+
+        with SiteProcess(hosts=4) as base_urls:
+            ...
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.base_urls: List[str] = []
+        self._process = None
+        self._conn = None
+
+    def __enter__(self) -> List[str]:
+        context = multiprocessing.get_context('fork') \
+            if 'fork' in multiprocessing.get_all_start_methods() else multiprocessing.get_context()
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(target=_serve, args=(self.options, child_conn), daemon=True)
+        self._process.start()
+        child_conn.close()
+        self.base_urls = self._conn.recv()
+        return self.base_urls
+
+    def __exit__(self, *exc) -> None:
+        self._conn.close()
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join()
+
+
+if __name__ == "__main__":
+    # 启动合成站点，直到 Ctrl+C
+    # 用法: python synthetic_site.py [主机数] [每个主机的页面数]
+    import sys
+
+    hosts = int(sys.argv[1]) if len(sys.argv) > 1 else SITE_HOSTS
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else PAGES_PER_HOST
+
+    async def main():
+        site = SyntheticSite(hosts=hosts, pages_per_host=pages)
+        for url in await site.start():
+            print(url)
+        print(f'共 {site.total_pages} 个页面，按 Ctrl+C 退出')
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
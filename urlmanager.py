@@ -1,4 +1,20 @@
+import logging
 import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, Optional, Tuple
+
+from canonical import UrlCanonicalizer
+from fingerprint import FingerprintSet
+
+logger = logging.getLogger(__name__)
+
+STATE_DB_FILE = 'url_state.db'
+# 缓冲的写操作达到该数量或距上次提交超过 FLUSH_INTERVAL 秒时，在一个事务中批量提交
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 5.0
+ITER_CHUNK_SIZE = 1000
 
 
 def set_file_path(filename: str, base_dir: str) -> str:
@@ -6,38 +22,263 @@ def set_file_path(filename: str, base_dir: str) -> str:
     return os.path.join(os.path.dirname(__file__), base_dir, filename)
 
 
+class UrlSet:
+    """
+    SQLite 表支持的URL集合，提供 set 的常用接口（in/add/update/discard/len/iter）。
+
+    写操作先进入内存缓冲，由 UrlManager 攒批后在一个事务中提交；成员判断先查缓冲再走主键索引，
+    不需要把整张表加载到内存。with_depth 为 True 时额外记录URL的抓取深度。
+
+    传入 index（FingerprintSet）时成员判断只查内存中的指纹，不再访问数据库；指纹集合不支持删除，
+    所以只用于只增不减的集合（已爬取、已下载）。UrlManager 配置了规范化器时，canonical 为 True 的集合
+    先规范化再读写；抓取边界保存的是要请求的原始URL，不做规范化（去重已在入队前完成）。
+    """
+
+    def __init__(self, manager: 'UrlManager', table: str, with_depth: bool = False,
+                 index: Optional[FingerprintSet] = None, canonical: bool = True):
+        self.manager = manager
+        self.table = table
+        self.with_depth = with_depth
+        self.index = index
+        self.canonical = canonical
+        self._pending_add = {}
+        self._pending_discard = set()
+
+    def _key(self, url: str) -> str:
+        canonicalizer = self.manager.canonicalizer
+        return canonicalizer.canonicalize(url) if canonicalizer and self.canonical else url
+
+    def __contains__(self, url: str) -> bool:
+        url = self._key(url)
+        if self.index is not None:
+            return url in self.index
+        with self.manager.lock:
+            if url in self._pending_add:
+                return True
+            if url in self._pending_discard:
+                return False
+            row = self.manager.conn.execute(f'SELECT 1 FROM {self.table} WHERE url = ?', (url,)).fetchone()
+            return row is not None
+
+    def add(self, url: str, depth: int = 0) -> None:
+        with self.manager.lock:
+            self.stage_add(url, depth)
+        self.manager.maybe_flush()
+
+    def update(self, urls: Iterable[str]) -> None:
+        with self.manager.lock:
+            for url in urls:
+                self.stage_add(url)
+        self.manager.maybe_flush()
+
+    def discard(self, url: str) -> None:
+        with self.manager.lock:
+            self.stage_discard(url)
+        self.manager.maybe_flush()
+
+    def stage_add(self, url: str, depth: int = 0) -> None:
+        """只写入缓冲、不触发提交，调用方持有锁，用于让多个写操作落在同一个事务里"""
+        url = self._key(url)
+        self._pending_discard.discard(url)
+        self._pending_add[url] = depth
+        if self.index is not None:
+            self.index.add(url)
+
+    def stage_discard(self, url: str) -> None:
+        """只写入缓冲、不触发提交，调用方持有锁"""
+        if self.index is not None:
+            raise ValueError(f'带指纹索引的集合不支持删除: {self.table}')
+        url = self._key(url)
+        self._pending_add.pop(url, None)
+        self._pending_discard.add(url)
+
+    def pending_count(self) -> int:
+        return len(self._pending_add) + len(self._pending_discard)
+
+    def write_pending(self, conn: sqlite3.Connection) -> None:
+        """把缓冲写入当前事务，调用方持有锁"""
+        if self._pending_discard:
+            conn.executemany(f'DELETE FROM {self.table} WHERE url = ?', ((url,) for url in self._pending_discard))
+        if self._pending_add:
+            if self.with_depth:
+                conn.executemany(f'INSERT OR REPLACE INTO {self.table} (url, depth) VALUES (?, ?)',
+                                 self._pending_add.items())
+            else:
+                conn.executemany(f'INSERT OR IGNORE INTO {self.table} (url) VALUES (?)',
+                                 ((url,) for url in self._pending_add))
+        self._pending_add = {}
+        self._pending_discard = set()
+
+    def items(self) -> Iterator[Tuple[str, int]]:
+        """分块遍历 (url, depth)，不会一次性读出整张表"""
+        self.manager.flush()
+        columns = 'rowid, url, depth' if self.with_depth else 'rowid, url, 0'
+        last_rowid = 0
+        while True:
+            with self.manager.lock:
+                rows = self.manager.conn.execute(
+                    f'SELECT {columns} FROM {self.table} WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                    (last_rowid, ITER_CHUNK_SIZE)).fetchall()
+            if not rows:
+                return
+            for rowid, url, depth in rows:
+                yield url, depth
+            last_rowid = rows[-1][0]
+
+    def __iter__(self) -> Iterator[str]:
+        for url, _ in self.items():
+            yield url
+
+    def __len__(self) -> int:
+        self.manager.flush()
+        with self.manager.lock:
+            return self.manager.conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def __bool__(self) -> bool:
+        self.manager.flush()
+        with self.manager.lock:
+            return self.manager.conn.execute(f'SELECT 1 FROM {self.table} LIMIT 1').fetchone() is not None
+
+
 class UrlManager:
-    """URL管理类，用于管理已爬取、未爬取、已下载、未下载的URL"""
+    """URL管理类，用于管理已爬取、待爬取（抓取边界）、已下载、未下载的URL，状态保存在 SQLite（WAL模式）中"""
 
-    def __init__(self, base_dir: str, continue_crawl: bool):
+    TABLES = {
+        'crawled': 'CREATE TABLE IF NOT EXISTS crawled (url TEXT PRIMARY KEY)',
+        'frontier': 'CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY, depth INTEGER NOT NULL DEFAULT 0)',
+        'downloaded': 'CREATE TABLE IF NOT EXISTS downloaded (url TEXT PRIMARY KEY)',
+        'undownloaded': 'CREATE TABLE IF NOT EXISTS undownloaded (url TEXT PRIMARY KEY)',
+    }
+
+    def __init__(self, base_dir: str, continue_crawl: bool, use_fingerprints: bool = False,
+                 canonicalizer: Optional[UrlCanonicalizer] = None):
+        """
+        :param use_fingerprints: 为已爬取、已下载集合建立内存中的URL指纹索引，成员判断不再查询数据库，
+                                 索引在关闭时保存为 .fp 文件，续爬时通过 mmap 加载
+        :param canonicalizer: URL规范化器，除抓取边界外的集合都以规范化后的URL为键
+        """
+        self.STATE_DB_FILE = set_file_path(STATE_DB_FILE, base_dir=base_dir)
+        self.CRAWLED_FP_FILE = set_file_path('crawled.fp', base_dir=base_dir)
+        self.DOWNLOADED_FP_FILE = set_file_path('downloaded.fp', base_dir=base_dir)
+        # 旧版本的文本状态文件，续爬时如果数据库还不存在会导入一次
         self.CRAWLED_URLS_FILE = set_file_path('crawled_urls.txt', base_dir=base_dir)
         self.DOWNLOADED_URLS_FILE = set_file_path('downloaded_urls.txt', base_dir=base_dir)
         self.UNCRAWLED_URLS_FILE = set_file_path('uncrawled_urls.txt', base_dir=base_dir)
         self.UNDOWNLOADED_URLS_FILE = set_file_path('undownloaded_urls.txt', base_dir=base_dir)
         self.continue_crawl = continue_crawl
-        self.already_crawled = self._initialize_state(self.CRAWLED_URLS_FILE)
-        self.already_downloaded = self._initialize_state(self.DOWNLOADED_URLS_FILE)
-        self.uncrawled_urls = self._initialize_state(self.UNCRAWLED_URLS_FILE)
-        self.undownloaded_urls = self._initialize_state(self.UNDOWNLOADED_URLS_FILE)
-
-    def _initialize_state(self, file_path: str) -> set:
-        """初始化URL集合"""
-        if self.continue_crawl:
+        self.use_fingerprints = use_fingerprints
+        self.canonicalizer = canonicalizer
+        self.lock = threading.RLock()
+        self._last_flush = time.monotonic()
+
+        os.makedirs(os.path.dirname(self.STATE_DB_FILE), exist_ok=True)
+        is_new_db = not os.path.exists(self.STATE_DB_FILE)
+        self.conn = sqlite3.connect(self.STATE_DB_FILE, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        for ddl in self.TABLES.values():
+            self.conn.execute(ddl)
+
+        self.already_crawled = UrlSet(self, 'crawled')
+        self.uncrawled_urls = UrlSet(self, 'frontier', with_depth=True, canonical=False)
+        self.already_downloaded = UrlSet(self, 'downloaded')
+        self.undownloaded_urls = UrlSet(self, 'undownloaded')
+        self._sets = [self.already_crawled, self.uncrawled_urls, self.already_downloaded, self.undownloaded_urls]
+
+        if not continue_crawl:
+            self._clear_state()
+        elif is_new_db:
+            self._import_legacy_files()
+        if use_fingerprints:
+            self.already_crawled.index = self._load_index(self.already_crawled, self.CRAWLED_FP_FILE)
+            self.already_downloaded.index = self._load_index(self.already_downloaded, self.DOWNLOADED_FP_FILE)
+
+    def _load_index(self, url_set: UrlSet, fp_file: str) -> FingerprintSet:
+        """加载指纹索引，文件不存在或与数据库条数不一致（如上次异常退出）时从数据库重建"""
+        count = len(url_set)
+        if self.continue_crawl and os.path.exists(fp_file):
+            try:
+                index = FingerprintSet.load(fp_file)
+                if len(index) == count:
+                    return index
+                index.close()
+            except ValueError as e:
+                logger.error(f'❌ 指纹文件无效: {fp_file}: {e}')
+        index = FingerprintSet(capacity=int(count * 2) + 1)
+        for url in url_set:
+            index.add(url)
+        return index
+
+    def _clear_state(self) -> None:
+        """不续爬时清空上一次的状态"""
+        with self.lock:
+            self.conn.execute('BEGIN')
+            for table in self.TABLES:
+                self.conn.execute(f'DELETE FROM {table}')
+            self.conn.execute('COMMIT')
+
+    def _import_legacy_files(self) -> None:
+        """导入旧版本保存的 .txt 状态文件"""
+        legacy_files = [
+            (self.already_crawled, self.CRAWLED_URLS_FILE),
+            (self.uncrawled_urls, self.UNCRAWLED_URLS_FILE),
+            (self.already_downloaded, self.DOWNLOADED_URLS_FILE),
+            (self.undownloaded_urls, self.UNDOWNLOADED_URLS_FILE),
+        ]
+        for url_set, file_path in legacy_files:
             if not os.path.exists(file_path):
-                return set()
+                continue
             with open(file_path, 'r') as f:
-                return set(line.strip() for line in f)
-        return set()
+                url_set.update(line.strip() for line in f if line.strip())
+            logger.info(f'📦 导入旧状态文件: {file_path}')
+        self.flush()
+        # 旧版本的 uncrawled_urls.txt 从不清理，已爬取的URL不再属于抓取边界；
+        # 抓取边界保存原始URL、已爬取保存规范形式，逐条用 in 判断（先规范化）而不是在SQL中直接比较
+        stale = [url for url in self.uncrawled_urls if url in self.already_crawled]
+        with self.lock:
+            for url in stale:
+                self.uncrawled_urls.stage_discard(url)
+        self.flush()
+
+    def mark_crawled(self, url: str) -> None:
+        """标记URL已爬取，并从抓取边界中移除，两个写操作总是在同一个事务中提交"""
+        with self.lock:
+            self.already_crawled.stage_add(url)
+            self.uncrawled_urls.stage_discard(url)
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """缓冲的写操作足够多或距上次提交足够久时提交"""
+        pending = sum(url_set.pending_count() for url_set in self._sets)
+        if pending >= BATCH_SIZE or (pending and time.monotonic() - self._last_flush >= FLUSH_INTERVAL):
+            self.flush()
+
+    def flush(self) -> None:
+        """在一个事务中提交所有缓冲的写操作"""
+        with self.lock:
+            if not any(url_set.pending_count() for url_set in self._sets):
+                return
+            self.conn.execute('BEGIN')
+            try:
+                for url_set in self._sets:
+                    url_set.write_pending(self.conn)
+                self.conn.execute('COMMIT')
+            except sqlite3.Error:
+                self.conn.execute('ROLLBACK')
+                raise
+            self._last_flush = time.monotonic()
 
     def save_state(self) -> None:
         """保存URL状态"""
-        self._save_url(self.already_crawled, self.CRAWLED_URLS_FILE)
-        self._save_url(self.already_downloaded, self.DOWNLOADED_URLS_FILE)
-        self._save_url(self.uncrawled_urls, self.UNCRAWLED_URLS_FILE)
-        self._save_url(self.undownloaded_urls, self.UNDOWNLOADED_URLS_FILE)
-
-    def _save_url(self, urls: set, file_path: str) -> None:
-        """将URL集合保存到文件"""
-        with open(file_path, 'w') as f:
-            for url in urls:
-                f.write(f'{url}\n')
+        self.flush()
+
+    def close(self) -> None:
+        """提交剩余写操作、保存指纹索引并关闭数据库"""
+        self.flush()
+        if self.use_fingerprints:
+            for url_set, fp_file in ((self.already_crawled, self.CRAWLED_FP_FILE),
+                                     (self.already_downloaded, self.DOWNLOADED_FP_FILE)):
+                url_set.index.save(fp_file)
+                url_set.index.close()
+        with self.lock:
+            self.conn.close()
@@ -1,59 +1,39 @@
+import asyncio
 import logging
+from typing import Optional
 
-import requests
-import validators
+import aiohttp
 
-logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+from liveness import LivenessChecker
 
+logger = logging.getLogger(__name__)
 
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
+_liveness_checker: Optional[LivenessChecker] = None
 
 
+def get_liveness_checker() -> LivenessChecker:
+    """进程内共享的 LivenessChecker，结果缓存在内存中"""
+    global _liveness_checker
+    if _liveness_checker is None:
+        _liveness_checker = LivenessChecker()
+    return _liveness_checker
 
 
 def is_valid_url(url: str) -> bool:
     """
        判断URL是否有效且能正常使用（非404）
+       同步接口，内部使用带缓存的 LivenessChecker，同一URL或已知不可访问的主机不会重复请求；
+       异步代码请直接使用 LivenessChecker.check / check_many，本函数不能在运行中的事件循环里调用
        :param url: 需要检查的URL
        :return: 如果URL有效且非404则返回True，否则返回False
        """
-    # 使用validators库验证URL格式
-    if not validators.url(url):
-        logger.debug(f'❌ URL格式无效: {url}')
-        return False
-
-    # 尝试发送HEAD请求以检查URL
-    try:
-        response = requests.head(url, timeout=5, allow_redirects=True)
-        if response.status_code == 404:
-            logger.debug(f'❌ URL不可访问: {url} (404 Not Found)')
-            return False
-        elif response.status_code >= 400:
-            logger.debug(f'⚠️ URL请求返回错误状态码: {url} ({response.status_code})')
-            return _retry_with_get(url)
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.debug(f'❌ HEAD请求失败: {url}, 错误: {str(e)}')
-
-
-def _retry_with_get(url: str) -> bool:
-    """
-    使用GET请求重新尝试访问URL
-    :param url: 需要检查的URL
-    :return: 如果URL有效且非404则返回True，否则返回False
-    """
-    try:
-        response = requests.get(url, timeout=5, allow_redirects=True)
-        if response.status_code == 404:
-            logger.debug(f'❌ URL不可访问: {url} (404 Not Found)')
-            return False
-        elif response.status_code >= 400:
-            logger.debug(f'⚠️ URL请求返回错误状态码: {url} ({response.status_code})')
-            return False
-        return True
-    except requests.exceptions.RequestException as e:
-        logger.debug(f'❌ GET请求失败: {url}, 错误: {str(e)}')
-        return False
+    async def check():
+        async with aiohttp.ClientSession(headers=headers) as session:
+            return await get_liveness_checker().check(session, url)
+
+    return asyncio.run(check())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,393 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import crawl_metrics
+from packed_store import PackedStore, write_page
+from record_log import RecordLog, get_record_log
+
+logger = logging.getLogger(__name__)
+
+# 攒够该数量的写操作，或距本批第一个写操作超过 FLUSH_INTERVAL 秒时，写入一批
+BATCH_SIZE = 200
+FLUSH_INTERVAL = 0.5
+# 队列中最多排队的写操作数，超过后提交方阻塞，形成背压
+MAX_PENDING = 2000
+# 队列满或等待写入时，每隔该秒数检查一次写入线程是否还在运行
+LIVENESS_INTERVAL = 1.0
+
+# 写操作的类型
+_MARKDOWN = 'markdown'
+_RECORD = 'record'
+_LINE = 'line'
+_DONE = 'done'
+_BARRIER = 'barrier'
+_STOP = 'stop'
+
+WriteOp = Tuple[Any, ...]
+
+
+def write_markdown(file_path: str, markdown: str, fsync: bool = False) -> None:
+    logger.info('创建 📝 %s', os.path.basename(file_path), extra={'event': 'page_saved'})
+    with crawl_metrics.stage('write'), open(file_path, 'w') as f:
+        f.write(markdown)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class BatchWriter:
+    """
+    后台批量写入：Markdown（文件或打包存储）、页面记录和空页面列表都放入一个有界队列，
+    由一个专用线程按批写入，解析线程和转换回调不再等待磁盘。队列满时提交方阻塞。
+
+    同一页面的写操作按提交顺序进入队列，页面的最后一个写操作带上URL（或单独调用 mark_done）。
+    一批写完并把文件、记录日志和存储都刷到操作系统（fsync=True 时刷到磁盘）后，
+    才把这批中完成的URL交给 on_durable（通常是 UrlManager.mark_crawled），
+    所以断点续爬的状态中标记为已爬取的页面，其输出一定已经写入。
+    开始处理的页面用 begin 登记，在写入完成前 is_pending 为 True，用于本次运行中的去重；
+    重定向的最终URL用 claim 登记在页面名下，随页面一起写入后也交给 on_durable。
+    """
+
+    def __init__(self, on_durable: Optional[Callable[[str], None]] = None, store: Optional[PackedStore] = None,
+                 batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL,
+                 max_pending: int = MAX_PENDING, fsync: bool = False,
+                 key: Optional[Callable[[str], str]] = None):
+        """
+        :param on_durable: 页面的输出写入后对其URL调用，在写入线程中执行
+        :param store: 打包存储，传入时Markdown写入 store 而不是单独的文件
+        :param batch_size: 每批最多的写操作数
+        :param flush_interval: 未攒满的批次最多等待的秒数
+        :param max_pending: 队列中最多排队的写操作数
+        :param fsync: 是否 fsync Markdown 文件、记录日志和追加的文本文件，默认只保证进程崩溃后数据不丢
+        :param key: is_pending 判断时URL的去重键，如 UrlCanonicalizer.canonicalize，默认为URL本身
+        """
+        self.on_durable = on_durable
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue: 'queue.Queue[WriteOp]' = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self.key = key
+        # 页面URL -> 该页面登记的去重键（自身和重定向的最终URL），以及所有登记中的去重键
+        self._pending_urls: Dict[str, List[str]] = {}
+        self._pending_keys = set()
+        # 页面URL -> 写入成功后、交给 on_durable 之前要执行的回调
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.failed_batches = 0
+        self.durable = 0
+        self.blocked_time = 0.0
+        self.write_time = 0.0
+        self._thread = threading.Thread(target=self._run, name='batch-writer', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _check_alive(self) -> None:
+        if not self._thread.is_alive():
+            raise RuntimeError('❌ 写入线程已退出，无法继续写入')
+
+    def _put(self, op: WriteOp) -> None:
+        """放入队列，队列满时阻塞；写入线程已退出时抛出 RuntimeError，而不是一直等待"""
+        self._check_alive()
+        try:
+            self._queue.put_nowait(op)
+            return
+        except queue.Full:
+            pass
+        start = time.monotonic()
+        while True:
+            try:
+                self._queue.put(op, timeout=LIVENESS_INTERVAL)
+                break
+            except queue.Full:
+                self._check_alive()
+        with self._lock:
+            self.blocked_time += time.monotonic() - start
+
+    def _key(self, url: str) -> str:
+        return self.key(url) if self.key else url
+
+    def begin(self, url: str) -> None:
+        """登记开始处理的页面，直到它的输出写入"""
+        key = self._key(url)
+        with self._lock:
+            self._pending_urls[url] = [key]
+            self._pending_keys.add(key)
+
+    def claim(self, url: str, target_url: str) -> None:
+        """把重定向的最终URL登记在页面 url 名下：页面写入前它也算登记中，写入后一起交给 on_durable"""
+        key = self._key(target_url)
+        with self._lock:
+            self._pending_urls.setdefault(url, [self._key(url)]).append(key)
+            self._pending_keys.add(key)
+
+    def attach(self, url: str, callback: Callable[[], None]) -> None:
+        """页面的输出全部写入成功后、交给 on_durable 之前在写入线程中调用 callback，写入失败时不调用"""
+        with self._lock:
+            self._callbacks.setdefault(url, []).append(callback)
+
+    def is_pending(self, url: str) -> bool:
+        """页面（或某个页面重定向的最终URL）已开始处理、输出还没有写入"""
+        key = self._key(url)
+        with self._lock:
+            return key in self._pending_keys
+
+    def write_markdown(self, file_path: str, markdown: str, url: Optional[str] = None) -> None:
+        """写入一个页面的Markdown；传入 url 时写入后该页面即完成"""
+        self._put((_MARKDOWN, file_path, markdown, url))
+
+    def write_record(self, output_json_file: str, record: Dict[str, Any]) -> None:
+        """追加一条页面记录（见 record_log）"""
+        self._put((_RECORD, output_json_file, record))
+
+    def append_line(self, path: str, line: str) -> None:
+        """向文本文件追加一行，同一批中对同一文件的追加只打开一次"""
+        self._put((_LINE, path, line))
+
+    def mark_done(self, url: str, failed: bool = False) -> None:
+        """
+        页面没有（或不再有）需要写入的内容，此前提交的写操作写入后该页面即完成；
+        failed 为 True 表示页面的输出没有生成（如转换失败），不调用 attach 登记的回调
+        """
+        self._put((_DONE, url, failed))
+
+    def flush(self) -> None:
+        """等待此前提交的写操作全部写入"""
+        done = threading.Event()
+        self._put((_BARRIER, done))
+        while not done.wait(LIVENESS_INTERVAL):
+            self._check_alive()
+
+    def _run(self) -> None:
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1][0] not in (_BARRIER, _STOP):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                running = self._write_batch(batch)
+            except Exception as e:
+                # 未预料的错误（如打包存储或数据库出错）只丢弃这一批：不通知其中的页面完成，
+                # 它们留在待爬记录中，续爬时重新抓取；写入线程继续运行
+                running = all(op[0] != _STOP for op in batch)
+                self._discard(batch)
+                with self._lock:
+                    self.failed_batches += 1
+                logger.exception('❌ 批量写入失败，丢弃 %d 个写操作: %r', len(batch), e,
+                                 extra={'event': 'write_error'})
+            finally:
+                for op in batch:
+                    if op[0] == _BARRIER:
+                        op[1].set()
+
+    def _write_batch(self, batch: List[WriteOp]) -> bool:
+        """写入一批并通知已完成的URL，遇到停止标记时返回 False；等待中的 flush() 由调用方唤醒"""
+        start = time.perf_counter()
+        completed: List[str] = []
+        failed_urls: Set[str] = set()
+        record_logs: Dict[str, RecordLog] = {}
+        lines: Dict[str, List[str]] = {}
+        running = True
+        written = failed = 0
+        for op in batch:
+            kind = op[0]
+            if kind == _MARKDOWN:
+                _, file_path, markdown, url = op
+                try:
+                    if self.store is not None:
+                        write_page(self.store, url, file_path, markdown)
+                    else:
+                        write_markdown(file_path, markdown, self.fsync)
+                    written += 1
+                except OSError as e:
+                    failed += 1
+                    failed_urls.add(url)
+                    logger.error('❌ Markdown写入失败: %s: %s', file_path, e, extra={'event': 'write_error'})
+                # 写入失败的页面与以前一样记为已爬取，不在续爬时重试
+                if url is not None:
+                    completed.append(url)
+            elif kind == _RECORD:
+                _, output_json_file, record = op
+                try:
+                    record_log = record_logs.get(output_json_file) or get_record_log(output_json_file)
+                    record_logs[output_json_file] = record_log
+                    record_log.append(record, flush=False)
+                    written += 1
+                except OSError as e:
+                    failed += 1
+                    logger.error('❌ 页面记录写入失败: %s: %s', output_json_file, e, extra={'event': 'write_error'})
+            elif kind == _LINE:
+                lines.setdefault(op[1], []).append(op[2])
+            elif kind == _DONE:
+                completed.append(op[1])
+                if op[2]:
+                    failed_urls.add(op[1])
+            elif kind == _STOP:
+                running = False
+
+        for path, path_lines in lines.items():
+            try:
+                with open(path, 'a') as f:
+                    f.write(''.join(line + '\n' for line in path_lines))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+                written += len(path_lines)
+            except OSError as e:
+                failed += len(path_lines)
+                logger.error('❌ 追加写入失败: %s: %s', path, e, extra={'event': 'write_error'})
+        for record_log in record_logs.values():
+            try:
+                record_log.flush(self.fsync)
+            except OSError as e:
+                logger.error('❌ 页面记录写入失败: %s: %s', record_log.log_path, e, extra={'event': 'write_error'})
+        if self.store is not None and any(op[0] == _MARKDOWN for op in batch):
+            self.store.flush(self.fsync)
+
+        self._notify(completed, failed_urls)
+        seconds = time.perf_counter() - start
+        crawl_metrics.observe('write_batch', seconds)
+        with self._lock:
+            self.batches += 1
+            self.written += written
+            self.failed += failed
+            self.durable += len(completed)
+            self.write_time += seconds
+        return running
+
+    def _notify(self, urls: List[str], failed_urls: Set[str]) -> None:
+        # 先更新爬取状态再取消登记，两者之间的检查不会漏掉该页面
+        for url in urls:
+            with self._lock:
+                claimed = self._pending_urls.get(url, [])[1:]
+                callbacks = self._callbacks.pop(url, [])
+            if url not in failed_urls:
+                for callback in callbacks:
+                    try:
+                        callback()
+                    except Exception as e:
+                        logger.error('❌ 页面写入后的回调失败: %s: %s', url, e)
+            if self.on_durable is None:
+                continue
+            for durable_url in [url] + claimed:
+                try:
+                    self.on_durable(durable_url)
+                except Exception as e:
+                    logger.error('❌ 更新爬取状态失败: %s: %s', durable_url, e)
+        with self._lock:
+            for url in urls:
+                self._pending_keys.difference_update(self._pending_urls.pop(url, ()))
+
+    def _discard(self, batch: List[WriteOp]) -> None:
+        """取消丢弃的批次中页面的登记，不执行回调、不交给 on_durable，本次运行中可以重新抓取这些页面"""
+        urls = [op[3] for op in batch if op[0] == _MARKDOWN and op[3] is not None]
+        urls += [op[1] for op in batch if op[0] == _DONE]
+        with self._lock:
+            for url in urls:
+                self._callbacks.pop(url, None)
+                self._pending_keys.difference_update(self._pending_urls.pop(url, ()))
+
+    def stats(self) -> Dict[str, float]:
+        """写入的批次数和条数、失败数、整批失败的批次数、已完成的页面数、排队数、提交方因背压累计阻塞的秒数和累计写入秒数"""
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'written': self.written,
+                'failed': self.failed,
+                'failed_batches': self.failed_batches,
+                'durable_pages': self.durable,
+                'pending': self._queue.qsize(),
+                'blocked_seconds': round(self.blocked_time, 3),
+                'write_seconds': round(self.write_time, 3),
+            }
+
+    def close(self) -> None:
+        """写入剩余的写操作并停止写入线程"""
+        try:
+            self._put((_STOP,))
+        except RuntimeError:
+            return
+        self._thread.join()
+
+
+def _check_failed_batch() -> None:
+    """检查：整批写入失败时，批次中页面的登记被取消，回调和 on_durable 都不执行"""
+    class FailingStore:
+        def put(self, url: str, file_path: str, markdown: str) -> None:
+            pass
+
+        def flush(self, fsync: bool = False) -> None:
+            raise sqlite3.OperationalError('disk I/O error')
+
+    durable, called = [], []
+    batch_writer = BatchWriter(on_durable=durable.append, store=FailingStore())
+    batch_writer.begin('http://check/page')
+    batch_writer.claim('http://check/page', 'http://check/final')
+    batch_writer.attach('http://check/page', lambda: called.append(True))
+    batch_writer.begin('http://check/skipped')
+    batch_writer.write_markdown('page.md', '# page', 'http://check/page')
+    batch_writer.mark_done('http://check/skipped')
+    batch_writer.close()
+    assert batch_writer.stats()['failed_batches'] == 1
+    for url in ('http://check/page', 'http://check/final', 'http://check/skipped'):
+        assert not batch_writer.is_pending(url), f'{url} 仍在登记中'
+    assert not durable and not called and not batch_writer._callbacks
+    print('✅ 整批写入失败后页面的登记已取消')
+
+
+if __name__ == "__main__":
+    # 与逐条同步写入对比：python writer.py [页面数]；检查整批写入失败的处理：python writer.py check
+    import shutil
+    import sqlite3
+    import sys
+    import tempfile
+
+    from record_log import export_records
+
+    if sys.argv[1:] == ['check']:
+        logging.disable(logging.ERROR)
+        _check_failed_batch()
+        sys.exit()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    markdown = '# 标题\n\n' + '正文内容。' * 400
+    work_dir = tempfile.mkdtemp(prefix='writer-bench-')
+    try:
+        for name in ('sync', 'batch'):
+            out_dir = os.path.join(work_dir, name)
+            os.makedirs(out_dir)
+            output_json = os.path.join(out_dir, 'records.json')
+            start = time.perf_counter()
+            if name == 'sync':
+                for i in range(count):
+                    write_markdown(os.path.join(out_dir, f'{i}.md'), markdown)
+                    get_record_log(output_json).append({'url': f'http://bench/{i}', 'file_path': f'{i}.md'})
+            else:
+                batch_writer = BatchWriter()
+                for i in range(count):
+                    batch_writer.write_record(output_json, {'url': f'http://bench/{i}', 'file_path': f'{i}.md'})
+                    batch_writer.write_markdown(os.path.join(out_dir, f'{i}.md'), markdown, f'http://bench/{i}')
+                submitted = time.perf_counter() - start
+                batch_writer.close()
+                print(f'batch: 提交耗时 {submitted:.3f}s，{batch_writer.stats()}')
+            elapsed = time.perf_counter() - start
+            export_records(output_json)
+            print(f'{name}: {count} 页，{elapsed:.3f}s，{count / elapsed:.0f} 页/秒')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)